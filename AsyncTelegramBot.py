@@ -0,0 +1,169 @@
+from telegram.ext import CallbackContext
+from telegram import Update
+
+from utils.coinbase_utils.AsyncCoinbaseAPI import AsyncCoinbaseAPI
+from utils.coinbase_utils.MetricsRegistry import metrics
+from TelegramBot import TelegramBot
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTelegramBot(TelegramBot):
+    """
+    This class runs the bot on an asyncio event loop instead of the threaded Updater/dispatcher and the schedule thread.
+    Updates are fetched by the event loop and every command is handled as a concurrent task, background jobs (spike
+    alerts, graph pre-rendering, metrics) are periodic tasks.
+
+    Commands and jobs are the handlers of TelegramBot, which are blocking. They are run on a thread pool of
+    command_workers threads, each command holds one thread while it is handled and further commands wait for a free
+    one. Before a /graph is rendered, the prices of its coins are requested concurrently through AsyncCoinbaseAPI
+    without holding a thread, such that the render only finds cached prices.
+    """
+
+    def __init__(self, command_workers: int = 8):
+        """
+        :param command_workers: Number of threads running command handlers and background jobs
+        """
+        super().__init__()
+
+        self.command_workers = command_workers
+        self.poll_timeout = 30  # long polling timeout (in seconds) when fetching updates from Telegram
+
+        self.async_api = None
+        self.command_executor = None
+        self.async_tasks = set()  # running tasks, the event loop only keeps weak references to them
+
+        # Coroutine functions awaited (with the update) before the handler of a command is run
+        self.async_prefetchers = {"graph": self.async_prefetch_graph}
+
+    def start_async_telegram_bot(self) -> None:
+        """
+        Starts the bot on a new event loop and runs until interrupted
+        """
+        try:
+            asyncio.run(self.async_run())
+        except KeyboardInterrupt:
+            pass
+
+    async def async_run(self) -> None:
+        """
+        Polls Telegram for updates and handles every command in its own task
+        """
+        self.async_api = AsyncCoinbaseAPI(self.coinbase_api)
+        self.command_executor = ThreadPoolExecutor(max_workers=self.command_workers, thread_name_prefix="command")
+        self.updater.job_queue.start()  # runs the one-off jobs scheduled by handlers (e.g. /start)
+
+        try:
+            if self.stream_prices:
+                await self.async_call(self.bot_helper_start_price_stream)
+
+            # A single alert task serves all subscribers. Streamed prices are local, so they can be checked more often.
+            notification_seconds = self.notification_periodicity*60
+            if self.price_stream is not None:
+                notification_seconds = self.stream_notification_periodicity
+            self.async_spawn(self.async_run_periodically(notification_seconds, self.bot_send_spike_alerts))
+            self.async_spawn(self.async_run_periodically(self.graph_warm_periodicity*60, self.bot_warm_graphs))
+            self.async_spawn(self.async_run_periodically(self.metrics_dump_periodicity*60, self.bot_dump_metrics))
+
+            if self.metrics_port is not None:
+                metrics.serve(self.metrics_port)
+
+            offset = None
+            loop = asyncio.get_running_loop()
+            while True:
+                try:
+                    # Long polling runs on the default executor, such that it never waits for a command thread
+                    updates = await loop.run_in_executor(None, functools.partial(
+                        self.updater.bot.get_updates, offset=offset, timeout=self.poll_timeout))
+                except Exception as exception:
+                    logger.warning("Failed to fetch updates: %s", exception)
+                    await asyncio.sleep(5)
+                    continue
+
+                for update in updates:
+                    offset = update.update_id + 1
+                    self.async_spawn(self.async_handle_update(update))
+        finally:
+            self.updater.job_queue.stop()
+            self.async_api.shutdown()
+            self.command_executor.shutdown(wait=False)
+
+    def async_spawn(self, coroutine) -> asyncio.Task:
+        """
+        Runs a coroutine in a new task which is kept alive until it is done
+
+        :param coroutine: The coroutine
+        :return: The task
+        """
+        task = asyncio.create_task(coroutine)
+        self.async_tasks.add(task)
+        task.add_done_callback(self.async_tasks.discard)
+        return task
+
+    async def async_call(self, function, *args, **kwargs):
+        """
+        Runs a blocking function (a handler or job of TelegramBot) on the command thread pool
+
+        :param function: The blocking function
+        :return: The result of the function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.command_executor, functools.partial(function, *args, **kwargs))
+
+    async def async_handle_update(self, update: Update) -> None:
+        """
+        Runs the handler which TelegramBot registered with the dispatcher for the command of an update
+
+        :param update: The update received from Telegram
+        """
+        for handler in [handler for group in sorted(self.dispatcher.handlers)
+                        for handler in self.dispatcher.handlers[group]]:
+            check = handler.check_update(update)
+            if check is None or check is False:
+                continue
+
+            command = handler.command[0] if hasattr(handler, "command") else type(handler).__name__
+            try:
+                prefetcher = self.async_prefetchers.get(command)
+                if prefetcher is not None:
+                    await prefetcher(update)
+
+                # The handlers registered by bot_helper_add_command time themselves and count their errors
+                context = CallbackContext.from_update(update, self.dispatcher)
+                await self.async_call(handler.handle_update, update, self.dispatcher, check, context)
+            except Exception as exception:
+                logger.warning("Failed to handle %s: %s", update.message.text if update.message else update, exception)
+            return
+
+    async def async_prefetch_graph(self, update: Update) -> None:
+        """
+        Requests the prices of the coins of /graph concurrently, such that the render only finds cached prices. Coins
+        whose prices fail to load are left to the render, which skips them.
+        """
+        if self.authenticate(update):
+            await asyncio.gather(*[self.async_api.get_historical_array(coin, "week")
+                                   for coin in self.price_graph.currencies], return_exceptions=True)
+
+    async def async_run_periodically(self, seconds: float, function) -> None:
+        """
+        Runs a blocking job on the command thread pool every few seconds, replaces the jobs of the schedule thread
+
+        :param seconds: Time between two runs
+        :param function: The job, a function without arguments
+        """
+        while True:
+            await asyncio.sleep(seconds)
+            try:
+                await self.async_call(function)
+            except Exception as exception:
+                logger.warning("Periodic task %s failed: %s", function.__name__, exception)
+
+
+if __name__ == '__main__':
+    bot = AsyncTelegramBot()
+    bot.start_async_telegram_bot()
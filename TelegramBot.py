@@ -1,9 +1,18 @@
 from __future__ import print_function
 
 from utils.telegram_utils import UtilityMethods, ScheduleThread
+from utils.telegram_utils.SubscriptionRegistry import SubscriptionRegistry, Subscription
+from utils.telegram_utils.SendQueue import SendQueue
 from telegram.ext import Updater, CommandHandler, CallbackContext
+from telegram.error import BadRequest
 
 from utils.coinbase_utils.PriceGraph import PriceGraph
+from utils.coinbase_utils.GraphCache import RenderedGraph
+from utils.coinbase_utils.PriceStream import PriceStream, CoinbaseTickerFeed
+from utils.coinbase_utils.PriceHistoryStore import PriceHistoryStore
+from utils.coinbase_utils.RequestScheduler import PRIORITY_ALERTS, PRIORITY_BACKGROUND
+from utils.coinbase_utils.MetricsRegistry import metrics
+from utils.coinbase_utils.Watchlist import Watchlist
 import utils.coinbase_utils.CoinbaseAPI as cbapi
 import utils.coinbase_utils.GlobalStatics as statics
 
@@ -41,11 +50,36 @@ class TelegramBot:
         api_file = str(current_path + "/credentials/API_key.json")
 
         self.coinbase_api = cbapi.CoinbaseAPI(api_file)
-        self.spike = spike.Spike(currencies=statics.CURRENCIES, coinbase_api=self.coinbase_api,
-                                 notification_threshold=5, day_threshold=10, week_threshold=10)
-        self.price_graph = PriceGraph(self.coinbase_api)
+        # Keep long price histories on disk, such that restarts only fetch the prices missed in the meantime
+        self.coinbase_api.attach_history_store(PriceHistoryStore(current_path + "/history"))
+
+        # Coins which are tracked, listed in credentials/watchlist.json (or all coins listed on coinbase if the file
+        # lists none), the coins of GlobalStatics otherwise. Alert cycles fetch a bounded number of series each.
+        watchlist_file = current_path + "/credentials/watchlist.json"
+        self.watchlist = Watchlist()
+        if os.path.exists(watchlist_file):
+            self.watchlist = Watchlist.load(watchlist_file, self.coinbase_api)
+
+        # Stream live prices from the coinbase exchange ticker feed instead of polling, alerts are then checked every
+        # few seconds. The exchange doesn't list every quote currency, prices are streamed in GlobalStatics.
+        # STREAM_QUOTE_CURRENCY and converted into the currency of the alerts and graphs.
+        self.stream_prices = True
+        self.stream_quote_currency = statics.STREAM_QUOTE_CURRENCY
+        self.stream_notification_periodicity = 30  # in seconds
+        self.price_stream = None
+
+        self.spike = spike.Spike(currencies=self.watchlist.coins, coinbase_api=self.coinbase_api,
+                                 notification_threshold=5, day_threshold=10, week_threshold=10,
+                                 max_fetches=statics.SERIES_FETCHES_PER_CYCLE)
+        self.price_graph = PriceGraph(self.coinbase_api, currencies=self.watchlist.graph_coins,
+                                      colors=self.watchlist.colors, render_pool_size=2)  # render in 2 processes
         self.notification_periodicity = 5  # in minutes
 
+        # Graphs which are rendered in the background, such that commands are answered with a pre-rendered image
+        self.graph_warm_periodicity = 5  # in minutes
+        self.graph_warm_periods = ["week"]  # periods of the normalised price graph (/graph)
+        self.portfolio_warm_targets = []  # (coin, period) tuples of portfolio graphs (/portfolio)
+
         # Get whitelist
         whitelist_file = str(current_path + "/credentials/whitelist.json")
         file = open(whitelist_file)
@@ -64,23 +98,54 @@ class TelegramBot:
         # Create a dispatcher where we can register our handlers for commands & other behaviours
         self.dispatcher = self.updater.dispatcher
 
-        self.context = None
-        self.id = None
+        # Chats which receive spike alerts along with their thresholds and previous notifications (kept across
+        # restarts). Alerts are computed once per cycle and sent to every subscriber through the send queue, which keeps
+        # within Telegram's rate limits
+        subscriptions_file = current_path + "/state/subscriptions.npz"
+        self.subscriptions = SubscriptionRegistry(self.watchlist.coins, file_name=subscriptions_file)
+        self.send_queue = SendQueue(self.updater.bot)
+
+        # Metrics of the bot (request, render and handler latencies, cache hits, errors) are logged periodically, and
+        # served in the Prometheus text format at http://127.0.0.1:metrics_port/metrics if a port is set
+        self.metrics_port = None
+        self.metrics_dump_periodicity = 15  # in minutes
+        metrics.register_collector("send_queue", lambda: {"telegram_messages_" + stat: value
+                                                          for stat, value in self.send_queue.stats.items()})
 
         # Add handlers which dictate how to respond to different commands
-        self.dispatcher.add_handler(CommandHandler("start", self.bot_command_start))
-        self.dispatcher.add_handler(CommandHandler("latest", self.bot_command_latest))
-        self.dispatcher.add_handler(CommandHandler("graph", self.bot_command_send_graph))
-        self.dispatcher.add_handler(CommandHandler("gimmemoney", self.bot_command_gimme_money))
-        self.dispatcher.add_handler(CommandHandler("portfolio", self.bot_command_portfolio))
-        self.dispatcher.add_handler(CommandHandler("current", self.bot_command_exchange_current))
-        self.dispatcher.add_handler(CommandHandler("profits", self.bot_command_profits))
-        self.dispatcher.add_handler(CommandHandler("balance", self.bot_command_balance))
+        self.bot_helper_add_command("start", self.bot_command_start)
+        self.bot_helper_add_command("stop", self.bot_command_stop)
+        self.bot_helper_add_command("thresholds", self.bot_command_thresholds)
+        self.bot_helper_add_command("latest", self.bot_command_latest)
+        self.bot_helper_add_command("graph", self.bot_command_send_graph)
+        self.bot_helper_add_command("gimmemoney", self.bot_command_gimme_money)
+        self.bot_helper_add_command("portfolio", self.bot_command_portfolio)
+        self.bot_helper_add_command("value", self.bot_command_portfolio_value)
+        self.bot_helper_add_command("current", self.bot_command_exchange_current)
+        self.bot_helper_add_command("profits", self.bot_command_profits)
+        self.bot_helper_add_command("balance", self.bot_command_balance)
 
         # Register callback behaviour with dispatcher
         # self.dispatcher.add_handler(CallbackQueryHandler(self.bot_helper_button_select_callback, pass_update_queue=True,
         #                                                  pass_user_data=True))
 
+    def bot_helper_add_command(self, command: str, callback) -> None:
+        """
+        Registers a command handler with the dispatcher, timing the handler and counting its errors
+
+        :param command: The command (without /)
+        :param callback: The handler, called with the update and context
+        """
+        def timed_callback(update: Updater, context: CallbackContext) -> None:
+            try:
+                with metrics.timer("telegram_command_seconds", command=command):
+                    callback(update, context)
+            except Exception:
+                metrics.increment("telegram_command_errors_total", command=command)
+                raise
+
+        self.dispatcher.add_handler(CommandHandler(command, timed_callback))
+
     def authenticate(self, update: Updater) -> bool:
         """
         Checks if a user is on the whitelist.
@@ -90,20 +155,37 @@ class TelegramBot:
         """
         username = update.message.from_user["username"]
         if username not in self.whitelist_users:
-            print("Unauthorized user ", username)
+            logger.warning("Unauthorized user %s", username)
             return False
         return True
 
     def start_telegram_bot(self) -> None:
         """
-        Starts the bot by putting the updater into a polling mode, and making the bot wait for commands
+        Starts the bot by putting the updater into a polling mode, and making the bot wait for commands. Also starts the
+        scheduler thread which runs the background jobs.
         """
+        if self.stream_prices:
+            self.bot_helper_start_price_stream()
+
+        # A single alert job serves all subscribers. Streamed prices are local, so they can be checked more often.
+        notification_seconds = self.notification_periodicity*60
+        if self.price_stream is not None:
+            notification_seconds = self.stream_notification_periodicity
+        schedule.every(notification_seconds).seconds.do(self.bot_send_spike_alerts)
+
+        schedule.every(self.graph_warm_periodicity*60).seconds.do(self.bot_warm_graphs)
+        schedule.every(self.metrics_dump_periodicity*60).seconds.do(self.bot_dump_metrics)
+        ScheduleThread.ScheduleThread().start()
+
+        if self.metrics_port is not None:
+            metrics.serve(self.metrics_port)
+
         self.updater.start_polling()
         self.updater.idle()
 
     def bot_command_start(self, update: Updater, context: CallbackContext) -> None:
         """
-        Mandatory instance method because the bot needs the context initialized in order to send messages
+        Subscribes the chat to spike alerts via command "/start", optionally only for the coins given as arguments
 
         :param update: An updater object used to receive data from the telegram chat
         :param context: A context object which allows us to send data to the chat
@@ -111,15 +193,44 @@ class TelegramBot:
         if not self.authenticate(update):  # Verify that the user is allowed to access the bot
             return
 
+        is_new = self.bot_helper_subscribe(update.effective_chat.id, context.args)
         update.message.reply_text("Bot started. Let's make some money!")
 
-        self.context = context
-        self.id = update.effective_chat.id
-        self.bot_send_spike_alerts()
+        # Send the current alerts from a one-off job, such that the dispatcher isn't blocked for a whole alert cycle
+        if is_new:
+            context.job_queue.run_once(lambda job_context: self.bot_send_spike_alerts(), 0)
 
-        # Schedule a function to be executed at a given time interval until the bot is killed
-        schedule.every((self.notification_periodicity*60)).seconds.do(self.bot_send_spike_alerts)
-        ScheduleThread.ScheduleThread().start()
+    def bot_command_stop(self, update: Updater, context: CallbackContext) -> None:
+        """
+        Unsubscribes the chat from spike alerts via command "/stop"
+
+        :param update: An updater object used to receive data from the telegram chat
+        :param context: Default CallbackContext.
+        """
+        if not self.authenticate(update):  # Verify that the user is allowed to access the bot
+            return
+
+        if self.subscriptions.unsubscribe(update.effective_chat.id):
+            self.subscriptions.save()
+            update.message.reply_text("You will no longer receive alerts.")
+        else:
+            update.message.reply_text("You are not subscribed to alerts.")
+
+    def bot_command_thresholds(self, update: Updater, context: CallbackContext) -> None:
+        """
+        Sets the alert thresholds of the chat via command "/thresholds"
+
+        args[0] Minimum (%) change over a day needed to trigger a notification
+        args[1] Minimum (%) change over a week needed to trigger a notification
+        args[2] (optional) Amount in (%) needed for another notification to be sent for a coin
+
+        :param update: Updater used to respond to message
+        :param context: Context used to extract input arguments
+        """
+        if not self.authenticate(update):  # Verify that the user is allowed to access the bot
+            return
+
+        update.message.reply_text(self.bot_helper_set_thresholds(update.effective_chat.id, context.args))
 
     def bot_command_latest(self, update: Updater, context: CallbackContext) -> None:
         """
@@ -132,7 +243,7 @@ class TelegramBot:
             return
 
         username = update.message.from_user["username"]
-        print(username, " requested the latest changes.")
+        logger.info("%s requested the latest changes.", username)
         messages = self.spike.get_spike_alerts(ignore_previous=True)
 
         if len(messages) == 0:
@@ -141,7 +252,6 @@ class TelegramBot:
 
         formatted_list = [str(message) + "\n" for message in messages]
         formatted_message = "".join(formatted_list)
-        print(formatted_message)
 
         update.message.reply_text(formatted_message)
 
@@ -157,25 +267,18 @@ class TelegramBot:
 
         username = update.message.from_user["username"]
 
-        print(username, " requested a graph.")
+        logger.info("%s requested a graph.", username)
 
-        # Get PIL image from PriceGraph
-        pil_image = self.price_graph.normalised_price_graph(period="week", is_interactive=False, get_pil_image=True)
-        # pil_image.show()
-        # Convert PIL Image into raw bytes
-        buffer = io.BytesIO()
-        buffer.name = 'image.jpeg'
-        pil_image.save(buffer, 'JPEG')
-        buffer.seek(0)
-
-        context.bot.send_photo(update.effective_chat.id, photo=buffer)
+        # Get the rendered graph from PriceGraph, cached as long as the price data doesn't change
+        rendered = self.price_graph.get_normalised_graph(period="week")
+        self.bot_helper_send_rendered_graph(update.effective_chat.id, context, rendered)
 
     def bot_command_gimme_money(self, update: Updater, context: CallbackContext) -> None:
         if not self.authenticate(update):  # Verify that the user is allowed to access the bot
             return
 
         username = update.message.from_user["username"]
-        print("A large sum of money was given to ", username, ".")
+        logger.info("A large sum of money was given to %s.", username)
         update.message.reply_text("💸💸💸💸💸💸💸💸💸💸\n")
 
     def bot_command_portfolio(self, update: Updater, context: CallbackContext) -> None:
@@ -189,7 +292,7 @@ class TelegramBot:
             return
         username = update.message.from_user["username"]
 
-        print(username, " requested portfolio")
+        logger.info("%s requested portfolio", username)
 
         if len(context.args) < 1:
             update.message.reply_text(text="Use Syntax: \n`/portfolio coin (optional: period)`",
@@ -206,15 +309,24 @@ class TelegramBot:
         except IndexError:
             pass
 
-        # Get PIL image
-        pil_image = self.price_graph.portfolio_price_graph(coin=coin, period=period)
+        # Get the rendered graph, pre-rendered by bot_warm_graphs for the portfolio_warm_targets
+        rendered = self.price_graph.get_portfolio_graph(coin=coin, period=period)
+        self.bot_helper_send_rendered_graph(update.effective_chat.id, context, rendered)
 
-        buffer = io.BytesIO()
-        buffer.name = 'image.jpeg'
-        pil_image.save(buffer, 'JPEG')
-        buffer.seek(0)
+    def bot_command_portfolio_value(self, update: Updater, context: CallbackContext) -> None:
+        """
+        Shows the user the value of all coins they hold over time in the form of a graph
 
-        context.bot.send_photo(update.effective_chat.id, photo=buffer)
+        :param update: Updater used to retrieve the chat
+        :param context: Context used to extract the (optional) period
+        """
+        if not self.authenticate(update):  # Verify that the user is allowed to access the bot
+            return
+
+        period = context.args[0] if len(context.args) > 0 else "month"
+
+        rendered = self.price_graph.get_portfolio_value_graph(period=period)
+        self.bot_helper_send_rendered_graph(update.effective_chat.id, context, rendered)
 
     def bot_command_exchange_current(self, update: Updater, context: CallbackContext) -> None:
         """
@@ -239,8 +351,7 @@ class TelegramBot:
         if len(context.args) > 1:
             to_currency = context.args[1].upper()
 
-        coin_currency_pair = coin + "-" + to_currency
-        current_exchange = float(self.coinbase_api.client.get_spot_price(currency_pair=coin_currency_pair).amount)
+        current_exchange = self.coinbase_api.get_spot_price(coin, to_currency)
 
         output = "1 {} is {:.2f} {}".format(coin.upper(), current_exchange, to_currency.upper())
 
@@ -253,6 +364,7 @@ class TelegramBot:
         args[0] Currency which user wants to sell
         args[1] Amount of currency user wants to sell
         args[2] Currency in which profits are displayed (CHF, USD, etc.)
+        args[3] (optional) Cost basis method: fifo (default), lifo or average
 
         :param update: Updater used to respond to message
         :param context: Context used to extract input arguments
@@ -262,14 +374,16 @@ class TelegramBot:
             return
 
         if len(context.args) < 3:
-            update.message.reply_text(text="Use Syntax: \n`/profits coin_to_sell num_coins profit_currency`",
-                                      parse_mode="Markdownv2")
+            update.message.reply_text(text="Use Syntax: \n`/profits coin_to_sell num_coins profit_currency "
+                                           "(optional: fifo|lifo|average)`", parse_mode="Markdownv2")
             return
 
         sell_coin = context.args[0]
         sell_amount = float(context.args[1])
         profit_currency = context.args[2]
-        message = self.spike.get_sell_profitability(coin=sell_coin, amount=sell_amount, profit_currency=profit_currency)
+        method = context.args[3] if len(context.args) > 3 else "fifo"
+        message = self.spike.get_sell_profitability(coin=sell_coin, amount=sell_amount, profit_currency=profit_currency,
+                                                    method=method)
 
         update.message.reply_text(message)
 
@@ -283,15 +397,79 @@ class TelegramBot:
         if not self.authenticate(update):  # Verify that the user is allowed to access the bot
             return
 
-        messages = []  # list of messages to be displayed to the user
-
         if len(context.args) <= 0:  # No arguments implies that all currencies are fetched
-            currencies = statics.CURRENCIES
+            currencies = self.watchlist.coins
         else:                               # otherwise, the currencies listed by the user are used
             currencies = context.args
 
         # get balances for requested coins from Coinbase API
         balances = self.coinbase_api.get_account_balance(currencies)
+        messages = self.bot_helper_format_balances(balances)
+
+        if len(messages) == 0:  # explain syntax if no arguments are given
+            update.message.reply_text(text="Please enter one or more currency.\nSyntax: `/balance coin1 coin2 ...`",
+                                      parse_mode="Markdownv2")
+            return
+
+        update.message.reply_text(text="\n".join(messages), parse_mode="Markdownv2")  # send message
+
+    def bot_helper_subscribe(self, chat_id: int, coins: list) -> bool:
+        """
+        Subscribes a chat to spike alerts with the default thresholds, replacing its previous subscription
+
+        :param chat_id: The chat which receives the alerts
+        :param coins: Coins for which alerts are sent, all coins which are tracked (now or later on) if empty
+        :return: True if the chat wasn't subscribed before
+        """
+        coins = [coin.upper() for coin in coins] if coins else None  # None follows the coins which are tracked
+        subscription = Subscription(chat_id, coins, notification_threshold=self.spike.notification_threshold,
+                                    day_threshold=self.spike.day_threshold, week_threshold=self.spike.week_threshold)
+
+        previous = self.subscriptions.get(chat_id)
+        if previous is not None:  # keep thresholds which were set with /thresholds
+            subscription.notification_threshold = previous.notification_threshold
+            subscription.day_threshold, subscription.week_threshold = previous.day_threshold, previous.week_threshold
+
+        is_new = self.subscriptions.subscribe(subscription)
+        self.subscriptions.save()
+        return is_new
+
+    def bot_helper_set_thresholds(self, chat_id: int, args: list) -> str:
+        """
+        Sets the thresholds of a subscribed chat
+
+        :param chat_id: The chat
+        :param args: Day threshold, week threshold and optionally the notification threshold (in %) as strings
+        :return: Reply to the user
+        """
+        subscription = self.subscriptions.get(chat_id)
+        if subscription is None:
+            return "Use /start to subscribe to alerts first."
+
+        try:
+            thresholds = [float(arg) for arg in args]
+        except ValueError:
+            thresholds = []
+        if len(thresholds) not in [2, 3]:
+            return "Use Syntax: /thresholds day_threshold week_threshold (optional: notification_threshold)"
+
+        subscription.day_threshold, subscription.week_threshold = thresholds[:2]
+        if len(thresholds) == 3:
+            subscription.notification_threshold = thresholds[2]
+
+        self.subscriptions.subscribe(subscription)
+        self.subscriptions.save()
+        return "Alerts are sent for changes above {:g}% in a day and {:g}% in a week.".format(*thresholds[:2])
+
+    @staticmethod
+    def bot_helper_format_balances(balances: dict) -> [str]:
+        """
+        Formats account balances as Markdown messages
+
+        :param balances: Dictionary of currency, balance pairs
+        :return: One message per currency, sorted by how many coins are held
+        """
+        messages = []  # list of messages to be displayed to the user
 
         # Extract items and sort by how many coins are held
         sorted_balance = sorted(balances.items(), key=operator.itemgetter(1), reverse=True)
@@ -299,31 +477,105 @@ class TelegramBot:
         # generate balance message for each coin
         for coin, coin_balance in sorted_balance:
             # Need to escape . character for markdown to work
-            messages.append("Your have `" + str(coin_balance).replace(".", "\.") + "` *" + str(coin) + "*")
+            messages.append("Your have `" + str(coin_balance).replace(".", "\\.") + "` *" + str(coin) + "*")
 
-        if len(messages) == 0:  # explain syntax if no arguments are given
-            update.message.reply_text(text="Please enter one or more currency.\nSyntax: `/balance coin1 coin2 ...`",
-                                      parse_mode="Markdownv2")
+        return messages
+
+    @staticmethod
+    def bot_helper_send_rendered_graph(chat_id: int, context: CallbackContext, rendered: RenderedGraph) -> None:
+        """
+        Sends a rendered graph to a chat. After the first upload the Telegram file_id is remembered, such that later
+        sends of the same graph don't upload the image again.
+
+        :param chat_id: The chat which the graph is sent to
+        :param context: Context object used to send the photo
+        :param rendered: The rendered graph
+        """
+        file_id = rendered.file_id
+        if file_id is not None:
+            try:
+                context.bot.send_photo(chat_id, photo=file_id)
+                return
+            except BadRequest:  # file_id is no longer valid, upload the image again
+                rendered.file_id = None
+
+        buffer = io.BytesIO(rendered.image_bytes)
+        buffer.name = "image." + rendered.image_format.lower()
+        message = context.bot.send_photo(chat_id, photo=buffer)
+        rendered.file_id = message.photo[-1].file_id
+
+    def bot_helper_start_price_stream(self) -> None:
+        """
+        Seeds a PriceStream of all currencies from the REST API, starts the ticker feed and attaches the stream to the
+        CoinbaseAPI, such that Spike and PriceGraph read streamed prices instead of polling coinbase.
+        """
+        price_stream = PriceStream(self.watchlist.coins, CoinbaseTickerFeed(),
+                                   quote_currency=self.stream_quote_currency)
+        try:
+            with self.coinbase_api.request_priority(PRIORITY_BACKGROUND):
+                price_stream.seed(self.coinbase_api)
+            price_stream.add_listener(self.spike.on_tick)
+            price_stream.start()
+        except Exception as exception:
+            logger.warning("Failed to start the price stream, prices are polled instead: %s", exception)
             return
 
-        update.message.reply_text(text="\n".join(messages), parse_mode="Markdownv2")  # send message
+        self.price_stream = price_stream
+        self.coinbase_api.attach_price_stream(self.price_stream)
 
-    def bot_send_spike_alerts(self) -> None:
+    def bot_warm_graphs(self) -> None:
         """
-        Sends a spike alert to the user in chat. This is not a callback hence why it doesn't take in a context
-        or updater as arguments.
+        Renders the graphs listed in graph_warm_periods and portfolio_warm_targets in the background. Graphs whose
+        price data hasn't changed since they were last rendered are skipped by the graph cache.
         """
-        print("Checking for new alerts.")
-        messages = self.spike.get_spike_alerts()
+        # Pre-rendering must not delay requests of users waiting for an answer
+        with self.coinbase_api.request_priority(PRIORITY_BACKGROUND), metrics.timer("job_seconds", job="warm_graphs"):
+            for period in self.graph_warm_periods:
+                try:
+                    self.price_graph.get_normalised_graph(period=period)
+                except Exception as exception:
+                    logger.warning("Failed to pre-render %s graph: %s", period, exception)
+
+            for coin, period in self.portfolio_warm_targets:
+                try:
+                    self.price_graph.get_portfolio_graph(coin=coin, period=period)
+                except Exception as exception:
+                    logger.warning("Failed to pre-render %s portfolio graph of %s: %s", period, coin, exception)
 
-        if len(messages) == 0:
+    def bot_send_spike_alerts(self) -> None:
+        """
+        Computes the percentage changes once and queues the alerts of every subscriber, according to the coins,
+        thresholds and previous notifications of the subscription. This is not a callback hence why it doesn't take
+        in a context or updater as arguments.
+        """
+        if len(self.subscriptions) == 0:
             return
 
-        # formatted_list = [str(message) + "\n" for message in messages]
-        formatted_message = "\n".join(messages)
-        print(formatted_message)
+        logger.info("Checking for new alerts.")
+        with self.coinbase_api.request_priority(PRIORITY_ALERTS), metrics.timer("job_seconds", job="spike_changes"):
+            changes = self.spike.get_changes()
+
+        messages = {}  # chat id -> alert messages
+        for period in ["day", "week"]:
+            coins, percentage_changes = changes[period]
+            for chat_id, alerts in self.subscriptions.evaluate(period, coins, percentage_changes).items():
+                chat_messages = messages.setdefault(chat_id, [])
+                for coin, percentage_change in alerts:
+                    chat_messages.append(self.spike.generate_alert_string(coin, percentage_change, period))
 
-        self.context.bot.send_message(self.id, formatted_message)
+        for chat_id, chat_messages in messages.items():
+            self.send_queue.put(chat_id, "\n".join(chat_messages))
+
+        if messages:
+            self.subscriptions.save()  # such that alerts aren't sent again after a restart
+
+
+    @staticmethod
+    def bot_dump_metrics() -> None:
+        """
+        Logs all metrics in the Prometheus text format
+        """
+        logger.info("Metrics:\n%s", metrics.render())
 
 
 if __name__ == '__main__':
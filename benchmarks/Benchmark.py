@@ -0,0 +1,267 @@
+from benchmarks.FakeCoinbaseClient import FakeCoinbaseClient
+from utils.coinbase_utils.CoinbaseAPI import CoinbaseAPI
+from utils.coinbase_utils.RequestScheduler import RequestScheduler
+from utils.coinbase_utils.PriceGraph import PriceGraph
+from utils.coinbase_utils.Watchlist import Watchlist
+import utils.coinbase_utils.GlobalStatics as statics
+from spike import Spike
+import matplotlib
+import numpy as np
+import argparse
+import platform
+import logging
+import json
+import time
+import sys
+import os
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ["alert_cycle", "normalised_graph", "portfolio_graph", "profits"]
+
+
+class Benchmark:
+    """
+    This class is intended to measure the performance of the bot without credentials or network access. CoinbaseAPI,
+    Spike and PriceGraph are run against a FakeCoinbaseClient which generates (or replays) the responses of coinbase
+    with an injected latency, such that the same scenarios can be timed for any number of coins and series length.
+
+    Every scenario is timed cold (all caches empty, as after a restart) and warm (repeated on the same objects, as
+    in a running bot). Results are plain dictionaries with stable keys, such that they can be saved as JSON and
+    compared against the results of another commit.
+
+    Use this class from the command line: python -m benchmarks.Benchmark --coins 13,100,500 --output results.json
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0., repeats: int = 5, rate: float = 1e9,
+                 workers: int = 4, transactions: int = 100, seed: int = 0, recording: str = None,
+                 max_fetches: int = None):
+        """
+        :param latency: Time (in seconds) every call to the fake client takes
+        :param jitter: Maximum random time (in seconds) added to the latency of every call
+        :param repeats: Number of times every scenario is timed
+        :param rate: Maximum number of requests per second of the request scheduler, unlimited by default such that
+                     the latency and concurrency are measured rather than coinbase's rate limit
+        :param workers: Number of request scheduler workers
+        :param transactions: Number of transactions of every fake account
+        :param seed: Seed of the generated data
+        :param recording: JSON file written by RecordingClient, replayed instead of generated data if given
+        :param max_fetches: Maximum number of historic series fetched per alert cycle, None fetches all
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.repeats = repeats
+        self.transactions = transactions
+        self.seed = seed
+        self.recording = recording
+        self.max_fetches = max_fetches
+
+        # Shared by all runs, the scheduler holds no cached data and its worker threads are never stopped
+        self.scheduler = RequestScheduler(rate=rate, burst=max(int(min(rate, 1e6)), 1), workers=workers)
+
+    @staticmethod
+    def get_coins(count: int) -> list:
+        """
+        :return: The coins of the bot followed by made up coins, count coins in total
+        """
+        coins = statics.CURRENCIES[:count]
+        return coins + ["X{:03d}".format(index) for index in range(count - len(coins))]
+
+    def build(self, coins: list, series_scale: float) -> (FakeCoinbaseClient, CoinbaseAPI, Spike, PriceGraph):
+        """
+        Builds the objects of the bot with empty caches on top of a fake client
+
+        :param coins: Coins which are listed
+        :param series_scale: Factor applied to the number of prices of every historic series
+        :return: The fake client, and the CoinbaseAPI, Spike and PriceGraph objects using it respectively
+        """
+        parameters = {"coins": coins, "latency": self.latency, "jitter": self.jitter, "series_scale": series_scale,
+                      "transactions": self.transactions, "seed": self.seed}
+        if self.recording is not None:
+            client = FakeCoinbaseClient.from_recording(self.recording, **parameters)
+        else:
+            client = FakeCoinbaseClient(**parameters)
+
+        coinbase_api = CoinbaseAPI(client=client, scheduler=self.scheduler)
+        spike = Spike(coins, coinbase_api, notification_threshold=5, day_threshold=5, week_threshold=10,
+                      max_fetches=self.max_fetches)
+
+        # All coins are graphed, such that render times scale with the number of coins
+        graph = PriceGraph(coinbase_api, coins, colors=Watchlist(coins).colors,
+                           base_path=os.path.abspath(os.path.dirname(__file__)))
+        return client, coinbase_api, spike, graph
+
+    @staticmethod
+    def release(spike: Spike) -> None:
+        """
+        Stops the fetch threads of a Spike object which is no longer used
+        """
+        if spike.executor is not None:
+            spike.executor.shutdown(wait=False)
+
+    @staticmethod
+    def get_scenario(scenario: str, coins: list, spike: Spike, graph: PriceGraph):
+        """
+        :return: Function without arguments running one iteration of a scenario
+        """
+        coinbase_api = spike.coinbase_api
+        if scenario == "alert_cycle":
+            return lambda: spike.get_spike_alerts()
+        if scenario == "normalised_graph":
+            return lambda: graph.normalised_price_graph("day", get_pil_image=True)
+        if scenario == "portfolio_graph":
+            return lambda: graph.portfolio_price_graph(coins[0], "month")
+        if scenario == "profits":
+            return lambda: coinbase_api.get_coin_sell_profitability(coins[0], 1e-3, statics.QUOTE_CURRENCY)
+        raise ValueError("Unknown scenario, should be one of " + ", ".join(SCENARIOS))
+
+    @staticmethod
+    def summarize(durations: list, requests: list) -> dict:
+        """
+        :param durations: Duration (in seconds) of every run
+        :param requests: Number of calls made to the client by every run
+        :return: Dictionary of statistics of the runs
+        """
+        durations = np.array(durations)
+        return {"runs": len(durations), "min": float(durations.min()), "median": float(np.median(durations)),
+                "mean": float(durations.mean()), "p95": float(np.quantile(durations, 0.95)),
+                "requests": float(np.mean(requests))}
+
+    def run_scenario(self, scenario: str, coin_count: int, series_scale: float) -> dict:
+        """
+        Times a scenario cold (on new objects) and warm (repeated on the same objects)
+
+        :param scenario: One of SCENARIOS
+        :param coin_count: Number of coins which are listed
+        :param series_scale: Factor applied to the number of prices of every historic series
+        :return: Dictionary mapping "cold" and "warm" to the statistics of the runs
+        """
+        coins = self.get_coins(coin_count)
+        results = {}
+
+        for phase in ["cold", "warm"]:
+            durations, requests = [], []
+            client, coinbase_api, spike, graph = self.build(coins, series_scale)
+            function = self.get_scenario(scenario, coins, spike, graph)
+            if phase == "warm":
+                function()
+
+            for repeat in range(self.repeats):
+                if phase == "cold" and repeat > 0:
+                    self.release(spike)
+                    client, coinbase_api, spike, graph = self.build(coins, series_scale)
+                    function = self.get_scenario(scenario, coins, spike, graph)
+
+                calls = sum(client.calls.values())
+                start = time.perf_counter()
+                function()
+                durations.append(time.perf_counter() - start)
+                requests.append(sum(client.calls.values()) - calls)
+
+            self.release(spike)
+            results[phase] = self.summarize(durations, requests)
+            logger.info("%s %s coins x%s %s: median %.4fs", scenario, coin_count, series_scale, phase,
+                        results[phase]["median"])
+
+        return results
+
+    def run(self, coin_counts: list, series_scales: list, scenarios: list = SCENARIOS) -> dict:
+        """
+        Runs the scenarios for every combination of coin count and series scale
+
+        :param coin_counts: Numbers of coins which are listed (e.g. [13, 100, 500])
+        :param series_scales: Factors applied to the number of prices of every historic series (e.g. [1, 4])
+        :param scenarios: Scenarios which are run
+        :return: Dictionary of the environment, configuration and results, ready to be saved as JSON
+        """
+        runs = []
+        for coin_count in coin_counts:
+            for series_scale in series_scales:
+                runs.append({"coins": coin_count, "series_scale": series_scale,
+                             "scenarios": {scenario: self.run_scenario(scenario, coin_count, series_scale)
+                                           for scenario in scenarios}})
+
+        return {"environment": self.get_environment(),
+                "config": {"latency": self.latency, "jitter": self.jitter, "repeats": self.repeats,
+                           "rate": self.scheduler.bucket.rate, "workers": self.scheduler.workers,
+                           "transactions": self.transactions, "seed": self.seed, "recording": self.recording,
+                           "max_fetches": self.max_fetches},
+                "runs": runs}
+
+    @staticmethod
+    def get_environment() -> dict:
+        """
+        :return: Dictionary describing the machine and versions the benchmark was run with
+        """
+        return {"python": platform.python_version(), "numpy": np.__version__, "matplotlib": matplotlib.__version__,
+                "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+    @staticmethod
+    def compare(results: dict, baseline: dict) -> list:
+        """
+        Compares the median durations of two benchmark results
+
+        :param results: Results of the run which is evaluated
+        :param baseline: Results of the run it is compared against
+        :return: List of dictionaries, one per run, scenario and phase present in both, where speedup is the baseline
+                 median divided by the median of the results (above 1 is faster than the baseline)
+        """
+        baseline_runs = {(run["coins"], run["series_scale"]): run["scenarios"] for run in baseline["runs"]}
+        comparison = []
+
+        for run in results["runs"]:
+            baseline_scenarios = baseline_runs.get((run["coins"], run["series_scale"]), {})
+            for scenario, phases in run["scenarios"].items():
+                for phase, stats in phases.items():
+                    baseline_stats = baseline_scenarios.get(scenario, {}).get(phase)
+                    if baseline_stats is None:
+                        continue
+                    comparison.append({"coins": run["coins"], "series_scale": run["series_scale"],
+                                       "scenario": scenario, "phase": phase, "median": stats["median"],
+                                       "baseline_median": baseline_stats["median"],
+                                       "speedup": baseline_stats["median"] / stats["median"]})
+        return comparison
+
+
+def parse_list(text: str, cast) -> list:
+    return [cast(value) for value in text.split(",") if value.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the bot against a fake coinbase client")
+    parser.add_argument("--coins", default="13,50,100,500", help="Comma separated numbers of coins")
+    parser.add_argument("--series-scale", default="1", help="Comma separated factors of the historic series lengths")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated scenarios")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency (in seconds) of every request")
+    parser.add_argument("--jitter", type=float, default=0., help="Maximum random latency added to every request")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of runs of every scenario and phase")
+    parser.add_argument("--rate", type=float, default=1e9, help="Maximum number of requests per second")
+    parser.add_argument("--workers", type=int, default=4, help="Number of request scheduler workers")
+    parser.add_argument("--transactions", type=int, default=100, help="Number of transactions per account")
+    parser.add_argument("--max-fetches", type=int, default=None, help="Maximum number of series fetched per cycle")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated data")
+    parser.add_argument("--recording", default=None, help="Recorded responses replayed instead of generated ones")
+    parser.add_argument("--baseline", default=None, help="Results of an earlier run to compare against")
+    parser.add_argument("--output", default=None, help="File the results are written to, stdout by default")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    matplotlib.use("Agg")
+
+    benchmark = Benchmark(latency=arguments.latency, jitter=arguments.jitter, repeats=arguments.repeats,
+                          rate=arguments.rate, workers=arguments.workers, transactions=arguments.transactions,
+                          seed=arguments.seed, recording=arguments.recording, max_fetches=arguments.max_fetches)
+    results = benchmark.run(parse_list(arguments.coins, int), parse_list(arguments.series_scale, float),
+                            parse_list(arguments.scenarios, str))
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as baseline_file:
+            results["comparison"] = Benchmark.compare(results, json.load(baseline_file))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if arguments.output is None:
+        print(output)
+    else:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(output + "\n")
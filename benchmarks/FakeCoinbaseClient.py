@@ -0,0 +1,264 @@
+import numpy as np
+import threading
+import inspect
+import random
+import json
+import time
+import zlib
+
+# Number of prices coinbase returns per period of the historic prices endpoint
+PERIOD_POINTS = {"hour": 360, "day": 288, "week": 168, "month": 360, "year": 365, "all": 2000}
+PERIOD_STEPS = {"hour": 10, "day": 5*60, "week": 60*60, "month": 2*60*60, "year": 24*60*60, "all": 3*24*60*60}
+
+
+class FakeResponse(dict):
+    """
+    Dictionary standing in for the APIObject returned by the coinbase client, with the pagination of paged responses
+    """
+
+    def __init__(self, data: dict, pagination: dict = None):
+        super().__init__(data)
+        self.pagination = pagination
+
+
+class FakeCoinbaseClient:
+    """
+    This class stands in for coinbase.wallet.client.Client, such that CoinbaseAPI, Spike and PriceGraph can be run
+    without credentials or network access. Historic prices, spot prices, exchange rates, accounts and transactions are
+    generated deterministically from a seed (random walks per currency pair), or replayed from a recording made with
+    RecordingClient. Every call sleeps for the injected latency, to simulate the round trip to coinbase.
+
+    Use this class with CoinbaseAPI(client=FakeCoinbaseClient(...)) in benchmarks.
+    """
+
+    def __init__(self, coins: list, quote_currency: str = "CHF", latency: float = 0., jitter: float = 0.,
+                 series_scale: float = 1., transactions: int = 100, seed: int = 0, recording: dict = None,
+                 now: float = None):
+        """
+        :param coins: Coins which are listed (BTC, XLM, etc.)
+        :param quote_currency: Currency in which prices are expressed, also the native currency of the accounts
+        :param latency: Time (in seconds) every call takes
+        :param jitter: Maximum random time (in seconds) added to the latency of every call
+        :param series_scale: Factor applied to the number of prices returned per period
+        :param transactions: Number of transactions of every account
+        :param seed: Seed of the generated data, equal seeds generate equal data
+        :param recording: Responses recorded by RecordingClient, replayed instead of generated ones if present
+        :param now: Time (in seconds since epoch) of the newest generated price, the current time by default. Prices
+                    only depend on the seed, such that runs are comparable regardless of the time they are made at
+        """
+        self.coins = [coin.upper() for coin in coins]
+        self.quote_currency = quote_currency.upper()
+        self.latency = latency
+        self.jitter = jitter
+        self.series_scale = series_scale
+        self.transactions = transactions
+        self.seed = seed
+        self.recording = recording if recording is not None else {}
+
+        self.now = float(int(now if now is not None else time.time()))
+        self.calls = {}  # method -> number of calls
+        self.__lock = threading.Lock()
+        self.__random = random.Random(seed)
+
+    @classmethod
+    def from_recording(cls, file_name: str, **kwargs) -> "FakeCoinbaseClient":
+        """
+        :param file_name: JSON file written by RecordingClient.save
+        :param kwargs: Further arguments of the constructor (latency, etc.), coins default to the recorded accounts
+        :return: A client replaying the recorded responses
+        """
+        with open(file_name) as file:
+            recording = json.load(file)
+        kwargs.setdefault("coins", recording.get("coins", []))
+        return cls(recording=recording["responses"], **kwargs)
+
+    def __call(self, method: str, **params):
+        """
+        Counts a call, waits for the injected latency and returns the recorded response if there is one
+        """
+        with self.__lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            delay = self.latency + self.__random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        recorded = self.recording.get(recording_key(method, params))
+        if recorded is not None:
+            return FakeResponse(recorded["data"], recorded.get("pagination"))
+        return None
+
+    def __rng(self, *key) -> np.random.Generator:
+        return np.random.default_rng([self.seed, zlib.crc32("/".join(key).encode())])
+
+    def __prices(self, coin: str, period: str) -> (np.ndarray, np.ndarray):
+        """
+        :return: Generated times (seconds since epoch) and prices of a coin, ordered from oldest to newest
+        """
+        points = max(int(PERIOD_POINTS[period] * self.series_scale), 2)
+        step = PERIOD_STEPS[period] / self.series_scale
+        times = self.now - step * np.arange(points)[::-1]
+
+        # Random walk ending at the spot price of the coin, such that all periods agree on the current price
+        returns = self.__rng(coin, period).normal(0, 0.01, points)
+        prices = self.__spot(coin) * np.exp(np.cumsum(returns) - np.cumsum(returns)[-1])
+        return times, prices
+
+    def __spot(self, coin: str) -> float:
+        return float(10 ** self.__rng(coin).uniform(-2, 4))
+
+    def get_historic_prices(self, currency_pair: str, period: str = "day", **params):
+        recorded = self.__call("get_historic_prices", currency_pair=currency_pair, period=period, **params)
+        if recorded is not None:
+            return recorded
+
+        times, prices = self.__prices(currency_pair.split("-")[0], period)
+        timestamps = np.datetime_as_string(times[::-1].astype("datetime64[s]"), unit="s", timezone="UTC")
+        return FakeResponse({"prices": [{"price": "%.6f" % price, "time": timestamp}
+                                        for price, timestamp in zip(prices[::-1].tolist(), timestamps.tolist())]})
+
+    def get_spot_price(self, currency_pair: str = "BTC-USD", **params):
+        recorded = self.__call("get_spot_price", currency_pair=currency_pair, **params)
+        if recorded is not None:
+            return recorded
+
+        base, currency = currency_pair.split("-")
+        return FakeResponse({"base": base, "currency": currency, "amount": "%.6f" % self.__spot(base)})
+
+    def get_exchange_rates(self, currency: str = None, **params):
+        recorded = self.__call("get_exchange_rates", currency=currency, **params)
+        if recorded is not None:
+            return recorded
+
+        # Historic rates (with a date) drift a little from the current ones
+        drift = 1. if "date" not in params else float(self.__rng(params["date"]).uniform(0.8, 1.2))
+        rates = {coin: "%.10f" % (1 / (self.__spot(coin) * drift)) for coin in self.coins}
+        rates.update({fiat: "%.10f" % (1 / self.__fiat(fiat)) for fiat in self.__fiats()})
+        rates[currency or self.quote_currency] = "1"
+        return FakeResponse({"currency": currency, "rates": rates})
+
+    def __fiats(self) -> list:
+        return sorted({self.quote_currency, "USD", "EUR"})
+
+    def __fiat(self, currency: str) -> float:
+        """
+        :return: Value of a fiat currency expressed in the quote currency
+        """
+        return 1. if currency == self.quote_currency else float(self.__rng(currency).uniform(0.8, 1.2))
+
+    def get_currencies(self, **params):
+        recorded = self.__call("get_currencies", **params)
+        if recorded is not None:
+            return recorded
+
+        return FakeResponse({"data": [{"id": currency, "name": currency} for currency in self.__fiats()]})
+
+    def get_accounts(self, limit: int = 25, starting_after: str = None, **params):
+        recorded = self.__call("get_accounts", limit=limit, starting_after=starting_after, **params)
+        if recorded is not None:
+            return recorded
+
+        accounts = [{"id": coin, "currency": coin, "balance": {"currency": coin, "amount": "%.8f" % self.__held(coin)}}
+                    for coin in self.coins]
+        return self.__page(accounts, limit, starting_after)
+
+    def __transactions(self, coin: str) -> list:
+        """
+        :return: Generated transactions of an account, ordered from oldest to newest
+        """
+        rng = self.__rng(coin, "transactions")
+        amounts = rng.uniform(-0.5, 1., self.transactions) * 100 / self.__spot(coin)
+        prices = self.__spot(coin) * rng.uniform(0.5, 1.5, self.transactions)
+        times = self.now - np.sort(rng.uniform(0, 365*24*60*60, self.transactions))[::-1]
+        timestamps = np.datetime_as_string(times.astype("datetime64[s]"), unit="s", timezone="UTC")
+
+        return [{"id": "{}-{}".format(coin, index), "type": "buy" if amount > 0 else "sell",
+                 "amount": {"amount": "%.8f" % amount, "currency": coin},
+                 "native_amount": {"amount": "%.2f" % (amount * price), "currency": self.quote_currency},
+                 "created_at": timestamp}
+                for index, (amount, price, timestamp) in enumerate(zip(amounts.tolist(), prices.tolist(),
+                                                                       timestamps.tolist()))]
+
+    def __held(self, coin: str) -> float:
+        return sum(float(transaction["amount"]["amount"]) for transaction in self.__transactions(coin))
+
+    def get_transactions(self, account_id: str, limit: int = 25, order: str = "desc", starting_after: str = None,
+                         **params):
+        recorded = self.__call("get_transactions", account_id=account_id, limit=limit, order=order,
+                               starting_after=starting_after, **params)
+        if recorded is not None:
+            return recorded
+
+        transactions = self.__transactions(account_id.upper())
+        if order == "desc":
+            transactions = transactions[::-1]
+        return self.__page(transactions, limit, starting_after)
+
+    @staticmethod
+    def __page(items: list, limit: int, starting_after: str = None) -> FakeResponse:
+        """
+        :return: The page of at most limit items following the item with the id starting_after
+        """
+        start = 0
+        if starting_after is not None:
+            start = next((index + 1 for index, item in enumerate(items) if item["id"] == starting_after), len(items))
+
+        page = items[start:start + limit]
+        next_starting_after = page[-1]["id"] if page and start + limit < len(items) else None
+        return FakeResponse({"data": page}, {"limit": limit, "next_starting_after": next_starting_after})
+
+
+class RecordingClient:
+    """
+    This class wraps a coinbase client and records its responses, such that they can be replayed by
+    FakeCoinbaseClient.from_recording without credentials or network access.
+    """
+
+    def __init__(self, client, coins: list):
+        """
+        :param client: The coinbase.wallet.client.Client whose responses are recorded
+        :param coins: Coins of the recorded accounts
+        """
+        self.client = client
+        self.coins = coins
+        self.responses = {}
+        self.__lock = threading.Lock()
+
+    def __getattr__(self, method: str):
+        function = getattr(self.client, method)
+        signature = inspect.signature(function)
+
+        def record(*args, **kwargs):
+            # Positional arguments (e.g. the account id of get_transactions) are recorded by name, as they're replayed
+            arguments = {}
+            for name, value in signature.bind(*args, **kwargs).arguments.items():
+                kind = signature.parameters[name].kind
+                if kind == inspect.Parameter.VAR_KEYWORD:
+                    arguments.update(value)
+                elif kind == inspect.Parameter.VAR_POSITIONAL:
+                    if value:
+                        raise TypeError("Unnamed arguments of {} can't be recorded".format(method))
+                else:
+                    arguments[name] = value
+
+            response = function(*args, **kwargs)
+            pagination = getattr(response, "pagination", None)
+            with self.__lock:
+                self.responses[recording_key(method, arguments)] = {
+                    "data": json.loads(json.dumps(response)),
+                    "pagination": dict(pagination) if pagination else None}
+            return response
+        return record
+
+    def save(self, file_name: str) -> None:
+        """
+        :param file_name: JSON file the recording is written to
+        """
+        with self.__lock, open(file_name, "w") as file:
+            json.dump({"coins": self.coins, "responses": self.responses}, file)
+
+
+def recording_key(method: str, params: dict) -> str:
+    """
+    :return: Key under which the response of a call is recorded
+    """
+    return method + json.dumps({key: value for key, value in params.items() if value is not None}, sort_keys=True)
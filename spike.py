@@ -1,9 +1,17 @@
 from utils.coinbase_utils import CoinbaseAPI as cbapi
+from utils.coinbase_utils.PriceChangeTracker import PriceChangeTracker, get_alert_mask
+from utils.coinbase_utils.MetricsRegistry import metrics
 import utils.coinbase_utils.GlobalStatics as statics
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
+import threading
+import logging
+import math
 import time
 import os
 
+logger = logging.getLogger(__name__)
+
 
 class Spike:
     """
@@ -15,26 +23,51 @@ class Spike:
     """
 
     def __init__(self, currencies: list, coinbase_api: cbapi.CoinbaseAPI, notification_threshold: float,
-                 day_threshold: float = 0, week_threshold: float = 0.):
+                 day_threshold: float = 0, week_threshold: float = 0., max_workers: int = 8,
+                 request_timeout: float = 30., max_fetches: int = None,
+                 quote_currency: str = statics.QUOTE_CURRENCY):
         """
         :param currencies: List of crypto currency identifiers (BTC, XRP, etc.)
         :param notification_threshold: Amount in (%) needed for another notification to be sent for a coin
         :param day_threshold: Minimum (%) change over an entire day needed to trigger a notification
         :param week_threshold: Minimum (%) change over a week needed to trigger a notification
         :param coinbase_api: Coinbase API object to fetch data for crypto currencies
+        :param max_workers: Maximum number of concurrent requests to coinbase, 1 fetches sequentially
+        :param request_timeout: Time (in seconds) after which a single fetch is given up on
+        :param max_fetches: Maximum number of historic series fetched per cycle (see get_changes), None fetches all
+        :param quote_currency: Currency in which prices are tracked, streamed prices are converted into it
         """
-        self.currencies = currencies
+        self.currencies = list(currencies)
+        # Thresholds of get_alerts (console, /latest), the bot also uses them as the defaults of new subscriptions
         self.notification_threshold = notification_threshold  # threshold for sending a new notification (%)
         self.day_threshold = day_threshold
         self.week_threshold = week_threshold
         self.coinbase_api = coinbase_api
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.max_fetches = max_fetches
+        self.quote_currency = quote_currency.upper()
+        self.executor = None
+
+        if self.max_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="spike")
 
         # dictionary containing the previously notified price percentage change, used to prevent repeated notifications
-        # for different periods
-        self.notified = {period: {coin: 0 for coin in statics.CURRENCIES} for period in ["day", "week"]}
+        # for different periods. Only get_alerts reads and updates it, the alerts of subscribed chats are tracked
+        # separately per chat by SubscriptionRegistry.
+        self.notified = {period: {coin: 0 for coin in self.currencies} for period in ["day", "week"]}
+
+        # Percentage changes are updated from the latest prices, historic series are only fetched once they run out
+        self.change_tracker = PriceChangeTracker(self.currencies, ["day", "week"])
+        self.__stream_rate = None  # value of 1 unit of the quote currency of the price stream in quote_currency
+        self.__fetch_cursor = 0  # index of the coin whose stale series are fetched first in the next cycle
+        self.__retries = {}  # (coin, period) -> (number of failed fetches, monotonic time before which it's skipped)
+
+        # Cycles are run by the scheduler and by commands, only one at a time updates the tracker, cursor and notified
+        self.__cycle_lock = threading.RLock()
 
     @staticmethod
-    def __generate_alert_string(coin: str, percentage_change: float, period: str) -> str:
+    def generate_alert_string(coin: str, percentage_change: float, period: str) -> str:
         """
         Generates a string which reflects how a coin has changed which will be sent to the user by the bot
 
@@ -59,17 +92,78 @@ class Spike:
                 alert_string = "↓ " + coin_string + " {:5.1f}".format(-percentage_change) + "%" + " in the past day"
         return alert_string
 
-    def __generate_alert(self, coin: str, period: str, ignore_previous: bool = False) -> (float, str):
+    def __fetch_price_series(self, tasks: list) -> dict:
+        """
+        Fetches the historic prices of coins over periods. When max_workers > 1 the requests are made concurrently,
+        coins which fail or take longer than request_timeout are logged and left out of the result.
+
+        :param tasks: List of (coin, period) tuples for which the prices are fetched
+        :return: Dictionary mapping (coin, period) tuples to (times, prices) array tuples
+        """
+        series = {}
+
+        if self.executor is None:
+            for coin, period in tasks:
+                try:
+                    series[(coin, period)] = self.coinbase_api.get_historical_array(coin, period, self.quote_currency)
+                except Exception as exception:
+                    logger.warning("Failed to fetch %s prices for %s: %s", period, coin, exception)
+            return series
+
+        start_times = {}  # (coin, period) -> time at which a worker started fetching it
+        priority = self.coinbase_api.scheduler.get_priority()  # requests of the workers keep the caller's priority
+
+        def fetch(coin: str, period: str) -> (np.ndarray, np.ndarray):
+            start_times[(coin, period)] = time.monotonic()
+            with self.coinbase_api.request_priority(priority):
+                return self.coinbase_api.get_historical_array(coin, period, self.quote_currency)
+
+        futures = {self.executor.submit(fetch, coin, period): (coin, period) for coin, period in tasks}
+        pending = set(futures)
+
+        # Fetches queue up behind each other in the pool, queued fetches are dropped once every "wave" of workers
+        # could have used up its request_timeout (e.g. because workers are stuck on requests that timed out)
+        deadline = time.monotonic() + self.request_timeout * math.ceil(len(tasks) / self.max_workers)
+
+        while pending:
+            # Wake up whenever a fetch finishes or the oldest running fetch runs out of time
+            running = [start_times[futures[future]] for future in pending if futures[future] in start_times]
+            wait_time = deadline - time.monotonic()
+            if running:
+                wait_time = min(wait_time, min(running) + self.request_timeout - time.monotonic())
+            done, pending = wait(pending, timeout=max(wait_time, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                coin, period = futures[future]
+                try:
+                    series[(coin, period)] = future.result()
+                except Exception as exception:
+                    logger.warning("Failed to fetch %s prices for %s: %s", period, coin, exception)
+
+            # Give up on fetches which have been running for longer than request_timeout
+            now = time.monotonic()
+            timed_out = {future for future in pending if now >= deadline
+                         or now - start_times.get(futures[future], now) >= self.request_timeout}
+            for future in timed_out:
+                future.cancel()
+                coin, period = futures[future]
+                logger.warning("Timed out fetching %s prices for %s", period, coin)
+            pending -= timed_out
+
+        return series
+
+    def __generate_alerts(self, coins: list, period: str, percentage_changes: np.ndarray,
+                          ignore_previous: bool = False) -> [(str, float, str)]:
         """
-        Generates a tuple containing the percentage change and alert message.
+        Generates the alerts of all coins whose percentage change crossed the thresholds of a period.
 
-        :param coin: The coin for which the alert message is to be generated.
-        :param period: The period for which the percentage change should be considered
+        :param coins: The coins for which alert messages are to be generated.
+        :param period: The period for which the percentage changes should be considered
+        :param percentage_changes: Array containing the percentage change of each coin over the period
         :param ignore_previous: Flag that denotes that messages should be sent regardless of notification_threshold.
-        :return: A tuple containing the percentage change and alert message.
+        :return: A list of (coin, percentage change, alert message) tuples sorted by decreasing percentage change
         """
-        alert_tuple = None
-        percentage_change = self.coinbase_api.get_price_change(coin, period=period)
+        alert_tuples = []
         threshold = 10
 
         if period == "week":
@@ -77,74 +171,189 @@ class Spike:
         elif period == "day":
             threshold = self.day_threshold
 
-        # Checks if coin increased by more than threshold
-        if percentage_change > threshold:
-            # Check if increased by more than notification threshold, disregard if ignore_previous is set
-            if ignore_previous or percentage_change - self.notified[period][coin] > self.notification_threshold:
-                alert_tuple = (percentage_change, self.__generate_alert_string(coin, percentage_change, period))
-                self.notified[period][coin] = percentage_change
+        notified = np.array([self.notified[period][coin] for coin in coins], dtype=np.float64)
+        alerts = get_alert_mask(percentage_changes, notified, threshold, self.notification_threshold, ignore_previous)
 
-        # Check if coin decreased by more than threshold
-        elif percentage_change < -threshold:
-            # Check if coin decreased by more than notification threshold, disregard if ignore_previous is set
-            if ignore_previous or percentage_change - self.notified[period][coin] < -self.notification_threshold:
-                alert_tuple = (percentage_change, self.__generate_alert_string(coin, percentage_change, period))
-                self.notified[period][coin] = percentage_change
+        alert_indices = np.flatnonzero(alerts)
+        alert_indices = alert_indices[np.argsort(-percentage_changes[alert_indices], kind="stable")]
 
-        return alert_tuple
+        for index in alert_indices:
+            coin, percentage_change = coins[index], float(percentage_changes[index])
+            alert_tuples.append((coin, percentage_change, self.generate_alert_string(coin, percentage_change, period)))
+            self.notified[period][coin] = percentage_change
 
-    def get_spike_alerts(self, is_console=False, ignore_previous=False) -> [(float, str)]:
+        return alert_tuples
+
+    def get_stale_tasks(self, periods: list) -> list:
         """
-        Queries the coinbase API to get updates on significant changes in currencies
+        Gets the series which have to be fetched in this cycle. At most max_fetches series are fetched per cycle, taken
+        in turns starting from the coin after the last one fetched, such that every stale series is fetched within a
+        few cycles however many coins are watched. Series whose fetch failed are skipped until their retry delay (see
+        GlobalStatics.SERIES_RETRY_DELAY) has passed.
 
-        :param is_console: Flag set for console usage vs Telegram Bot usage to get time readout
-        :param ignore_previous: Flag that denotes that messages should be sent regardless of notification_threshold.
-        :return: A list of tuples where the key is percentage change & value is the entire message string
+        :param periods: The periods whose series are checked
+        :return: List of (coin, period) tuples
         """
-        day_message = list()
-        week_message = list()
+        # Series whose fetch failed are left out until their retry delay has passed
+        now = time.monotonic()
+        stale = {period: {coin for coin in self.change_tracker.get_stale_coins(period)
+                          if self.__retries.get((coin, period), (0, now))[1] <= now} for period in periods}
+        if self.max_fetches is None:
+            return [(coin, period) for period in periods for coin in self.currencies if coin in stale[period]]
+
+        tasks = []
+        for offset in range(len(self.currencies)):
+            index = (self.__fetch_cursor + offset) % len(self.currencies)
+            tasks += [(self.currencies[index], period) for period in periods if self.currencies[index] in stale[period]]
+
+            if len(tasks) >= self.max_fetches:
+                # Continue with the next coin, or with this one if some of its series didn't fit into this cycle
+                self.__fetch_cursor = (index + (len(tasks) == self.max_fetches)) % len(self.currencies)
+                break
+        return tasks[:self.max_fetches]
 
-        for coin in statics.CURRENCIES:
-            week_alert_tuple = self.__generate_alert(coin, period="week", ignore_previous=ignore_previous)
-            if week_alert_tuple:
-                week_message.append(week_alert_tuple)
+    def __schedule_retries(self, tasks: list, series: dict) -> None:
+        """
+        Backs off the series which failed to be fetched, the delay doubles with every consecutive failure
 
-            day_alert_tuple = self.__generate_alert(coin, period="day", ignore_previous=ignore_previous)
-            if day_alert_tuple:
-                day_message.append(day_alert_tuple)
+        :param tasks: List of (coin, period) tuples which were fetched
+        :param series: Dictionary of the series which were fetched successfully, see __fetch_price_series
+        """
+        now = time.monotonic()
+        for task in tasks:
+            if task in series:
+                self.__retries.pop(task, None)
+                continue
 
-        week_message.sort(key=lambda tup: tup[0], reverse=True)
-        week_message = [value for key, value in week_message]
+            failures = self.__retries.get(task, (0, now))[0] + 1
+            delay = min(statics.SERIES_RETRY_DELAY * 2 ** (failures - 1), statics.SERIES_MAX_RETRY_DELAY)
+            self.__retries[task] = (failures, now + delay)
+            logger.info("Retrying %s prices for %s in %d seconds", task[1], task[0], delay)
 
-        day_message.sort(key=lambda tup: tup[0], reverse=True)
-        day_message = [value for key, value in day_message]
+    def get_changes(self) -> dict:
+        """
+        Updates the percentage changes of all coins over a day and a week. Coins whose series haven't been fetched yet
+        (see get_stale_tasks) are left out until they are.
+
+        :return: Dictionary mapping "day" and "week" to (coins, array of percentage changes) tuples
+        """
+        periods = ["week", "day"]
+
+        with self.__cycle_lock:
+            # Only fetch the series whose window has moved past the cached prices (all of them at first), in turns
+            tasks = self.get_stale_tasks(periods)
+            series = self.__fetch_price_series(tasks)
+            for (coin, period), (times, prices) in series.items():
+                self.change_tracker.set_series(coin, period, times, prices)
+            self.__schedule_retries(tasks, series)
+
+            # Streamed prices reach the tracker through on_tick, converted at the rate refreshed once per cycle. The
+            # latest prices of coins which the stream doesn't serve (not attached, no rate, or no recent ticks) are
+            # polled in one request.
+            polled = self.currencies
+            price_stream = self.coinbase_api.price_stream
+            if price_stream is not None:
+                try:
+                    self.__stream_rate = self.coinbase_api.get_stream_rate(self.quote_currency)
+                except Exception as exception:
+                    logger.warning("Failed to fetch the exchange rate of streamed prices: %s", exception)
+                if self.__stream_rate is not None:
+                    polled = [coin for coin in self.currencies if price_stream.get_window(coin, "hour") is None]
+
+            if polled:
+                try:
+                    self.change_tracker.update_many(self.coinbase_api.get_spot_prices(polled, self.quote_currency),
+                                                    int(time.time()))
+                except Exception as exception:
+                    logger.warning("Failed to fetch spot prices: %s", exception)
+
+            return {period: self.change_tracker.get_changes(period) for period in periods}
+
+    def get_alerts(self, ignore_previous=False) -> dict:
+        """
+        Updates the percentage changes of all coins and generates the alerts of the coins which crossed the thresholds
+
+        :param ignore_previous: Flag that denotes that messages should be sent regardless of notification_threshold.
+        :return: Dictionary mapping "day" and "week" to lists of (coin, percentage change, message) tuples sorted by
+                 decreasing percentage change
+        """
+        with self.__cycle_lock:
+            with metrics.timer("spike_seconds", phase="changes"):
+                changes = self.get_changes()
+
+            with metrics.timer("spike_seconds", phase="alerts"):
+                return {period: self.__generate_alerts(coins, period, percentage_changes,
+                                                       ignore_previous=ignore_previous)
+                        for period, (coins, percentage_changes) in changes.items()}
+
+    def get_spike_alerts(self, is_console=False, ignore_previous=False) -> [str]:
+        """
+        Queries the coinbase API to get updates on significant changes in currencies
+
+        :param is_console: Flag set for console usage vs Telegram Bot usage to get time readout
+        :param ignore_previous: Flag that denotes that messages should be sent regardless of notification_threshold.
+        :return: A list of alert messages, day alerts first
+        """
+        alerts = self.get_alerts(ignore_previous=ignore_previous)
+        week_message = [message for coin, percentage_change, message in alerts["week"]]
+        day_message = [message for coin, percentage_change, message in alerts["day"]]
 
         if is_console:
             current_time = time.strftime("%H:%M:%S", time.localtime())
             time_stamp = "checked at " + str(current_time) + "\n\n"
             week_message.append(time_stamp)
-        print(day_message, week_message)
+        logger.debug("Spike alerts: %s %s", day_message, week_message)
         return day_message + week_message
 
-    def get_sell_profitability(self, coin: str, amount: float, profit_currency: str) -> str:
+    def on_tick(self, coin: str, timestamp: int, price: float) -> None:
+        """
+        Updates the latest price of a coin, register this method as a PriceStream listener when streaming prices
+
+        :param coin: The coin the price belongs to
+        :param timestamp: Time of the price in seconds since epoch
+        :param price: The price, expressed in the quote currency of the price stream
+        """
+        stream_rate = self.__stream_rate
+        if stream_rate is not None:  # ticks before the first cycle are covered by its polled prices
+            self.change_tracker.update(coin, timestamp, price * stream_rate)
+
+    def get_sell_profitability(self, coin: str, amount: float, profit_currency: str, method: str = "fifo",
+                               max_lots: int = 5) -> str:
         """
         Generates a formatted message outlining how much profit could be made if a certain amount of a currency were
-        to be sold at the current market price. Message states profits in terms of profit_currency
+        to be sold at the current market price. Message states profits in terms of profit_currency, along with the
+        profits of the lots the sell draws from
 
         :param coin: The coin which the user intends to sell
         :param amount: The number of coins the user wants to sell
         :param profit_currency: The currency in which profits are displayed
+        :param method: The cost basis method, "fifo", "lifo" or "average"
+        :param max_lots: Maximum number of lots listed in the message
         :return:
         """
 
-        profits = self.coinbase_api.get_coin_sell_profitability(coin=coin, sell_amount=amount,
-                                                                profits_currency=profit_currency)
+        simulation = self.coinbase_api.simulate_sell(coin=coin, sell_amount=amount, profits_currency=profit_currency,
+                                                     method=method)
+        profits, profit_currency = simulation.profits, profit_currency.upper()
 
         message = "No portfolio change would be yielded by selling"
         if profits > 0:
-            message = "Selling would yield {:.2f} {} in profits".format(profits, profit_currency.upper())
+            message = "Selling would yield {:.2f} {} in profits".format(profits, profit_currency)
         elif profits < 0:
-            message = "Selling would yield {:.2f} {} in losses".format(profits, profit_currency.upper())
+            message = "Selling would yield {:.2f} {} in losses".format(profits, profit_currency)
+        message += " ({})".format(simulation.method.upper())
+
+        lot_dates = np.datetime_as_string(simulation.lot_times, unit="D")
+        lots = zip(lot_dates, simulation.lot_amounts, simulation.unit_costs, simulation.lot_profits)
+        for date, lot_amount, unit_cost, lot_profits in list(lots)[:max_lots]:
+            message += "\n{} bought {}: {:.8g} at {:.2f} {}, {:+.2f} {}".format(
+                simulation.coin, date, lot_amount, unit_cost, profit_currency, lot_profits, profit_currency)
+        if len(lot_dates) > max_lots:
+            message += "\n... and {} more lots".format(len(lot_dates) - max_lots)
+
+        if simulation.unmatched > 0:
+            message += "\n{:.8g} {} exceed the coins held and aren't counted".format(simulation.unmatched,
+                                                                                  simulation.coin)
 
         return message
 
@@ -0,0 +1,30 @@
+from benchmarks.FakeCoinbaseClient import FakeCoinbaseClient
+from utils.coinbase_utils.AsyncCoinbaseAPI import AsyncCoinbaseAPI
+from utils.coinbase_utils.CoinbaseAPI import CoinbaseAPI
+import numpy as np
+import asyncio
+
+
+def test_requests_are_awaited_without_threads():
+    client = FakeCoinbaseClient(["BTC", "ETH"], latency=0.05, jitter=0.)
+    coinbase_api = CoinbaseAPI(client=client)
+    async_api = AsyncCoinbaseAPI(coinbase_api)
+
+    async def fetch():
+        return await asyncio.gather(async_api.get_price_matrix(["BTC", "ETH"], "week"),
+                                    async_api.get_spot_price("BTC"), async_api.get_spot_prices(["BTC", "ETH"]))
+
+    try:
+        (times, prices), spot_price, spot_prices = asyncio.run(fetch())
+    finally:
+        async_api.shutdown()
+
+    # The series are those of the blocking API, which now finds them cached
+    fetches = client.calls["get_historic_prices"]
+    expected_times, expected_prices = coinbase_api.get_price_matrix(["BTC", "ETH"], "week")
+    assert client.calls["get_historic_prices"] == fetches == 2
+    np.testing.assert_array_equal(times, expected_times)
+    np.testing.assert_array_equal(prices, expected_prices)
+
+    assert spot_price == coinbase_api.get_spot_price("BTC")
+    assert set(spot_prices) == {"BTC", "ETH"}
@@ -0,0 +1,63 @@
+from utils.coinbase_utils.CostBasisEngine import CostBasisEngine
+import numpy as np
+
+
+def reference_match_lots(amounts: np.ndarray, method: str) -> np.ndarray:
+    """
+    Open lots computed one sell at a time, every sell taking from the oldest (fifo) or newest (lifo) lots held
+    """
+    remaining = [0.]*len(amounts)
+
+    for index, amount in enumerate(amounts.tolist()):
+        if amount > 0:
+            remaining[index] = amount
+            continue
+
+        to_sell = -amount
+        lots = range(index) if method == "fifo" else range(index - 1, -1, -1)
+        for lot in lots:
+            taken = min(remaining[lot], to_sell)
+            remaining[lot] -= taken
+            to_sell -= taken
+
+    return np.array(remaining)
+
+
+def assert_matches_reference(amounts: np.ndarray) -> None:
+    for method in ["fifo", "lifo"]:
+        np.testing.assert_allclose(CostBasisEngine.match_lots(amounts, method), reference_match_lots(amounts, method),
+                                   rtol=1e-9, atol=1e-9, err_msg=method)
+
+
+def test_empty():
+    for method in ["fifo", "lifo"]:
+        assert len(CostBasisEngine.match_lots(np.empty(0), method)) == 0
+
+
+def test_partial_sells():
+    amounts = np.array([1., 2., -1.5, 3., -2.])
+    assert_matches_reference(amounts)
+
+    np.testing.assert_allclose(CostBasisEngine.match_lots(amounts, "fifo"), [0., 0., 0., 2.5, 0.])
+    np.testing.assert_allclose(CostBasisEngine.match_lots(amounts, "lifo"), [1., 0.5, 0., 1., 0.])
+
+
+def test_oversells():
+    # Sells exceeding the coins held only consume what was held, the buys after them start from nothing
+    amounts = np.array([1., -2., 2., 1., -1.5, -5., 1., -0.25])
+    assert_matches_reference(amounts)
+
+    np.testing.assert_allclose(CostBasisEngine.match_lots(amounts, "fifo"), [0., 0., 0., 0., 0., 0., 0.75, 0.])
+    np.testing.assert_allclose(CostBasisEngine.match_lots(amounts, "lifo"), [0., 0., 0., 0., 0., 0., 0.75, 0.])
+
+
+def test_leading_sells():
+    assert_matches_reference(np.array([-1., 2., -0.5, 1., -3., 0.5]))
+
+
+def test_random_ledgers():
+    rng = np.random.default_rng(0)
+    for trial in range(300):
+        amounts = np.round(rng.uniform(-1.5, 1.5, rng.integers(1, 60)), 3)
+        amounts[amounts == 0] = 0.001
+        assert_matches_reference(amounts)
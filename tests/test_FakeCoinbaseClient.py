@@ -0,0 +1,24 @@
+from benchmarks.FakeCoinbaseClient import FakeCoinbaseClient, RecordingClient
+from utils.coinbase_utils.CoinbaseAPI import CoinbaseAPI
+import os
+
+
+def test_record_and_replay_ledger(tmp_path):
+    coins = ["BTC", "ETH"]
+    file_name = os.path.join(str(tmp_path), "recording.json")
+    recording_client = RecordingClient(FakeCoinbaseClient(coins, transactions=250, now=1.6e9), coins)
+
+    # CoinbaseAPI passes the account id of get_transactions positionally
+    coinbase_api = CoinbaseAPI(client=recording_client)
+    history = coinbase_api.get_transaction_history("BTC")
+    spot_price = coinbase_api.get_spot_price("ETH")
+    recording_client.save(file_name)
+    assert len(history) == 250
+
+    # Another seed generates other data, everything asked for before is replayed from the recording
+    client = FakeCoinbaseClient.from_recording(file_name, seed=1, now=1.7e9)
+    coinbase_api = CoinbaseAPI(client=client)
+    assert coinbase_api.get_transaction_history("BTC") == history
+    assert coinbase_api.get_spot_price("ETH") == spot_price
+    assert client.calls["get_transactions"] == 3  # pages of 100 transactions
+
@@ -0,0 +1,83 @@
+from benchmarks.FakeCoinbaseClient import FakeCoinbaseClient
+from utils.coinbase_utils.CoinbaseAPI import CoinbaseAPI
+from utils.coinbase_utils.PortfolioEngine import PortfolioEngine
+import numpy as np
+
+
+def reference_cost_basis(amounts: np.ndarray, native_amounts: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Average cost basis and cumulative realized profits computed one transaction at a time
+    """
+    held, cost, realized = 0., 0., 0.
+    cost_bases, realized_profits = [], []
+
+    for amount, native_amount in zip(amounts.tolist(), native_amounts.tolist()):
+        if amount > 0:
+            cost += native_amount
+        else:
+            sold_cost = cost*min(-amount/held, 1.) if held > 0 else cost
+            cost -= sold_cost
+            realized += -native_amount - sold_cost
+        held += amount
+        cost_bases.append(cost)
+        realized_profits.append(realized)
+
+    return np.array(cost_bases), np.array(realized_profits)
+
+
+def assert_matches_reference(amounts: np.ndarray, native_amounts: np.ndarray) -> None:
+    cost_basis, realized = PortfolioEngine.compute_cost_basis(amounts, native_amounts, np.cumsum(amounts))
+    expected_cost_basis, expected_realized = reference_cost_basis(amounts, native_amounts)
+
+    assert np.all(np.isfinite(cost_basis)) and np.all(np.isfinite(realized))
+    np.testing.assert_allclose(cost_basis, expected_cost_basis, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(realized, expected_realized, rtol=1e-9, atol=1e-9)
+
+
+def test_empty():
+    cost_basis, realized = PortfolioEngine.compute_cost_basis(np.empty(0), np.empty(0), np.empty(0))
+    assert len(cost_basis) == 0 and len(realized) == 0
+
+
+def test_buys_and_sell_outs():
+    amounts = np.array([1., 1., -0.5, -1.5, 2., -1.])
+    native_amounts = np.array([10., 20., -12., -30., 40., -25.])
+    assert_matches_reference(amounts, native_amounts)
+
+    cost_basis, realized = PortfolioEngine.compute_cost_basis(amounts, native_amounts, np.cumsum(amounts))
+    assert cost_basis[3] == 0.  # everything sold, the cost basis restarts
+    np.testing.assert_allclose(cost_basis[-1], 20.)
+
+
+def test_many_partial_sells():
+    # Alternating "sell half" and small buys, the cost basis never restarts
+    amounts, native_amounts, held = [1.], [100.], 1.
+    for index in range(3000):
+        if index % 2 == 0:
+            amounts.append(-held/2)
+            native_amounts.append(-held/2*90)
+        else:
+            amounts.append(0.01)
+            native_amounts.append(1.)
+        held += amounts[-1]
+
+    assert_matches_reference(np.array(amounts), np.array(native_amounts))
+
+
+def test_random_ledgers():
+    rng = np.random.default_rng(0)
+    for trial in range(200):
+        amounts = np.round(rng.uniform(-1., 1.5, rng.integers(1, 60)), 3)
+        amounts[amounts == 0] = 0.001
+        native_amounts = amounts*rng.uniform(5., 15., len(amounts))
+        assert_matches_reference(amounts, native_amounts)
+
+
+def test_portfolio_value_skips_coins_which_arent_held():
+    client = FakeCoinbaseClient(["BTC", "ETH"])
+    coinbase_api = CoinbaseAPI(client=client)
+    coinbase_api.account_cache.put("balances", {"BTC": 0.5, "ETH": 0.}, ttl=60)
+
+    times, coins, values = PortfolioEngine(coinbase_api).get_portfolio_value(["BTC", "ETH", "XLM"], period="week")
+    assert coins == ["BTC"] and values.shape == (1, len(times))
+    assert client.calls["get_transactions"] > 0 and set(coinbase_api.ledgers) == {"BTC"}
@@ -0,0 +1,65 @@
+from utils.coinbase_utils.PriceHistoryStore import PriceHistoryStore
+import numpy as np
+import threading
+import os
+
+
+def test_append_and_read(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    times, prices = store.read("btc", "chf")
+    assert len(times) == 0 and len(prices) == 0
+
+    assert store.append("btc", "chf", np.array([10, 20, 30]), np.array([1., 2., 3.])) == 3
+    # Only the prices newer than the newest stored one are appended
+    assert store.append("BTC", "CHF", np.array([20, 30, 40]), np.array([9., 9., 4.])) == 1
+    assert store.append("BTC", "CHF", np.array([40]), np.array([9.])) == 0
+
+    times, prices = store.read("BTC", "CHF")
+    np.testing.assert_array_equal(times, [10, 20, 30, 40])
+    np.testing.assert_array_equal(prices, [1., 2., 3., 4.])
+    assert not times.flags.writeable and not prices.flags.writeable
+
+    # The files are read again by a new store, e.g. after a restart
+    times, prices = PriceHistoryStore(str(tmp_path)).read("BTC", "CHF")
+    np.testing.assert_array_equal(times, [10, 20, 30, 40])
+
+
+def test_partial_rows_are_truncated(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    store.append("BTC", "CHF", np.array([10, 20]), np.array([1., 2.]))
+
+    # An interrupted append wrote a time and half a price beyond the complete rows
+    with open(os.path.join(str(tmp_path), "BTC-CHF.times"), "ab") as file:
+        file.write(np.array([30], dtype=np.int64).tobytes())
+    with open(os.path.join(str(tmp_path), "BTC-CHF.prices"), "ab") as file:
+        file.write(np.array([3.], dtype=np.float64).tobytes()[:4])
+
+    store = PriceHistoryStore(str(tmp_path))
+    times, prices = store.read("BTC", "CHF")
+    np.testing.assert_array_equal(times, [10, 20])  # only complete rows are read
+
+    assert store.append("BTC", "CHF", np.array([20, 30]), np.array([2., 3.5])) == 1
+    times, prices = store.read("BTC", "CHF")
+    np.testing.assert_array_equal(times, [10, 20, 30])
+    np.testing.assert_array_equal(prices, [1., 2., 3.5])
+    assert os.path.getsize(os.path.join(str(tmp_path), "BTC-CHF.prices")) == 3 * 8
+
+
+def test_concurrent_appends(tmp_path):
+    store = PriceHistoryStore(str(tmp_path))
+    times = np.arange(1, 201)
+
+    def append(offset: int):
+        for end in range(offset, len(times) + 1, 7):
+            store.append("BTC", "CHF", times[:end], times[:end].astype(np.float64))
+
+    threads = [threading.Thread(target=append, args=(offset,)) for offset in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.append("BTC", "CHF", times, times.astype(np.float64))
+
+    stored_times, stored_prices = store.read("BTC", "CHF")
+    np.testing.assert_array_equal(stored_times, times)
+    np.testing.assert_array_equal(stored_prices, times)
@@ -0,0 +1,72 @@
+from benchmarks.FakeCoinbaseClient import FakeCoinbaseClient
+from utils.coinbase_utils.CoinbaseAPI import CoinbaseAPI
+from utils.coinbase_utils.PriceStream import PriceStream, ReplayFeed
+from spike import Spike
+import numpy as np
+import time
+
+
+def start_stream(coins: list, ticks: list) -> (FakeCoinbaseClient, CoinbaseAPI, PriceStream):
+    client = FakeCoinbaseClient(coins)
+    coinbase_api = CoinbaseAPI(client=client)
+
+    feed = ReplayFeed(ticks)
+    price_stream = PriceStream(coins, feed, quote_currency="USD")
+    price_stream.seed(coinbase_api)
+    price_stream.start()
+    feed.join(5.)
+    coinbase_api.attach_price_stream(price_stream)
+    return client, coinbase_api, price_stream
+
+
+def test_historical_array_served_from_stream():
+    now = int(time.time())
+    client, coinbase_api, price_stream = start_stream(["BTC", "ETH"], [("BTC", now, 123.)])
+    fetches = client.calls["get_historic_prices"]
+
+    streamed_times, streamed_prices = price_stream.get_window("BTC", "day")
+    rate = coinbase_api.exchange_rates.get_rate("USD", "CHF")
+    times, prices = coinbase_api.get_historical_array("BTC", "day", "CHF")
+
+    # Requests in another quote currency are converted from the stream rather than fetched
+    assert client.calls["get_historic_prices"] == fetches
+    np.testing.assert_array_equal(times, streamed_times)
+    np.testing.assert_allclose(prices, streamed_prices * rate)
+    assert prices[-1] == 123. * rate and not prices.flags.writeable
+
+    # ETH never ticked, it isn't served from the stream
+    coinbase_api.get_historical_array("ETH", "day", "CHF")
+    assert client.calls["get_historic_prices"] == fetches + 1
+
+
+def test_streamed_array_is_a_snapshot():
+    now = int(time.time())
+    client, coinbase_api, price_stream = start_stream(["BTC"], [("BTC", now, 123.)])
+
+    window_times, window_prices = price_stream.get_window("BTC", "day")
+    times, prices = coinbase_api.get_historical_array("BTC", "day", "USD")
+    assert not np.shares_memory(prices, window_prices)
+
+    # A tick within the same resolution bucket rewrites the window in place, but not the served prices
+    price_stream.on_tick("BTC", now, 456.)
+    assert window_prices[-1] == 456. and prices[-1] == 123.
+
+
+def test_spike_tracks_streamed_ticks():
+    now = int(time.time())
+    client, coinbase_api, price_stream = start_stream(["BTC", "ETH"], [("BTC", now, 123.)])
+    spike = Spike(["BTC", "ETH"], coinbase_api, notification_threshold=5, max_workers=1)
+    price_stream.add_listener(spike.on_tick)
+
+    coins, changes = spike.get_changes()["day"]
+    fetches = client.calls["get_historic_prices"]
+
+    price_stream.on_tick("BTC", now + 60, 150.)
+    coins, new_changes = spike.get_changes()["day"]
+
+    # The streamed series and the tick are both converted into the quote currency of Spike (an unconverted tick would
+    # be off by the USD to CHF rate), and no series is fetched again
+    assert coinbase_api.exchange_rates.get_rate("USD", "CHF") != 1.
+    index = coins.index("BTC")
+    np.testing.assert_allclose((1 + new_changes[index] / 100) / (1 + changes[index] / 100), 150. / 123.)
+    assert client.calls["get_historic_prices"] == fetches
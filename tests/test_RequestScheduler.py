@@ -0,0 +1,124 @@
+from utils.coinbase_utils.RequestScheduler import RequestScheduler, TokenBucket, PRIORITY_INTERACTIVE, \
+    PRIORITY_ALERTS, PRIORITY_BACKGROUND
+from coinbase.wallet.error import APIError
+import threading
+import pytest
+import time
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeClient:
+    """
+    Fails with the given status codes (one per call) before succeeding, and counts its calls
+    """
+
+    def __init__(self, status_codes: list = (), headers: dict = None):
+        self.status_codes = list(status_codes)
+        self.headers = headers
+        self.calls = 0
+
+    def get_spot_price(self) -> dict:
+        self.calls += 1
+        if self.status_codes:
+            raise APIError(FakeResponse(self.status_codes.pop(0), self.headers), "error", "failed")
+        return {"amount": "1.0"}
+
+
+def blocked_scheduler(**kwargs) -> (RequestScheduler, threading.Event):
+    """
+    :return: A scheduler with a single worker, which is kept busy until the returned event is set
+    """
+    scheduler = RequestScheduler(rate=1e6, burst=1000, workers=1, **kwargs)
+    release = threading.Event()
+    scheduler.submit(("block",), release.wait)
+    return scheduler, release
+
+
+def test_coalescing():
+    scheduler, release = blocked_scheduler()
+    client = FakeClient()
+
+    futures = [scheduler.submit(("get_spot_price", "BTC-CHF"), client.get_spot_price) for _ in range(3)]
+    other = scheduler.submit(("get_spot_price", "ETH-CHF"), client.get_spot_price)
+    release.set()
+
+    assert futures[0] is futures[1] is futures[2]
+    assert futures[0].result(5) == {"amount": "1.0"} and other.result(5) == {"amount": "1.0"}
+    assert client.calls == 2 and scheduler.stats["coalesced"] == 2
+
+    # Once the request has finished, an identical request is sent again
+    scheduler.call(("get_spot_price", "BTC-CHF"), client.get_spot_price)
+    assert client.calls == 3
+
+
+@pytest.mark.parametrize("status_code", [429, 500, 503])
+def test_retries_rate_limits_and_server_errors(status_code):
+    scheduler = RequestScheduler(rate=1e6, burst=1000, workers=1, backoff=0.01)
+    client = FakeClient([status_code, status_code])
+
+    assert scheduler.call(("get_spot_price",), client.get_spot_price) == {"amount": "1.0"}
+    assert client.calls == 3 and scheduler.stats["retries"] == 2
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 404])
+def test_client_errors_are_not_retried(status_code):
+    scheduler = RequestScheduler(rate=1e6, burst=1000, workers=1, backoff=0.01)
+    client = FakeClient([status_code])
+
+    with pytest.raises(APIError):
+        scheduler.call(("get_spot_price",), client.get_spot_price)
+    assert client.calls == 1 and scheduler.stats["failures"] == 1
+
+
+def test_gives_up_after_max_retries():
+    scheduler = RequestScheduler(rate=1e6, burst=1000, workers=1, max_retries=2, backoff=0.01)
+    client = FakeClient([500] * 5)
+
+    with pytest.raises(APIError):
+        scheduler.call(("get_spot_price",), client.get_spot_price)
+    assert client.calls == 3
+
+
+def test_retry_after_is_honored():
+    scheduler = RequestScheduler(rate=1e6, burst=1000, workers=1, backoff=10., max_backoff=0.2)
+    client = FakeClient([429], headers={"Retry-After": "1"})
+
+    start = time.monotonic()
+    scheduler.call(("get_spot_price",), client.get_spot_price)
+    # Retry-After is capped at max_backoff, instead of the (much longer) exponential backoff
+    assert 0.2 <= time.monotonic() - start < 2.
+
+
+def test_priority_ordering():
+    scheduler, release = blocked_scheduler()
+    order = []
+
+    submitted = [(PRIORITY_BACKGROUND, "background"), (PRIORITY_ALERTS, "alerts 1"),
+                 (PRIORITY_INTERACTIVE, "interactive"), (PRIORITY_ALERTS, "alerts 2")]
+    futures = [scheduler.submit((name,), lambda name=name: order.append(name), priority=priority)
+               for priority, name in submitted]
+
+    # Requests made within the priority context take its priority
+    with scheduler.priority(PRIORITY_BACKGROUND):
+        futures.append(scheduler.submit(("background 2",), lambda: order.append("background 2")))
+    assert scheduler.get_priority() == PRIORITY_INTERACTIVE
+
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["interactive", "alerts 1", "alerts 2", "background", "background 2"]
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50., capacity=2)
+
+    start = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # The first 2 tokens are a burst, the other 5 are added at 50 per second
+    assert time.monotonic() - start >= 5 / 50. - 0.01
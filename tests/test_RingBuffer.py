@@ -0,0 +1,46 @@
+from utils.coinbase_utils.RingBuffer import PriceRingBuffer
+import numpy as np
+
+
+def test_append_and_window():
+    buffer = PriceRingBuffer(capacity=5, resolution=10)
+    assert len(buffer) == 0 and buffer.first_timestamp is None and buffer.last_timestamp is None
+
+    buffer.extend(np.array([0, 10, 20]), np.array([1., 2., 3.]))
+    buffer.append(15, 9.)  # older than the newest price, ignored
+    buffer.append(25, 4.)  # same resolution bucket as 20, replaces it
+
+    times, prices = buffer.view()
+    np.testing.assert_array_equal(times, [0, 10, 25])
+    np.testing.assert_array_equal(prices, [1., 2., 4.])
+
+    times, prices = buffer.window(15)
+    np.testing.assert_array_equal(times, [10, 25])
+    np.testing.assert_array_equal(prices, [2., 4.])
+
+
+def test_overwrites_oldest():
+    buffer = PriceRingBuffer(capacity=3)
+    for timestamp in range(7):
+        buffer.append(timestamp, float(timestamp))
+
+    times, prices = buffer.view()
+    assert len(buffer) == 3 and buffer.first_timestamp == 4 and buffer.last_timestamp == 6
+    np.testing.assert_array_equal(times, [4, 5, 6])
+    np.testing.assert_array_equal(buffer.view(2)[1], [5., 6.])
+
+
+def test_views_are_read_only_and_not_copied():
+    buffer = PriceRingBuffer(capacity=4)
+    buffer.extend(np.arange(6), np.arange(6.))
+    times, prices = buffer.window(2)
+
+    assert not times.flags.writeable and not prices.flags.writeable
+    assert times.flags.c_contiguous and prices.flags.c_contiguous
+
+    # The view reflects the next write, which is detected through the generation
+    generation = buffer.generation
+    snapshot = prices.copy()
+    buffer.append(5, 10.)
+    assert buffer.generation != generation
+    assert prices[-1] == 10. and snapshot[-1] == 5.
@@ -0,0 +1,62 @@
+from utils.telegram_utils.SubscriptionRegistry import SubscriptionRegistry, Subscription
+import numpy as np
+import os
+
+
+def test_evaluate_thresholds_per_chat():
+    registry = SubscriptionRegistry(["BTC", "ETH", "XLM"])
+    registry.subscribe(Subscription(1, None, notification_threshold=5, day_threshold=10, week_threshold=20))
+    registry.subscribe(Subscription(2, ["btc", "xlm"], notification_threshold=5, day_threshold=3, week_threshold=3))
+
+    # Unknown coins and NaN changes are ignored
+    alerts = registry.evaluate("day", ["BTC", "ETH", "XLM", "DOGE"], np.array([12., -4., np.nan, 50.]))
+    assert alerts == {1: [("BTC", 12.)], 2: [("BTC", 12.)]}
+
+    # The week thresholds apply to week changes, alerts are sorted by decreasing change
+    alerts = registry.evaluate("week", ["BTC", "ETH", "XLM"], np.array([-25., 21., 6.]))
+    assert alerts == {1: [("ETH", 21.), ("BTC", -25.)], 2: [("XLM", 6.), ("BTC", -25.)]}
+
+
+def test_notified_state_per_period():
+    registry = SubscriptionRegistry(["BTC"])
+    registry.subscribe(Subscription(1, None, notification_threshold=5, day_threshold=10, week_threshold=10))
+
+    assert registry.evaluate("day", ["BTC"], np.array([12.])) == {1: [("BTC", 12.)]}
+    # Not alerted again until the change moved by more than the notification threshold since the last alert
+    assert registry.evaluate("day", ["BTC"], np.array([16.])) == {}
+    assert registry.evaluate("day", ["BTC"], np.array([18.])) == {1: [("BTC", 18.)]}
+    assert registry.evaluate("day", ["BTC"], np.array([18.]), ignore_previous=True) == {1: [("BTC", 18.)]}
+
+    # Every period keeps its own notifications
+    assert registry.evaluate("week", ["BTC"], np.array([12.])) == {1: [("BTC", 12.)]}
+
+    # Resubscribing keeps the notifications, unsubscribing drops them
+    registry.subscribe(Subscription(1, ["BTC"], notification_threshold=5, day_threshold=10, week_threshold=10))
+    assert registry.evaluate("day", ["BTC"], np.array([18.])) == {}
+    assert registry.unsubscribe(1) and not registry.unsubscribe(1)
+    registry.subscribe(Subscription(1, ["BTC"], notification_threshold=5, day_threshold=10, week_threshold=10))
+    assert registry.evaluate("day", ["BTC"], np.array([18.])) == {1: [("BTC", 18.)]}
+
+
+def test_save_and_load_with_changed_coins(tmp_path):
+    file_name = os.path.join(str(tmp_path), "subscriptions.npz")
+    registry = SubscriptionRegistry(["BTC", "ETH", "XLM"], file_name)
+    registry.subscribe(Subscription(1, None, notification_threshold=5, day_threshold=10, week_threshold=20))
+    registry.subscribe(Subscription(2, ["ETH", "XLM"], notification_threshold=1, day_threshold=2, week_threshold=3))
+    registry.evaluate("day", ["BTC", "ETH", "XLM"], np.array([11., 12., 13.]))
+    registry.save()
+
+    # XLM is no longer tracked and ADA is new
+    loaded = SubscriptionRegistry(["ADA", "ETH", "BTC"], file_name)
+    assert len(loaded) == 2
+
+    subscription = loaded.get(1)
+    assert subscription.coins is None and subscription.get_threshold("week") == 20
+    subscription = loaded.get(2)
+    assert subscription.coins == ["ETH"] and subscription.notification_threshold == 1
+
+    # Previous notifications are kept for the coins which are still tracked, only chat 1 subscribed to the new coin
+    alerts = loaded.evaluate("day", ["ADA", "ETH", "BTC"], np.array([11., 12., 11.]))
+    assert alerts == {1: [("ADA", 11.)]}
+    assert loaded.evaluate("week", ["ADA", "ETH", "BTC"], np.array([30., 30., 30.])) == \
+        {1: [("ADA", 30.), ("ETH", 30.), ("BTC", 30.)], 2: [("ETH", 30.)]}
@@ -0,0 +1,64 @@
+from utils.coinbase_utils.TTLCache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_expiry():
+    clock = Clock()
+    cache = TTLCache(default_ttl=10., clock=clock)
+    cache.put("default", 1)
+    cache.put("short", 2, ttl=1.)
+
+    clock.now += 0.5
+    assert cache.get("default") == 1 and cache.get("short") == 2
+
+    clock.now += 0.5  # an entry expires once its time to live has passed
+    assert cache.get("short") is None
+    assert cache.get("default") == 1
+
+    clock.now += 9.
+    assert cache.get("default", "expired") == "expired"
+    assert len(cache) == 0  # expired entries are dropped when they are looked up
+
+
+def test_lru_eviction():
+    cache = TTLCache(max_size=2, clock=Clock())
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")  # "b" is now the least recently used entry
+    cache.put("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_stats():
+    cache = TTLCache(clock=Clock())
+    assert cache.get_stats() == {"hits": 0, "misses": 0, "size": 0, "hit_rate": 0.}
+
+    loads = []
+    for _ in range(3):
+        assert cache.get_or_load("key", lambda: loads.append(1) or "value") == "value"
+    cache.get("missing")
+
+    assert len(loads) == 1
+    assert cache.get_stats() == {"hits": 2, "misses": 2, "size": 1, "hit_rate": 0.5}
+
+
+def test_invalidate():
+    cache = TTLCache(clock=Clock())
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    cache.invalidate("a")
+    assert cache.get("a") is None and cache.get("b") == 2
+
+    cache.invalidate()
+    assert len(cache) == 0
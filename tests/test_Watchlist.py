@@ -0,0 +1,66 @@
+from benchmarks.FakeCoinbaseClient import FakeCoinbaseClient
+from utils.coinbase_utils.CoinbaseAPI import CoinbaseAPI
+from utils.coinbase_utils.PriceGraph import PriceGraph
+from utils.coinbase_utils.Watchlist import Watchlist, generate_color
+import utils.coinbase_utils.GlobalStatics as statics
+import pytest
+import json
+import os
+
+
+def write_config(tmp_path, config: dict) -> str:
+    file_name = os.path.join(str(tmp_path), "watchlist.json")
+    with open(file_name, "w") as file:
+        json.dump(config, file)
+    return file_name
+
+
+def test_coins_and_colors():
+    watchlist = Watchlist(["btc", "ETH", "BTC", "NEWCOIN"], colors={"eth": "white"}, graph_size=2)
+
+    assert watchlist.coins == ["BTC", "ETH", "NEWCOIN"] and len(watchlist) == 3
+    assert "newcoin" in watchlist and "XLM" not in watchlist
+    assert watchlist.graph_coins == ["BTC", "ETH"]
+
+    # Colors come from the config, then GlobalStatics, then the coin code, generated colors don't depend on the list
+    assert watchlist.colors["ETH"] == "white" and watchlist.colors["BTC"] == statics.COLORS["BTC"]
+    assert watchlist.colors["NEWCOIN"] == generate_color("newcoin") == Watchlist(["NEWCOIN"]).colors["NEWCOIN"]
+    assert generate_color("NEWCOIN").startswith("#") and len(generate_color("NEWCOIN")) == 7
+
+    # Graph coins which aren't watched are dropped
+    assert Watchlist(["BTC", "ETH"], graph_coins=["eth", "XLM"]).graph_coins == ["ETH"]
+
+
+def test_load(tmp_path):
+    file_name = write_config(tmp_path, {"coins": ["BTC", "ETH", "XLM"], "max_coins": 2, "colors": {"BTC": "red"}})
+    watchlist = Watchlist.load(file_name)
+    assert watchlist.coins == ["BTC", "ETH"] and watchlist.colors["BTC"] == "red"
+
+    # Without coins, the coins listed on coinbase (but no fiat currencies) are watched
+    file_name = write_config(tmp_path, {"graph_coins": ["ETH"]})
+    with pytest.raises(ValueError):
+        Watchlist.load(file_name)
+    watchlist = Watchlist.load(file_name, CoinbaseAPI(client=FakeCoinbaseClient(["XLM", "BTC", "ETH"])))
+    assert watchlist.coins == ["BTC", "ETH", "XLM"] and watchlist.graph_coins == ["ETH"]
+
+
+class UnquotedCoinClient(FakeCoinbaseClient):
+    """
+    Has no prices of UNQUOTED, like coinbase for coins which aren't quoted in the quote currency
+    """
+
+    def get_historic_prices(self, currency_pair: str, period: str = "day", **params):
+        if currency_pair.startswith("UNQUOTED-"):
+            raise ValueError("No prices for " + currency_pair)
+        return super().get_historic_prices(currency_pair, period, **params)
+
+
+def test_graph_skips_coins_without_prices():
+    coins = ["BTC", "UNQUOTED", "ETH", "XLM"]
+    price_graph = PriceGraph(CoinbaseAPI(client=UnquotedCoinClient(coins)), currencies=Watchlist(coins).graph_coins)
+
+    graph_coins, times, prices = price_graph.get_price_matrix("week")
+    assert graph_coins == ["BTC", "ETH", "XLM"] and prices.shape == (3, len(times))
+
+    rendered = price_graph.get_normalised_graph("week")
+    assert len(rendered.image_bytes) > 0
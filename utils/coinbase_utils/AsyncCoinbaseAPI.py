@@ -0,0 +1,166 @@
+from concurrent.futures import ThreadPoolExecutor
+from utils.coinbase_utils.CoinbaseAPI import CoinbaseAPI
+from utils.coinbase_utils.RequestScheduler import PRIORITY_INTERACTIVE
+import utils.coinbase_utils.GlobalStatics as statics
+import numpy as np
+import contextlib
+import contextvars
+import asyncio
+
+# Priority of the requests made by the current task, the asyncio counterpart of RequestScheduler.priority
+_priority = contextvars.ContextVar("coinbase_request_priority", default=PRIORITY_INTERACTIVE)
+
+
+class AsyncCoinbaseAPI:
+    """
+    This class wraps a CoinbaseAPI object for use from an asyncio event loop. Caching, rate limiting and request
+    coalescing are those of the wrapped CoinbaseAPI.
+
+    Single requests (historic and spot prices) are submitted to the request scheduler and their futures are awaited,
+    such that a coroutine waiting for coinbase doesn't hold a thread. Calls which make several dependent requests
+    (account balances, ledgers, etc.) or read from an attached price stream or history store are run with run, on a
+    small thread pool, and hold one of its threads while they wait.
+
+    Use this class to access coinbase from coroutines, e.g. to prefetch the prices of a graph in AsyncTelegramBot.
+    """
+
+    def __init__(self, coinbase_api: CoinbaseAPI, executor: ThreadPoolExecutor = None):
+        """
+        :param coinbase_api: The CoinbaseAPI object whose methods are called
+        :param executor: Thread pool running the blocking calls, by default one thread per request scheduler worker
+        """
+        self.coinbase_api = coinbase_api
+        self.executor = executor
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=coinbase_api.scheduler.workers,
+                                               thread_name_prefix="async-coinbase")
+
+    @staticmethod
+    @contextlib.contextmanager
+    def priority(priority: int):
+        """
+        Context manager which sets the priority of all requests made by the current task within the context
+
+        :param priority: One of the priorities defined in RequestScheduler
+        """
+        token = _priority.set(priority)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    async def request(self, method: str, *args, **kwargs):
+        """
+        Calls a method of the coinbase client through the request scheduler without blocking the event loop or a
+        thread, see CoinbaseAPI.request
+
+        :param method: Name of the client method (get_spot_price, get_historic_prices, etc.)
+        :param args: Positional arguments of the method
+        :param kwargs: Keyword arguments of the method
+        :return: The result of the method
+        """
+        with self.coinbase_api.request_priority(_priority.get()):
+            future = self.coinbase_api.submit_request(method, *args, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Runs a blocking function which accesses coinbase (a CoinbaseAPI method, Spike.get_spike_alerts, etc.) on the
+        thread pool, with the request priority of the calling task
+
+        :param function: The blocking function
+        :param args: Positional arguments of the function
+        :param kwargs: Keyword arguments of the function
+        :return: The result of the function
+        """
+        priority = _priority.get()
+
+        def call():
+            with self.coinbase_api.request_priority(priority):
+                return function(*args, **kwargs)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def get_historical_array(self, coin: str, period: str = "day", quote_currency: str = statics.QUOTE_CURRENCY)\
+            -> (np.ndarray, np.ndarray):
+        """
+        See CoinbaseAPI.get_historical_array. Prices which are neither cached nor served by a price stream or history
+        store are requested without holding a thread.
+        """
+        coinbase_api = self.coinbase_api
+        history_store = coinbase_api.history_store
+        if coinbase_api.price_stream is not None or (history_store is not None
+                                                     and period in history_store.persisted_periods):
+            return await self.run(coinbase_api.get_historical_array, coin, period, quote_currency)
+
+        key = (coin.upper(), quote_currency.upper(), period)
+        cached = coinbase_api.historical_cache.get(key)
+        if cached is not None:
+            return cached
+
+        historic = await self.request("get_historic_prices", currency_pair=coin + "-" + quote_currency, period=period)
+        series = CoinbaseAPI.parse_historic_prices(historic)
+        coinbase_api.historical_cache.put(key, series, ttl=statics.HISTORICAL_TTL.get(period))
+        return series
+
+    async def get_price_matrix(self, coins: list, period: str = "day", quote_currency: str = statics.QUOTE_CURRENCY)\
+            -> (np.ndarray, np.ndarray):
+        """
+        See CoinbaseAPI.get_price_matrix, the prices of all coins are fetched concurrently
+        """
+        series = await asyncio.gather(*[self.get_historical_array(coin, period, quote_currency) for coin in coins])
+        return CoinbaseAPI.build_price_matrix(list(series))
+
+    async def get_spot_price(self, coin: str, quote_currency: str = statics.QUOTE_CURRENCY) -> float:
+        """
+        See CoinbaseAPI.get_spot_price
+        """
+        currency_pair = coin.upper() + "-" + quote_currency.upper()
+        return float((await self.request("get_spot_price", currency_pair=currency_pair)).get("amount"))
+
+    async def get_spot_prices(self, coins: list, quote_currency: str = statics.QUOTE_CURRENCY) -> dict:
+        """
+        See CoinbaseAPI.get_spot_prices
+        """
+        exchange_rates = await self.request("get_exchange_rates", currency=quote_currency.upper())
+        return CoinbaseAPI.parse_spot_prices(exchange_rates, coins)
+
+    async def get_account_balance(self, currencies: list) -> dict:
+        """
+        See CoinbaseAPI.get_account_balance
+        """
+        return await self.run(self.coinbase_api.get_account_balance, currencies)
+
+    async def get_ledger(self, coin: str):
+        """
+        See CoinbaseAPI.get_ledger
+        """
+        return await self.run(self.coinbase_api.get_ledger, coin)
+
+    async def get_transaction_history(self, coin: str) -> [(float, str)]:
+        """
+        See CoinbaseAPI.get_transaction_history
+        """
+        return await self.run(self.coinbase_api.get_transaction_history, coin)
+
+    async def simulate_sell(self, coin: str, sell_amount: float, profits_currency: str = "CHF",
+                            method: str = "fifo"):
+        """
+        See CoinbaseAPI.simulate_sell
+        """
+        return await self.run(self.coinbase_api.simulate_sell, coin=coin, sell_amount=sell_amount,
+                              profits_currency=profits_currency, method=method)
+
+    async def get_coin_sell_profitability(self, coin: str, sell_amount: float, profits_currency: str = "CHF",
+                                          method: str = "fifo") -> float:
+        """
+        See CoinbaseAPI.get_coin_sell_profitability
+        """
+        return await self.run(self.coinbase_api.get_coin_sell_profitability, coin=coin, sell_amount=sell_amount,
+                              profits_currency=profits_currency, method=method)
+
+    def shutdown(self) -> None:
+        """
+        Stops the thread pool
+        """
+        self.executor.shutdown(wait=False)
@@ -1,5 +1,16 @@
 from coinbase.wallet.client import Client
+from utils.coinbase_utils.TTLCache import TTLCache
+from utils.coinbase_utils.RequestScheduler import RequestScheduler
+from utils.coinbase_utils.HTTPTransport import HTTPTransport
+from utils.coinbase_utils.TransactionLedger import TransactionLedger
+from utils.coinbase_utils.ExchangeRateService import ExchangeRateService
+from utils.coinbase_utils.CostBasisEngine import CostBasisEngine, SellSimulation
+from utils.coinbase_utils.MetricsRegistry import metrics
+import utils.coinbase_utils.GlobalStatics as statics
+import numpy as np
+import threading
 import json
+import time
 import os
 
 
@@ -11,14 +22,23 @@ class CoinbaseAPI:
     Use this class to authenticate coinbase API access and retrieve raw information related to currencies and profiles.
     """
 
-    def __init__(self, *args):
+    def __init__(self, *args, transport: HTTPTransport = None, client: Client = None,
+                 scheduler: RequestScheduler = None):
         """
         Constructor which builds and api wrapper object
         :param args: Can take in a maximum of 2 arguments which are the api key and secret respectively
+        :param transport: HTTPTransport used by the client, by default one pooled connection per scheduler worker
+        :param client: Client used instead of one built from the keys (e.g. a stand-in for benchmarks), no keys are
+                       needed and the client keeps its own transport
+        :param scheduler: RequestScheduler through which requests are made, by default one with coinbase's rate limit
         """
 
+        # Case when user passes in a client, which is already authenticated (or doesn't need to be)
+        if client is not None and len(args) == 0:
+            key, secret = None, None
+
         # Case when user passes in path to API json file
-        if len(args) == 1:
+        elif len(args) == 1:
             api_file = open(args[0])  # Open file containing coinbase API keys
             api_key_dict = json.load(api_file)
             key, secret = api_key_dict["key"], api_key_dict["secret"]
@@ -31,38 +51,392 @@ class CoinbaseAPI:
 
         self.key = key
         self.secret = secret
-        self.client = Client(key, secret)
 
-    def get_historical(self, coin: str, period: str = "day") -> (list, list):
+        # Every request to coinbase goes through the scheduler, which rate limits, prioritizes, retries and coalesces
+        # them
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+
+        # Keep-alive connections with timeouts, such that a stalled socket can't block a request forever
+        self.transport = transport if transport is not None else HTTPTransport(pool_size=self.scheduler.workers)
+        if client is None:
+            self.client = Client(key, secret)
+            self.transport.mount(self.client)
+        else:
+            self.client = client
+
+        # Historic prices are shared between the scheduler (spike alerts) and the Telegram dispatcher (graphs)
+        self.historical_cache = TTLCache(max_size=statics.HISTORICAL_CACHE_SIZE)
+        self.account_cache = TTLCache(max_size=1)
+
+        # Optional stream of live prices, recent historic prices are served from it instead of polling coinbase
+        self.price_stream = None
+
+        # Optional on-disk store of historic prices, long periods are read from it and only the missing tail is fetched
+        self.history_store = None
+
+        # Local copies of the transactions of every account, synced incrementally
+        self.ledgers = {}
+        self.__ledgers_lock = threading.Lock()
+
+        # Exchange rate tables, fetched once per time bucket and shared by all rate lookups
+        self.exchange_rates = ExchangeRateService(self)
+
+        # Open lots of every coin, matched against proposed sells
+        self.cost_basis = CostBasisEngine(self)
+
+        metrics.register_collector("coinbase", self.get_metrics)
+
+    def request(self, method: str, *args, **kwargs):
+        """
+        Calls a method of the coinbase client through the request scheduler. Identical calls which are made while one
+        is already queued or in flight share its result.
+
+        :param method: Name of the client method (get_spot_price, get_historic_prices, etc.)
+        :param args: Positional arguments of the method
+        :param kwargs: Keyword arguments of the method
+        :return: The result of the method
+        """
+        key = (method, args, tuple(sorted(kwargs.items())))
+        return self.scheduler.call(key, lambda: self.__call_client(method, args, kwargs))
+
+    def submit_request(self, method: str, *args, **kwargs):
+        """
+        Same as request, but returns without waiting for the result, such that several requests can be in flight
+
+        :param method: Name of the client method (get_spot_price, get_historic_prices, etc.)
+        :param args: Positional arguments of the method
+        :param kwargs: Keyword arguments of the method
+        :return: concurrent.futures.Future of the result of the method
+        """
+        key = (method, args, tuple(sorted(kwargs.items())))
+        return self.scheduler.submit(key, lambda: self.__call_client(method, args, kwargs))
+
+    def __call_client(self, method: str, args: tuple, kwargs: dict):
+        """
+        Calls a method of the coinbase client, timing every attempt and counting the errors per method
+        """
+        start = time.perf_counter()
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        except Exception as exception:
+            metrics.increment("coinbase_errors_total", method=method,
+                              status=getattr(exception, "status_code", None) or type(exception).__name__)
+            raise
+        finally:
+            metrics.observe("coinbase_request_seconds", time.perf_counter() - start, method=method)
+
+    def get_metrics(self) -> dict:
+        """
+        :return: Dictionary of the cache, scheduler and connection statistics, exported by the metrics registry
+        """
+        return {"coinbase_historical_cache_hits": self.historical_cache.hits,
+                "coinbase_historical_cache_misses": self.historical_cache.misses,
+                "coinbase_account_cache_hits": self.account_cache.hits,
+                "coinbase_account_cache_misses": self.account_cache.misses,
+                "coinbase_exchange_rate_tables": len(self.exchange_rates),
+                **{"coinbase_scheduler_" + stat: value for stat, value in self.scheduler.stats.items()},
+                **{"coinbase_transport_" + stat: value for stat, value in self.transport.get_stats().items()}}
+
+    def request_priority(self, priority: int):
+        """
+        Context manager which sets the priority of all requests made by the current thread within the context
+
+        :param priority: One of the priorities defined in RequestScheduler (PRIORITY_INTERACTIVE by default)
+        """
+        return self.scheduler.priority(priority)
+
+    def attach_history_store(self, history_store) -> None:
+        """
+        Serves the periods persisted by a PriceHistoryStore from disk, fetching only prices newer than the stored ones
+
+        :param history_store: A PriceHistoryStore, None detaches the current store
+        """
+        self.history_store = history_store
+        self.historical_cache.invalidate()
+
+    def attach_price_stream(self, price_stream) -> None:
+        """
+        Serves historic prices from a PriceStream whenever the stream covers the requested coin and period
+
+        :param price_stream: A seeded and started PriceStream, None detaches the current stream
+        """
+        self.price_stream = price_stream
+
+    def get_historical(self, coin: str, period: str = "day", quote_currency: str = statics.QUOTE_CURRENCY)\
+            -> (list, list):
         """
         calls get_historical_prices to construct price and time arrays over the given period for the given coin.
+        Results are cached for a period dependant amount of time (see GlobalStatics.HISTORICAL_TTL).
 
         :param coin: coin for which data is fetched
         :param period: period for which data is fetched ("hour","day", "week", "month", "all")
+        :param quote_currency: currency in which the prices are expressed (CHF by default)
         :return: returns times and price lists respectively
         """
-        historic = self.client.get_historic_prices(currency_pair=coin + "-CHF", period=period)
+        times, prices = self.get_historical_array(coin, period, quote_currency)
+        return np.datetime_as_string(times, unit="s", timezone="UTC").tolist(), prices.tolist()
 
-        prices, times = [], []
-        for price_dict in historic["prices"]:
-            times.append((price_dict["time"]))
-            prices.append(float(price_dict["price"]))
-        prices.reverse()
-        times.reverse()
+    def get_historical_array(self, coin: str, period: str = "day", quote_currency: str = statics.QUOTE_CURRENCY)\
+            -> (np.ndarray, np.ndarray):
+        """
+        Same as get_historical, but returns NumPy arrays. The arrays are shared with the cache and are read-only.
+        If a price stream is attached and covers the period, the prices are taken from the stream instead (see
+        get_streamed_array). Periods persisted by an attached history store are read from disk.
+
+        :param coin: coin for which data is fetched
+        :param period: period for which data is fetched ("hour","day", "week", "month", "all")
+        :param quote_currency: currency in which the prices are expressed (CHF by default)
+        :return: returns datetime64 times and float64 prices respectively, ordered from oldest to newest
+        """
+        streamed = self.get_streamed_array(coin, period, quote_currency)
+        if streamed is not None:
+            return streamed
+
+        key = (coin.upper(), quote_currency.upper(), period)
+        ttl = statics.HISTORICAL_TTL.get(period)
+
+        history_store = self.history_store
+        if history_store is not None and period in history_store.persisted_periods:
+            return self.historical_cache.get_or_load(
+                key, lambda: self.__load_persisted_historical(history_store, coin, period, quote_currency), ttl=ttl)
+
+        return self.historical_cache.get_or_load(key, lambda: self.__fetch_historical(coin, period, quote_currency),
+                                                 ttl=ttl)
+
+    def get_stream_rate(self, quote_currency: str) -> float:
+        """
+        :param quote_currency: Currency in which streamed prices are requested
+        :return: The value of 1 unit of the quote currency of the attached price stream expressed as quote_currency,
+                 None if no stream is attached or coinbase has no rate between the currencies
+        """
+        price_stream = self.price_stream
+        if price_stream is None:
+            return None
+        if price_stream.quote_currency == quote_currency.upper():
+            return 1.
+
+        try:
+            return self.exchange_rates.get_rate(price_stream.quote_currency, quote_currency)
+        except KeyError:
+            return None
+
+    def get_streamed_array(self, coin: str, period: str = "day", quote_currency: str = statics.QUOTE_CURRENCY)\
+            -> (np.ndarray, np.ndarray):
+        """
+        Gets historic prices from the attached price stream. The exchange feed only lists a few quote currencies, prices
+        requested in another one are converted at the current rate (see get_stream_rate), fiat rates move little over
+        the streamed periods compared to the prices of coins.
+
+        The window is copied once out of the ring buffer of the stream, the copy is retried if a tick was written to the
+        buffer meanwhile, such that the arrays are a consistent snapshot which later ticks don't change.
+
+        :param coin: coin for which data is fetched
+        :param period: period for which data is fetched ("hour","day", "week")
+        :param quote_currency: currency in which the prices are expressed (CHF by default)
+        :return: returns read-only datetime64 times and float64 prices respectively, ordered from oldest to newest, or
+                 None if no stream is attached or it doesn't cover the coin and period
+        """
+        price_stream = self.price_stream
+        if price_stream is None:
+            return None
+        rate = self.get_stream_rate(quote_currency)
+        if rate is None:
+            return None
+
+        for _ in range(3):
+            generation = price_stream.get_generation(coin)
+            streamed = price_stream.get_window(coin, period)
+            if streamed is None:
+                return None
+
+            times, prices = streamed[0].copy(), streamed[1] * rate
+            if price_stream.get_generation(coin) == generation:
+                times.flags.writeable = False
+                prices.flags.writeable = False
+                return times, prices
+        return None  # ticks keep arriving while copying, fetch the prices instead
+
+    def __load_persisted_historical(self, history_store, coin: str, period: str, quote_currency: str)\
+            -> (np.ndarray, np.ndarray):
+        """
+        Reads historic prices from the history store after appending the prices which are missing from it. The tail is
+        fetched using the shortest coinbase period which covers it, the full history is only fetched if nothing is
+        stored.
+
+        :param history_store: The PriceHistoryStore holding the prices
+        :param coin: coin for which data is fetched
+        :param period: period for which data is fetched ("month", "year", "all")
+        :param quote_currency: currency in which the prices are expressed
+        :return: returns read-only datetime64 times and float64 prices respectively, ordered from oldest to newest
+        """
+        times, prices = history_store.read(coin, quote_currency)
+        now = int(time.time())
+
+        if len(times) == 0:
+            # Seed the store with the full history, its end replaced by the finer resolution of the shortest period
+            tail_times, tail_prices = self.__fetch_historical(coin, "all", quote_currency)
+            finest = min([period for period in history_store.persisted_periods if period in statics.PERIOD_SECONDS],
+                         key=statics.PERIOD_SECONDS.get, default=None)
+            if finest is not None:
+                period_times, period_prices = self.__fetch_historical(coin, finest, quote_currency)
+                if len(period_times):
+                    keep = tail_times < period_times[0]
+                    tail_times = np.concatenate([tail_times[keep], period_times])
+                    tail_prices = np.concatenate([tail_prices[keep], period_prices])
+
+        # Skip fetching if the newest stored price is younger than the time the period is cached for anyway
+        elif now - int(times[-1]) > statics.HISTORICAL_TTL.get(period, 0):
+            missing = now - int(times[-1])
+            tail_period = next((tail_period for tail_period in ["hour", "day", "week", "month", "year"]
+                                if statics.PERIOD_SECONDS[tail_period] >= missing), "all")
+            tail_times, tail_prices = self.__fetch_historical(coin, tail_period, quote_currency)
+        else:
+            tail_times = None
+
+        if tail_times is not None and history_store.append(coin, quote_currency, tail_times.astype(np.int64),
+                                                           tail_prices):
+            times, prices = history_store.read(coin, quote_currency)
+
+        if period in statics.PERIOD_SECONDS:
+            start = np.searchsorted(times, now - statics.PERIOD_SECONDS[period], side="left")
+            times, prices = times[start:], prices[start:]
+
+        return times.view("datetime64[s]"), prices
+
+    def __fetch_historical(self, coin: str, period: str, quote_currency: str) -> (np.ndarray, np.ndarray):
+        """
+        Fetches historic prices from coinbase, bypassing the cache
+
+        :param coin: coin for which data is fetched
+        :param period: period for which data is fetched ("hour","day", "week", "month", "all")
+        :param quote_currency: currency in which the prices are expressed
+        :return: returns read-only datetime64 times and float64 prices respectively, ordered from oldest to newest
+        """
+        historic = self.request("get_historic_prices", currency_pair=coin + "-" + quote_currency, period=period)
+        return self.parse_historic_prices(historic)
+
+    @staticmethod
+    def parse_historic_prices(historic: dict) -> (np.ndarray, np.ndarray):
+        """
+        :param historic: Response of the coinbase historic prices endpoint
+        :return: returns read-only datetime64 times and float64 prices respectively, ordered from oldest to newest
+        """
+        # Coinbase returns the newest price first, reverse such that time increases with the index
+        price_dicts = historic["prices"][::-1]
+        times = np.array([price_dict["time"].rstrip("Z") for price_dict in price_dicts], dtype="datetime64[s]")
+        prices = np.array([price_dict["price"] for price_dict in price_dicts], dtype=np.float64)
+
+        times.flags.writeable = False
+        prices.flags.writeable = False
         return times, prices
 
+    def get_price_matrix(self, coins: list, period: str = "day", quote_currency: str = statics.QUOTE_CURRENCY)\
+            -> (np.ndarray, np.ndarray):
+        """
+        Fetches the historic prices of several coins and aligns them on a single time axis.
+
+        :param coins: coins for which data is fetched
+        :param period: period for which data is fetched ("hour","day", "week", "month", "all")
+        :param quote_currency: currency in which the prices are expressed (CHF by default)
+        :return: datetime64 time axis and a (coins x timestamps) price matrix respectively
+        """
+        return self.build_price_matrix([self.get_historical_array(coin, period, quote_currency) for coin in coins])
+
+    @staticmethod
+    def build_price_matrix(series: list) -> (np.ndarray, np.ndarray):
+        """
+        Aligns several price series on the time axis of the longest series. Series with different timestamps are
+        linearly interpolated onto that axis (and clamped to their first/last price outside of their range).
+
+        :param series: List of (times, prices) array tuples as returned by get_historical_array
+        :return: datetime64 time axis and a (len(series) x timestamps) price matrix respectively
+        """
+        if len(series) == 0:
+            return np.array([], dtype="datetime64[s]"), np.empty((0, 0))
+
+        time_axis = max((times for times, prices in series), key=len)
+
+        # Fast path, coinbase usually returns the same timestamps for every coin
+        if all(np.array_equal(times, time_axis) for times, prices in series):
+            return time_axis, np.vstack([prices for times, prices in series])
+
+        axis_seconds = time_axis.astype(np.int64)
+        matrix = np.vstack([np.interp(axis_seconds, times.astype(np.int64), prices) for times, prices in series])
+        return time_axis, matrix
+
     def get_price_change(self, coin: str, period: str = "day") -> float:
         """
-        calculates percentage change for a coin over the past hour.
+        calculates percentage change for a coin over the given period.
 
         :param coin: the coin for which the percentage is calculated
         :param period: the period for which the price change is calculated.
-        :return: percentage change over the past hour
+        :return: percentage change over the period
         """
-        times, prices = self.get_historical(coin, period=period)
-        diff = prices[-1] - prices[0]
-        relative_diff = diff / prices[0]
-        return float(relative_diff*100)
+        times, prices = self.get_historical_array(coin, period=period)
+        return float(100 * (prices[-1] / prices[0] - 1))
+
+    @staticmethod
+    def get_price_changes(prices: np.ndarray) -> np.ndarray:
+        """
+        calculates the percentage change of every row of a price matrix (as returned by get_price_matrix).
+
+        :param prices: (coins x timestamps) price matrix
+        :return: array of percentage changes between the first and last price of every coin
+        """
+        return 100 * (prices[:, -1] / prices[:, 0] - 1)
+
+    def get_spot_price(self, coin: str, quote_currency: str = statics.QUOTE_CURRENCY) -> float:
+        """
+        Gets the current price of a coin
+
+        :param coin: coin whose price is fetched
+        :param quote_currency: currency in which the price is expressed (CHF by default)
+        :return: The price of 1 coin expressed in quote_currency
+        """
+        currency_pair = coin.upper() + "-" + quote_currency.upper()
+        return float(self.request("get_spot_price", currency_pair=currency_pair).get("amount"))
+
+    def get_spot_prices(self, coins: list, quote_currency: str = statics.QUOTE_CURRENCY) -> dict:
+        """
+        Gets the current price of several coins with a single request, using the exchange rates of the quote currency
+
+        :param coins: coins whose prices are fetched
+        :param quote_currency: currency in which the prices are expressed (CHF by default)
+        :return: Dictionary of coin, price pairs. Coins without an exchange rate are left out
+        """
+        return self.parse_spot_prices(self.request("get_exchange_rates", currency=quote_currency.upper()), coins)
+
+    @staticmethod
+    def parse_spot_prices(exchange_rates: dict, coins: list) -> dict:
+        """
+        :param exchange_rates: Response of the coinbase exchange rates endpoint for the quote currency
+        :param coins: coins whose prices are returned
+        :return: Dictionary of coin, price pairs. Coins without an exchange rate are left out
+        """
+        rates = exchange_rates["rates"]
+
+        # The rates express how much of a coin 1 unit of the quote currency buys
+        prices = {}
+        for coin in coins:
+            rate = float(rates.get(coin.upper(), 0))
+            if rate > 0:
+                prices[coin.upper()] = 1 / rate
+        return prices
+
+    def get_listed_coins(self, quote_currency: str = statics.QUOTE_CURRENCY) -> list:
+        """
+        Gets the coins listed on coinbase which have a price in the quote currency, i.e. every currency of the exchange
+        rates of the quote currency which isn't a fiat currency
+
+        :param quote_currency: currency in which the coins have to be priced (CHF by default)
+        :return: Sorted list of coin codes (BTC, XLM, etc.)
+        """
+        rates = self.request("get_exchange_rates", currency=quote_currency.upper())["rates"]
+        fiat_currencies = {currency["id"].upper() for currency in self.request("get_currencies").get("data", [])}
+
+        return sorted(coin.upper() for coin, rate in rates.items()
+                      if coin.upper() not in fiat_currencies and coin.upper() != quote_currency.upper()
+                      and float(rate) > 0)
 
     def get_account_balance(self, currencies: list) -> dict:
         """
@@ -71,13 +445,63 @@ class CoinbaseAPI:
         :param currencies: A list of crypto codes (BTC, XLM, etc.)
         :return: Dictionary of currency, balance pairs
         """
-        accounts = []
-        for coin in currencies:
-            accounts.append(self.client.get_account(coin))
+        all_balances = self.get_all_account_balances()
 
-        balances = {account["balance"]["currency"]: float(account["balance"]["amount"]) for account in accounts}
+        # Currencies without an account are left out
+        balances = {coin.upper(): all_balances[coin.upper()] for coin in currencies if coin.upper() in all_balances}
         return balances
 
+    def get_all_account_balances(self) -> dict:
+        """
+        Retrieves the balance of every account of the user. The balances are fetched in a single paginated sweep over
+        all accounts and cached for GlobalStatics.BALANCE_TTL seconds.
+
+        :return: Dictionary of currency, balance pairs
+        """
+        return self.account_cache.get_or_load("balances", self.__fetch_all_account_balances, ttl=statics.BALANCE_TTL)
+
+    def __fetch_all_account_balances(self) -> dict:
+        """
+        Fetches the balance of every account from coinbase, following the pagination until all accounts are retrieved
+
+        :return: Dictionary of currency, balance pairs
+        """
+        balances = {}
+        params = {"limit": 100}
+
+        while True:
+            accounts = self.request("get_accounts", **params)
+
+            # A currency can have several accounts (wallets, vaults), their balances are summed up
+            for account in accounts.get("data", []):
+                currency = account["balance"]["currency"]
+                balances[currency] = balances.get(currency, 0.) + float(account["balance"]["amount"])
+
+            pagination = accounts.pagination
+            if not pagination or not pagination.get("next_starting_after"):
+                break
+            params["starting_after"] = pagination["next_starting_after"]
+
+        return balances
+
+    def get_ledger(self, coin: str) -> TransactionLedger:
+        """
+        Gets the transaction ledger of an account. The ledger is synced with coinbase if it hasn't been for
+        GlobalStatics.LEDGER_TTL seconds, only the transactions made since the last sync are fetched.
+
+        :param coin: The code for a currency whose transactions are queried (BTC, ZRX, etc.)
+        :return: The synced TransactionLedger of the account
+        """
+        coin = coin.upper()
+        with self.__ledgers_lock:
+            ledger = self.ledgers.get(coin)
+            if ledger is None:
+                ledger = self.ledgers[coin] = TransactionLedger(coin)
+
+        if ledger.synced_at is None or time.monotonic() - ledger.synced_at > statics.LEDGER_TTL:
+            ledger.sync(lambda **params: self.request("get_transactions", coin, **params))
+        return ledger
+
     def get_transaction_history(self, coin) -> [(float, str)]:
         """
         Gets all transactions that have been carried out with the given input currency. First entry is the most recent
@@ -89,11 +513,7 @@ class CoinbaseAPI:
         :param coin: The code for a currency whose historical transactions will be queried (BTC, ZRX, etc.)
         :return: A list of coin_amount, timestamp tuples
         """
-        transaction_list = self.client.get_transactions(coin).get('data')
-        num_coins_traded = [float(trans["amount"].get("amount")) for trans in transaction_list]
-        timestamps = [trans["created_at"] for trans in transaction_list]
-
-        return list(zip(num_coins_traded, timestamps))
+        return self.get_ledger(coin).get_transactions()
 
     def get_historic_exchange_rate(self, from_currency: str, to_currency: str, timestamp: str) -> float:
         """
@@ -106,41 +526,45 @@ class CoinbaseAPI:
         :param timestamp: The timestamp in the format YYYY-MM-DDTHH:MM:SSZ where T & Z must be included
         :return: The value of 1 from_currency expressed as to_currency at a given timestamp
         """
-        rates = self.client.get_exchange_rates(currency=from_currency, date=timestamp)["rates"]
-        return float(rates[to_currency])
+        return self.exchange_rates.get_rate(from_currency, to_currency, timestamp)
 
-    def get_coin_sell_profitability(self, coin: str, sell_amount: float, profits_currency: str = "CHF") -> float:
+    def get_historic_exchange_rates(self, lookups: list) -> [float]:
         """
-        Calculates how profitable it would be to sell a given number of coins taking into account ONLY the most recent
-        sell transaction and the market price when it were executed.
+        Gets several exchange rates at once. Rates are derived from one rate table per time bucket (see
+        GlobalStatics.EXCHANGE_RATE_BUCKET), the missing tables are fetched concurrently.
+
+        :param lookups: List of (from_currency, to_currency, timestamp) tuples, see get_historic_exchange_rate. The
+                        timestamp can also be a datetime64 or seconds since epoch, None is the current time
+        :return: The value of 1 from_currency expressed as to_currency for every lookup
+        """
+        return self.exchange_rates.get_rates(lookups)
+
+    def simulate_sell(self, coin: str, sell_amount: float, profits_currency: str = "CHF", method: str = "fifo")\
+            -> SellSimulation:
+        """
+        Matches a proposed sell against the whole buy history of a coin, see CostBasisEngine.simulate_sell
 
         :param coin: The code of the coin (XLM, BTC, etc.) whose historical transactions will be queried
         :param sell_amount: The amount (in crypto) of the coin which should be sold (0.45 XML, 1.23 BTC, etc.)
         :param profits_currency: The currency in which profits/losses are displayed. CHF by default
-        :return: The profits or loss made (in CHF) if the amount of coin were to be sold at the current market price
+        :param method: The cost basis method, "fifo", "lifo" or "average"
+        :return: The lots the sell draws from along with their profits
         """
+        return self.cost_basis.simulate_sell(coin, sell_amount, profits_currency, method)
 
-        profits_currency = profits_currency.upper()  # Needed for get_historic_exchange_rate
-        most_recent_buy = tuple()
-        historical_transactions = self.get_transaction_history(coin=coin)
-
-        # Search for first buy
-        for amount, timestamp in historical_transactions:
-            # Check that transaction is a buy
-            if amount > 0:
-                most_recent_buy = (amount, timestamp)
-                break
-
-        # Get value of coin in profits_currency at a timestamp
-        historic_price = self.get_historic_exchange_rate(from_currency=coin, to_currency=profits_currency,
-                                                         timestamp=most_recent_buy[1])
-        currency_pair = str(coin) + "-" + str(profits_currency.upper())
-
-        # Get current value of coin in profits_currency
-        current_price = float(self.client.get_spot_price(currency_pair=currency_pair).get("amount"))
-        profits = current_price*sell_amount - historic_price*sell_amount
+    def get_coin_sell_profitability(self, coin: str, sell_amount: float, profits_currency: str = "CHF",
+                                    method: str = "fifo") -> float:
+        """
+        Calculates how profitable it would be to sell a given number of coins at the current market price. The sell is
+        matched against the coins bought (first in first out by default) and their market price when they were bought.
 
-        return profits
+        :param coin: The code of the coin (XLM, BTC, etc.) whose historical transactions will be queried
+        :param sell_amount: The amount (in crypto) of the coin which should be sold (0.45 XML, 1.23 BTC, etc.)
+        :param profits_currency: The currency in which profits/losses are displayed. CHF by default
+        :param method: The cost basis method, "fifo", "lifo" or "average"
+        :return: The profits or loss made (in CHF) if the amount of coin were to be sold at the current market price
+        """
+        return self.simulate_sell(coin, sell_amount, profits_currency, method).profits
 
 
 if __name__ == '__main__':
@@ -0,0 +1,178 @@
+from utils.coinbase_utils.PortfolioEngine import PortfolioEngine
+import numpy as np
+import threading
+
+METHODS = ["fifo", "lifo", "average"]
+
+
+class SellSimulation:
+    """
+    This class holds the outcome of a proposed sell matched against the open lots (the coins bought which haven't been
+    sold yet), one entry per lot the sell draws from. Amounts of money are expressed in the profits currency.
+    """
+
+    def __init__(self, coin: str, method: str, current_price: float, lot_times: np.ndarray, lot_amounts: np.ndarray,
+                 unit_costs: np.ndarray, unmatched: float):
+        """
+        :param coin: The coin which is sold (BTC, XLM, etc.)
+        :param method: The cost basis method ("fifo", "lifo" or "average")
+        :param current_price: Price at which the coins are sold
+        :param lot_times: datetime64 times at which the lots were bought
+        :param lot_amounts: Amount of the coin sold from every lot
+        :param unit_costs: Price paid for one coin of every lot
+        :param unmatched: Amount sold in excess of the coins held, it has no cost basis
+        """
+        self.coin = coin
+        self.method = method
+        self.current_price = current_price
+        self.lot_times = lot_times
+        self.lot_amounts = lot_amounts
+        self.unit_costs = unit_costs
+        self.unmatched = unmatched
+
+        self.lot_profits = lot_amounts*(current_price - unit_costs)
+
+    @property
+    def cost_basis(self) -> float:
+        return float(np.dot(self.lot_amounts, self.unit_costs))
+
+    @property
+    def profits(self) -> float:
+        return float(self.lot_profits.sum())
+
+
+class CostBasisEngine:
+    """
+    This class is intended to match proposed sells against the full buy history of a coin. The historic sells of the
+    ledger are first matched against the buys (first in first out, last in first out or at average cost) to find the
+    open lots, whose cost is what was paid in the native currency of the account (converted with the cached historic
+    exchange rates into other profits currencies). The open lots are computed once per ledger update, a proposed sell
+    of any amount is then matched with a few cumulative sums.
+
+    Use this class (through CoinbaseAPI.simulate_sell) to compute the profits of selling any amount of a coin.
+    """
+
+    def __init__(self, coinbase_api):
+        """
+        :param coinbase_api: CoinbaseAPI object used to access the ledgers and exchange rates
+        """
+        self.coinbase_api = coinbase_api
+
+        self.__lots = {}  # (coin, profits currency, method) -> (ledger length, lot times, amounts, unit costs)
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def match_lots(amounts: np.ndarray, method: str = "fifo") -> np.ndarray:
+        """
+        Matches the historic sells against the buys
+
+        :param amounts: Amount of the coin traded by every transaction (ordered from oldest to newest), positive when
+                        received
+        :param method: "fifo" sells the oldest coins first, "lifo" the newest ones ("average" is matched as "fifo")
+        :return: Amount of every buy which hasn't been sold yet, 0 for sells
+        """
+        bought = np.where(amounts > 0, amounts, 0.)
+        if len(amounts) == 0:
+            return bought
+
+        if method != "lifo":
+            # Sells consume the oldest coins first, so the coins sold are always the first ones bought. Sells exceeding
+            # the coins held at the time only consume what was held, the running minimum removes the excess.
+            sold = np.cumsum(np.where(amounts < 0, -amounts, 0.))
+            total_bought = np.cumsum(bought)
+            total_sold = sold[-1] + min(0., np.minimum.accumulate(total_bought - sold).min())
+            bought_before = total_bought - bought
+            return np.clip(bought - np.clip(total_sold - bought_before, 0., None), 0., bought)
+
+        # The coins held form a stack, every buy is a layer starting at the height held before it. Sells remove the
+        # top of the stack, so what remains of a layer is what lies below the lowest height held since the buy. The
+        # height is the cumulative sum floored at 0 (sells exceeding the coins held empty the stack).
+        total = np.cumsum(amounts)
+        height = total - np.minimum(np.minimum.accumulate(total), 0.)
+        height_before = height - bought
+        lowest_after = np.minimum.accumulate(height[::-1])[::-1]
+        return np.clip(lowest_after - height_before, 0., bought)
+
+    @staticmethod
+    def take(lot_amounts: np.ndarray, amount: float) -> np.ndarray:
+        """
+        Takes an amount from lots in the given order
+
+        :param lot_amounts: Amount held in every lot, in the order in which they are consumed
+        :param amount: Amount which is taken
+        :return: Amount taken from every lot
+        """
+        taken_before = np.cumsum(lot_amounts) - lot_amounts
+        return np.clip(amount - taken_before, 0., lot_amounts)
+
+    def get_open_lots(self, coin: str, profits_currency: str, method: str = "fifo")\
+            -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Gets the coins held, split into the lots they were bought in
+
+        :param coin: The coin (BTC, XLM, etc.)
+        :param profits_currency: Currency in which the unit costs are expressed
+        :param method: The cost basis method ("fifo", "lifo" or "average")
+        :return: datetime64 times, amounts still held and unit costs of the open lots respectively, ordered from
+                 oldest to newest
+        """
+        coin, profits_currency, method = coin.upper(), profits_currency.upper(), method.lower()
+        if method not in METHODS:
+            raise ValueError("Unknown cost basis method, should be one of " + ", ".join(METHODS))
+
+        ledger = self.coinbase_api.get_ledger(coin)
+        times, amounts, native_amounts, holdings = ledger.snapshot()
+        key = (coin, profits_currency, method)
+
+        with self.__lock:
+            lots = self.__lots.get(key)
+        if lots is not None and lots[0] == len(times):
+            return lots[1:]
+
+        remaining = self.match_lots(amounts, method)
+
+        # Costs of every buy are needed for the average cost, only those of the open lots otherwise. The ledger holds
+        # what was paid in the native currency, only the conversion to another profits currency needs the rates.
+        priced = amounts > 0 if method == "average" else remaining > 0
+        unit_costs = np.zeros(len(amounts))
+        unit_costs[priced] = native_amounts[priced] / amounts[priced]
+
+        if np.any(priced) and ledger.native_currency != profits_currency:
+            unit_costs[priced] *= self.coinbase_api.get_historic_exchange_rates(
+                [(ledger.native_currency, profits_currency, timestamp) for timestamp in times[priced]])
+
+        if method == "average":
+            # Every coin held shares the average cost, the open lots are only kept for their times
+            cost_basis, realized = PortfolioEngine.compute_cost_basis(amounts, amounts*unit_costs, holdings)
+            average_cost = cost_basis[-1] / holdings[-1] if len(holdings) and holdings[-1] > 0 else 0.
+            unit_costs = np.full(len(amounts), average_cost)
+
+        is_open = remaining > 0
+        lots = (len(times), times[is_open], remaining[is_open], unit_costs[is_open])
+        with self.__lock:
+            self.__lots[key] = lots
+        return lots[1:]
+
+    def simulate_sell(self, coin: str, sell_amount: float, profits_currency: str, method: str = "fifo")\
+            -> SellSimulation:
+        """
+        Matches a proposed sell against the open lots at the current price
+
+        :param coin: The coin (BTC, XLM, etc.)
+        :param sell_amount: The amount of the coin which would be sold
+        :param profits_currency: Currency in which profits are computed
+        :param method: "fifo" sells the oldest lots first, "lifo" the newest ones, "average" sells at the average cost
+        :return: The lots the sell draws from and their profits
+        """
+        lot_times, lot_amounts, unit_costs = self.get_open_lots(coin, profits_currency, method)
+        current_price = self.coinbase_api.get_historic_exchange_rates([(coin, profits_currency, None)])[0]
+
+        # Lots are ordered from oldest to newest, last in first out takes from the end
+        order = slice(None, None, -1) if method.lower() == "lifo" else slice(None)
+        taken = self.take(lot_amounts[order], sell_amount)
+        sold = taken > 0
+        unmatched = sell_amount - float(taken.sum())
+        unmatched = unmatched if unmatched > 1e-10 else 0.  # ignore rounding errors of the cumulative sums
+
+        return SellSimulation(coin.upper(), method.lower(), current_price, lot_times[order][sold], taken[sold],
+                              unit_costs[order][sold], unmatched)
@@ -0,0 +1,129 @@
+from utils.coinbase_utils.TTLCache import TTLCache
+import utils.coinbase_utils.GlobalStatics as statics
+from collections import OrderedDict
+from types import MappingProxyType
+import threading
+import datetime
+import time
+
+
+class ExchangeRateService:
+    """
+    This class is intended to answer exchange rate lookups between any two currencies at any time from as few rate
+    tables as possible. Coinbase returns the rates of all currencies against a base currency in a single table, so
+    one table per time bucket is enough to derive the rate of every currency pair at any time within the bucket.
+
+    Historic rates never change, the tables of past buckets are therefore cached as read-only mappings without expiry,
+    the least recently used ones are evicted beyond GlobalStatics.EXCHANGE_RATE_TABLES tables. The table of the
+    current bucket is only cached for GlobalStatics.EXCHANGE_RATE_TTL seconds.
+
+    Use this class (through CoinbaseAPI.get_historic_exchange_rates) to resolve many rates in one batch, the tables
+    which are missing are fetched concurrently through the request scheduler.
+    """
+
+    def __init__(self, coinbase_api, base_currency: str = statics.QUOTE_CURRENCY,
+                 bucket_seconds: int = statics.EXCHANGE_RATE_BUCKET, max_tables: int = statics.EXCHANGE_RATE_TABLES):
+        """
+        :param coinbase_api: CoinbaseAPI object used to fetch the rate tables
+        :param base_currency: Currency against which the rate tables are fetched
+        :param bucket_seconds: Width (in seconds) of the time buckets, lookups within a bucket share a table
+        :param max_tables: Maximum number of tables of past buckets which are cached
+        """
+        self.coinbase_api = coinbase_api
+        self.base_currency = base_currency.upper()
+        self.bucket_seconds = bucket_seconds
+        self.max_tables = max_tables
+
+        self.__tables = OrderedDict()  # (base currency, bucket start) -> read-only rate table of a past bucket, LRU
+        self.__lock = threading.Lock()
+        self.__current_tables = TTLCache(max_size=1)
+
+    def get_bucket(self, timestamp) -> int:
+        """
+        :param timestamp: Seconds since epoch, datetime64 or a string in the format YYYY-MM-DDTHH:MM:SSZ
+        :return: Start (in seconds since epoch) of the bucket holding the timestamp
+        """
+        if isinstance(timestamp, str):
+            timestamp = datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")\
+                .replace(tzinfo=datetime.timezone.utc).timestamp()
+        elif not isinstance(timestamp, (int, float)):
+            timestamp = timestamp.astype("datetime64[s]").astype(int)
+        return int(timestamp) // self.bucket_seconds * self.bucket_seconds
+
+    def get_rate(self, from_currency: str, to_currency: str, timestamp=None) -> float:
+        """
+        :param from_currency: The currency which we want to convert
+        :param to_currency: The currency which will express from_currency
+        :param timestamp: Time of the rate (see get_bucket), the current rate if None
+        :return: The value of 1 from_currency expressed as to_currency
+        """
+        return self.get_rates([(from_currency, to_currency, timestamp)])[0]
+
+    def get_rates(self, lookups: list) -> [float]:
+        """
+        Resolves several exchange rates, fetching every missing rate table once
+
+        :param lookups: List of (from_currency, to_currency, timestamp) tuples, a timestamp of None is the current time
+        :return: The value of 1 from_currency expressed as to_currency for every lookup
+        """
+        now = int(time.time())
+        buckets = [self.get_bucket(now if timestamp is None else timestamp) for _, _, timestamp in lookups]
+        tables = self.__get_tables(set(buckets), now)
+
+        rates = []
+        for (from_currency, to_currency, _), bucket in zip(lookups, buckets):
+            table = tables[bucket]
+            from_currency, to_currency = from_currency.upper(), to_currency.upper()
+            if from_currency not in table or to_currency not in table:
+                raise KeyError("No exchange rate between {} and {}".format(from_currency, to_currency))
+
+            # The table holds how much of every currency 1 unit of the base currency buys
+            rates.append(table[to_currency] / table[from_currency])
+        return rates
+
+    def __get_tables(self, buckets: set, now: int) -> dict:
+        """
+        :param buckets: Starts of the buckets whose tables are needed
+        :param now: The current time, the bucket holding it isn't complete yet
+        :return: Dictionary mapping every bucket to its rate table
+        """
+        current_bucket = self.get_bucket(now)
+        tables, futures = {}, {}
+
+        with self.__lock:
+            for bucket in buckets:
+                table = self.__tables.get((self.base_currency, bucket))
+                if table is not None:
+                    self.__tables.move_to_end((self.base_currency, bucket))
+                elif bucket == current_bucket:
+                    table = self.__current_tables.get((self.base_currency, bucket))
+                if table is not None:
+                    tables[bucket] = table
+
+        # Fetch the missing tables concurrently, the current one without a date such that it holds the latest rates
+        for bucket in buckets - tables.keys():
+            if bucket == current_bucket:
+                futures[bucket] = self.coinbase_api.submit_request("get_exchange_rates", currency=self.base_currency)
+            else:
+                date = datetime.datetime.fromtimestamp(bucket, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                futures[bucket] = self.coinbase_api.submit_request("get_exchange_rates", currency=self.base_currency,
+                                                                   date=date)
+
+        for bucket, future in futures.items():
+            rates = {currency: float(rate) for currency, rate in future.result()["rates"].items() if float(rate) > 0}
+            rates[self.base_currency] = 1.
+            table = tables[bucket] = MappingProxyType(rates)
+
+            if bucket == current_bucket:
+                self.__current_tables.put((self.base_currency, bucket), table, ttl=statics.EXCHANGE_RATE_TTL)
+            else:
+                with self.__lock:
+                    self.__tables[(self.base_currency, bucket)] = table
+                    while len(self.__tables) > self.max_tables:
+                        self.__tables.popitem(last=False)
+
+        return tables
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__tables)
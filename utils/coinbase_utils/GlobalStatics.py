@@ -8,3 +8,43 @@ COLORS = {coin: COLORS[i] for i, coin in enumerate(CURRENCIES)}
 PATH_DELIM = "/"
 if sys.platform == "win32":
     PATH_DELIM = "\\"
+
+QUOTE_CURRENCY = "CHF"
+
+# Quote currency of the streamed prices, the coinbase exchange feed only lists a few (USD, EUR, GBP, etc.) and doesn't
+# list CHF. Streamed prices are converted at the current exchange rate when requested in another currency.
+STREAM_QUOTE_CURRENCY = "USD"
+
+# Length of the periods supported by the coinbase historic prices endpoint, in seconds
+PERIOD_SECONDS = {"hour": 60*60, "day": 24*60*60, "week": 7*24*60*60, "month": 30*24*60*60, "year": 365*24*60*60}
+
+# Time (in seconds) that historic prices of a period are cached for before they are fetched again from coinbase
+HISTORICAL_TTL = {"hour": 60, "day": 5*60, "week": 30*60, "month": 2*60*60, "year": 12*60*60, "all": 24*60*60}
+HISTORICAL_CACHE_SIZE = 256
+
+# Time (in seconds) that account balances are cached for
+BALANCE_TTL = 30
+
+# Time (in seconds) after which the transaction ledger of an account is synced again with coinbase
+LEDGER_TTL = 60
+
+# Width (in seconds) of the time buckets sharing an exchange rate table, and time (in seconds) that the table of the
+# current bucket is cached for. Tables of past buckets never change, they are kept in a bounded LRU cache of
+# EXCHANGE_RATE_TABLES tables.
+EXCHANGE_RATE_BUCKET = 60*60
+EXCHANGE_RATE_TTL = 60
+
+# Maximum number of rate tables of past buckets which are cached (a table holds the rates of a few hundred currencies)
+EXCHANGE_RATE_TABLES = 512
+
+# Maximum number of historic series (coin, period) fetched per alert cycle, the stale series of the other coins are
+# fetched in the following cycles, such that the work per cycle doesn't grow with the watchlist
+SERIES_FETCHES_PER_CYCLE = 50
+
+# Time (in seconds) before a series whose fetch failed (e.g. a coin without prices in the quote currency) is fetched
+# again, doubled after every further failure up to the maximum, such that failing series don't use up the fetches
+SERIES_RETRY_DELAY = 5*60
+SERIES_MAX_RETRY_DELAY = 24*60*60
+
+# Number of coins shown on the normalised price graph when the watchlist doesn't list them
+GRAPH_SIZE = 20
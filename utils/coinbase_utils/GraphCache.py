@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import numpy as np
+import threading
+import hashlib
+import time
+
+
+class RenderedGraph:
+    """
+    This class holds an encoded graph image along with the fingerprint of the data it was rendered from. Once the image
+    has been uploaded to Telegram the file_id can be stored, such that later sends don't have to upload it again.
+    """
+
+    def __init__(self, image_bytes: bytes, fingerprint: str, image_format: str = "JPEG"):
+        """
+        :param image_bytes: The encoded image
+        :param fingerprint: Fingerprint of the data which was used to render the image
+        :param image_format: Format in which the image was encoded (JPEG, PNG, etc.)
+        """
+        self.image_bytes = image_bytes
+        self.fingerprint = fingerprint
+        self.image_format = image_format
+        self.created_at = time.time()
+        self.stale_since = None  # Time at which newer data than the fingerprint was first seen
+        self.file_id = None  # Telegram file_id, set after the first upload
+
+    @property
+    def is_stale(self) -> bool:
+        return self.stale_since is not None
+
+
+class GraphCache:
+    """
+    This class is intended to store rendered graphs, such that identical requests (same graph, period, currencies and
+    underlying price data) are served without rendering the graph again.
+
+    Use this class to look up rendered graphs by key and data fingerprint, all methods are thread-safe.
+    """
+
+    def __init__(self, max_size: int = 32):
+        """
+        :param max_size: Maximum number of graphs held by the cache before the least recently used one is evicted
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()  # key -> RenderedGraph, ordered from least to most recently used
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(*arrays: np.ndarray) -> str:
+        """
+        Computes a fingerprint of the data which a graph is rendered from
+
+        :param arrays: NumPy arrays containing the data (times, prices, etc.)
+        :return: A hex digest which changes whenever the data changes
+        """
+        digest = hashlib.sha1()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(str((array.dtype, array.shape)).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: tuple, fingerprint: str) -> RenderedGraph:
+        """
+        Retrieves a rendered graph if one exists for the given key and data fingerprint. A graph which was rendered from
+        different data is marked as stale.
+
+        :param key: Identifies the graph, e.g. ("normalised", period, currencies)
+        :param fingerprint: Fingerprint of the current data
+        :return: The rendered graph, or None if it has to be (re-)rendered
+        """
+        with self.__lock:
+            rendered = self.__entries.get(key)
+
+            if rendered is None or rendered.fingerprint != fingerprint:
+                if rendered is not None and rendered.stale_since is None:
+                    rendered.stale_since = time.time()
+                self.misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return rendered
+
+    def peek(self, key: tuple) -> RenderedGraph:
+        """
+        Retrieves the most recently rendered graph for a key regardless of whether it is stale
+
+        :param key: Identifies the graph, e.g. ("normalised", period, currencies)
+        :return: The rendered graph, or None if the graph was never rendered
+        """
+        with self.__lock:
+            return self.__entries.get(key)
+
+    def put(self, key: tuple, fingerprint: str, image_bytes: bytes, image_format: str = "JPEG") -> RenderedGraph:
+        """
+        Stores a rendered graph, replacing any graph previously stored under the key
+
+        :param key: Identifies the graph, e.g. ("normalised", period, currencies)
+        :param fingerprint: Fingerprint of the data which was used to render the image
+        :param image_bytes: The encoded image
+        :param image_format: Format in which the image was encoded (JPEG, PNG, etc.)
+        :return: The stored graph
+        """
+        rendered = RenderedGraph(image_bytes, fingerprint, image_format)
+
+        with self.__lock:
+            self.__entries[key] = rendered
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+        return rendered
+
+    def get_stats(self) -> dict:
+        """
+        Reports how effective the cache has been
+
+        :return: Dictionary containing the hits, misses, number of graphs and number of stale graphs
+        """
+        with self.__lock:
+            stale = sum(1 for rendered in self.__entries.values() if rendered.is_stale)
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.__entries), "stale": stale}
@@ -0,0 +1,348 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import numpy as np
+import matplotlib; matplotlib.use('agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.axes import Axes
+from utils.coinbase_utils.MetricsRegistry import metrics
+from PIL import Image
+import threading
+import logging
+import time
+import io
+
+logger = logging.getLogger(__name__)
+
+# Supported image formats, mapped to the format names used by matplotlib
+IMAGE_FORMATS = {"jpeg": "jpeg", "jpg": "jpeg", "png": "png", "webp": "webp"}
+
+_buffers = threading.local()  # reusable encoding buffer of each thread
+
+# The drawing functions below only depend on their plot spec (a dictionary of NumPy arrays and styling), such that they
+# can be pickled and run in a worker process by the RenderBackend.
+
+
+def new_figure(screen_size: (float, float)) -> Figure:
+    """
+    Creates a new figure which isn't managed by pyplot, such that several figures can be rendered at the same time
+    without sharing any global plotting state.
+
+    :param screen_size: Size of the figure in inches
+    :return: A Figure object attached to an Agg canvas
+    """
+    figure = Figure(figsize=screen_size, facecolor="black")
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def rasterize_figure(figure: Figure) -> None:
+    """
+    Draws a figure onto its Agg canvas, such that it can be encoded with encode_rasterized_figure
+
+    :param figure: The figure which will be rasterized
+    """
+    figure.canvas.draw()
+
+
+def encode_rasterized_figure(figure: Figure, image_format: str = "JPEG") -> bytes:
+    """
+    Encodes the pixels of a rasterized figure in memory, without drawing the figure again. Each thread reuses its own
+    buffer between calls.
+
+    :param figure: The figure which was rasterized by rasterize_figure
+    :param image_format: Format of the encoded image (JPEG, PNG or WebP)
+    :return: The encoded image
+    """
+    image_format = IMAGE_FORMATS.get(image_format.lower())
+    if image_format is None:
+        raise ValueError("Unsupported image format, should be one of " + ", ".join(IMAGE_FORMATS))
+
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _buffers.buffer = io.BytesIO()
+
+    buffer.seek(0)
+    buffer.truncate()
+    size = figure.canvas.get_width_height()
+    image = Image.frombuffer("RGBA", size, figure.canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+    if image_format != "png":
+        image = image.convert("RGB")  # JPEG has no alpha channel, the figure is opaque anyway
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def encode_figure(figure: Figure, image_format: str = "JPEG") -> bytes:
+    """
+    Rasterizes a figure and encodes it in memory, without going through the filesystem
+
+    :param figure: The figure which will be encoded
+    :param image_format: Format of the encoded image (JPEG, PNG or WebP)
+    :return: The encoded image
+    """
+    rasterize_figure(figure)
+    return encode_rasterized_figure(figure, image_format)
+
+
+def _plot_percentage_change(axes: Axes, percentage_change_graph: np.ndarray, coin: str, percentage_change: float,
+                            color: str, sign: str) -> None:
+    """
+    Plots percentage change graphs and annotates graph with percentage changes for a specified currency
+
+    :param axes: The axes onto which the graph is plotted
+    :param percentage_change_graph: Array of percentage changes (relative to the first price) over the period
+    :param coin: Coin which will be graphed
+    :param percentage_change: Relative change of the currency over the entire period
+    :param color: Color of the currency
+    :param sign: Sign corresponding to the percentage change (increase or decrease)
+    """
+    period = -7  # -24 for days and -7 for week
+    axes.plot(np.linspace(period, 0, len(percentage_change_graph)), percentage_change_graph, label=coin, color=color)
+
+    # add coin labels to plot
+    axes.text(0.5, percentage_change_graph[-1], sign + "%.0f%%" % (np.abs(percentage_change * 100)) + " " + coin,
+              color=color, fontsize=10)
+
+
+def draw_normalised_graph(figure: Figure, spec: dict) -> None:
+    """
+    Draws the most significant changing currencies on a normalized graph
+
+    :param figure: The figure onto which the graph is drawn
+    :param spec: Dictionary containing "coins", "colors" (one per coin), "percentage_change_graphs" (coins x timestamps)
+                 and "percentage_changes" (relative change of every coin)
+    """
+    coins, colors = spec["coins"], spec["colors"]
+    percentage_change_graphs, percentage_changes = spec["percentage_change_graphs"], spec["percentage_changes"]
+    always_show_threshold = 20 / 100  # Min threshold for currency to be plotted independent of already plotted currencies
+
+    # indices of currencies sorted in order of decreasing percentage change
+    sorted_indices = np.argsort(-percentage_changes, kind="stable")
+
+    increasing_axes = figure.add_subplot(2, 1, 1)
+    decreasing_axes = figure.add_subplot(2, 1, 2)
+
+    # Plots all currencies which have a percentage change above the always_show_threshold
+    for i in sorted_indices[3:-3]:
+        if percentage_changes[i] >= always_show_threshold:
+            _plot_percentage_change(increasing_axes, percentage_change_graphs[i], coins[i], percentage_changes[i],
+                                    colors[i], "+")
+        if percentage_changes[i] <= -always_show_threshold:
+            _plot_percentage_change(decreasing_axes, percentage_change_graphs[i], coins[i], percentage_changes[i],
+                                    colors[i], "-")
+
+    period_spacing = -8
+    increasing_axes.plot([period_spacing, 1], [0, 0], linestyle="--", color="black", linewidth=1.5)
+
+    increasing_axes.set_title("Increasing Currencies")
+
+    # include first 3 most increasing coins.
+    for i in sorted_indices[:3]:
+        if percentage_changes[i] < 0:
+            continue
+        _plot_percentage_change(increasing_axes, percentage_change_graphs[i], coins[i], percentage_changes[i],
+                                colors[i], "+")
+
+    # plot labels etc.
+    increasing_axes.set_xlim(period_spacing, 1)
+    increasing_axes.grid()
+
+    # Check if there are increasing currencies, if not then put some text onto the graph
+    if percentage_changes[sorted_indices[0]] < 0.:
+        increasing_axes.text(-12, 0, "It's a bad day for crypto.", ha="center", va="center", fontsize=25,
+                             color="darkred")
+    else:
+        increasing_axes.legend()  # Prevents legend error which is spawned from having an empty plot
+
+    increasing_axes.set_xlabel("Time")
+    increasing_axes.set_ylabel("Price Change (%)")
+
+    # Create second graph for decreasing currencies
+    decreasing_axes.plot([period_spacing, 1], [0, 0], linestyle="--", color="black", linewidth=1.5)
+
+    decreasing_axes.set_title("Decreasing Currencies")
+
+    # include first 3 most increasing coins.
+    for i in sorted_indices[-3:]:
+        if percentage_changes[i] > 0:
+            continue
+        _plot_percentage_change(decreasing_axes, percentage_change_graphs[i], coins[i], percentage_changes[i],
+                                colors[i], "-")
+
+    # plot labels etc.
+    decreasing_axes.set_xlim(period_spacing, 1)
+    decreasing_axes.grid()
+
+    if percentage_changes[sorted_indices[-1]] > 0.:
+        decreasing_axes.text(-12, 0, "It's a good day for crypto!", ha="center", va="center", fontsize=25,
+                             color="green")
+    else:
+        decreasing_axes.legend()
+
+    decreasing_axes.set_xlabel("Time")
+    decreasing_axes.set_ylabel("Price Change (%)")
+
+
+def draw_portfolio_graph(figure: Figure, spec: dict) -> None:
+    """
+    Draws the price of a coin along with the amount of the coin held and the value of the position
+
+    :param figure: The figure onto which the graph is drawn
+    :param spec: Dictionary containing "times" and "prices" of the coin, "held_times" and "held_amounts" of the
+                 amount of the coin held, and "values" and "profits" of the position at every time
+    """
+    times, prices = spec["times"], spec["prices"]
+
+    # plot historical prices
+    price_axes = figure.add_subplot(3, 1, 1)
+    price_axes.plot(times, prices)
+    price_axes.set_xlim([times.min(), times.max()])
+    price_axes.grid()
+
+    held_axes = figure.add_subplot(3, 1, 2)
+    held_axes.plot(spec["held_times"], spec["held_amounts"])
+    held_axes.set_xlim([times.min(), times.max()])
+    held_axes.grid()
+
+    # plot value of the position along with the realized and unrealized profits
+    value_axes = figure.add_subplot(3, 1, 3)
+    value_axes.plot(times, spec["values"], label="Value")
+    value_axes.plot(times, spec["profits"], label="Profits")
+    value_axes.set_xlim([times.min(), times.max()])
+    value_axes.legend()
+    value_axes.grid()
+
+
+def draw_portfolio_value_graph(figure: Figure, spec: dict) -> None:
+    """
+    Draws the value of the portfolio over time, stacked by coin
+
+    :param figure: The figure onto which the graph is drawn
+    :param spec: Dictionary containing "times", "coins", "colors" (one per coin), "values" (coins x timestamps) and the
+                 "quote_currency" in which the values are expressed
+    """
+    times, values = spec["times"], spec["values"]
+
+    axes = figure.add_subplot(1, 1, 1)
+    if len(spec["coins"]) == 0 or len(times) == 0:
+        axes.text(0.5, 0.5, "No coins held.", ha="center", va="center", fontsize=25, transform=axes.transAxes)
+        return
+
+    # Largest positions at the bottom of the stack
+    order = np.argsort(-values[:, -1], kind="stable")
+    axes.stackplot(times, values[order], labels=[spec["coins"][i] for i in order],
+                   colors=[spec["colors"][i] for i in order])
+    axes.set_xlim([times.min(), times.max()])
+    axes.set_title("Portfolio value: {:.2f} {}".format(values[:, -1].sum(), spec["quote_currency"]))
+    axes.set_ylabel("Value (" + spec["quote_currency"] + ")")
+    axes.legend(loc="upper left")
+    axes.grid()
+
+
+def render_graph(draw_function, spec: dict) -> (bytes, dict):
+    """
+    Draws a graph onto a new figure and encodes it, timing every phase
+
+    :param draw_function: Function which draws the spec onto a figure (draw_normalised_graph, draw_portfolio_graph)
+    :param spec: The plot spec, must contain "screen_size" and "image_format" in addition to what draw_function needs
+    :return: The encoded image and a dictionary of the time (in seconds) spent drawing, rasterizing and encoding
+    """
+    figure = new_figure(spec["screen_size"])
+    try:
+        start = time.perf_counter()
+        draw_function(figure, spec)
+        drawn = time.perf_counter()
+        rasterize_figure(figure)
+        rasterized = time.perf_counter()
+        image_bytes = encode_rasterized_figure(figure, spec["image_format"])
+
+        return image_bytes, {"draw": drawn - start, "rasterize": rasterized - drawn,
+                             "encode": time.perf_counter() - rasterized}
+    finally:
+        figure.clear()
+
+
+def _initialize_worker(color_style: str) -> None:
+    """
+    Applies the graph style in a worker process, the style of the parent process isn't inherited by spawned workers
+
+    :param color_style: Style of graph background
+    """
+    matplotlib.style.use(color_style)
+
+
+class RenderBackend:
+    """
+    This class is intended to render graphs off the main process. Matplotlib rendering is CPU-bound and holds the GIL,
+    so rendering in a process pool keeps the Telegram handlers and the scheduler responsive while graphs are drawn.
+
+    Use this class to render plot specs into encoded images, falling back to in-process rendering when no pool is
+    configured or the pool breaks.
+    """
+
+    def __init__(self, pool_size: int = 0, color_style: str = "dark_background"):
+        """
+        :param pool_size: Number of worker processes, 0 renders in-process
+        :param color_style: Style of graph background, applied in every worker process
+        """
+        self.pool_size = pool_size
+        self.color_style = color_style
+        self.__pool = None
+        self.__lock = threading.Lock()
+
+    def __get_pool(self) -> ProcessPoolExecutor:
+        """
+        Lazily starts the process pool, such that no processes are spawned unless graphs are rendered
+
+        :return: The process pool or None if rendering should happen in-process
+        """
+        with self.__lock:
+            if self.__pool is None and self.pool_size > 0:
+                try:
+                    # spawn instead of fork, forking a process which runs several threads isn't safe
+                    self.__pool = ProcessPoolExecutor(max_workers=self.pool_size,
+                                                      mp_context=multiprocessing.get_context("spawn"),
+                                                      initializer=_initialize_worker, initargs=(self.color_style,))
+                except (OSError, ValueError) as exception:
+                    logger.warning("Failed to start render pool, rendering in-process: %s", exception)
+                    self.pool_size = 0
+            return self.__pool
+
+    def render(self, draw_function, spec: dict) -> bytes:
+        """
+        Renders a plot spec into an encoded image
+
+        :param draw_function: Module level function which draws the spec onto a figure (draw_normalised_graph, etc.)
+        :param spec: The plot spec, must contain "screen_size" and "image_format" besides what draw_function needs
+        :return: The encoded image
+        """
+        pool = self.__get_pool()
+        rendered = None
+
+        if pool is not None:
+            try:
+                rendered = pool.submit(render_graph, draw_function, spec).result()
+            except BrokenProcessPool as exception:
+                logger.warning("Render pool broke, rendering in-process: %s", exception)
+                self.shutdown()
+
+        if rendered is None:
+            rendered = render_graph(draw_function, spec)
+
+        # The phases are timed where the graph is rendered, possibly in a worker process, and recorded here
+        image_bytes, phase_seconds = rendered
+        graph = draw_function.__name__.replace("draw_", "").replace("_graph", "")  # e.g. draw_portfolio_graph
+        for phase, seconds in phase_seconds.items():
+            metrics.observe("graph_render_seconds", seconds, graph=graph, phase=phase)
+        return image_bytes
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes, later renders happen in-process
+        """
+        with self.__lock:
+            if self.__pool is not None:
+                self.__pool.shutdown(wait=False)
+            self.__pool = None
+            self.pool_size = 0
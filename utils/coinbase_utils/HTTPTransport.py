@@ -0,0 +1,81 @@
+from requests.adapters import HTTPAdapter
+import requests
+
+
+class TimeoutSession(requests.Session):
+    """
+    Session which applies a default (connect, read) timeout to every request. The coinbase client doesn't set a
+    timeout, without one a stalled socket blocks the calling thread indefinitely.
+    """
+
+    def __init__(self, timeout: (float, float)):
+        """
+        :param timeout: Default (connect, read) timeout in seconds
+        """
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class HTTPTransport:
+    """
+    This class is intended to provide the HTTP session used by the coinbase client. The session keeps a pool of
+    keep-alive connections sized to the number of concurrent requests, such that requests reuse connections instead of
+    opening a new one (and doing a TLS handshake) every time.
+
+    Use this class to configure the connection pool and timeouts of a coinbase client and to check how often
+    connections are reused.
+    """
+
+    def __init__(self, pool_size: int = 4, connect_timeout: float = 5., read_timeout: float = 20.):
+        """
+        :param pool_size: Number of connections kept open per host, should match the number of concurrent requests
+        :param connect_timeout: Time (in seconds) after which connecting to coinbase is given up on
+        :param read_timeout: Time (in seconds) without receiving data after which a request is given up on
+        """
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        # Retrying is left to the RequestScheduler, which backs off and respects rate limits
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = None
+
+    def mount(self, client) -> None:
+        """
+        Replaces the session of a coinbase client by a pooled session, keeping its authentication and headers
+
+        :param client: A coinbase.wallet.client.Client
+        """
+        session = TimeoutSession((self.connect_timeout, self.read_timeout))
+        session.auth = client.session.auth
+        session.headers.update(client.session.headers)
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+
+        client.session.close()
+        client.session = self.session = session
+
+    def get_stats(self) -> dict:
+        """
+        Reports how well connections are reused
+
+        :return: Dictionary containing the number of requests, the number of connections opened to serve them and the
+                 fraction of requests which reused an open connection
+        """
+        pools = self.adapter.poolmanager.pools
+        requests_sent = sum(pools.get(key).num_requests for key in pools.keys())
+        connections = sum(pools.get(key).num_connections for key in pools.keys())
+
+        reuse_rate = 1 - connections / requests_sent if requests_sent else 0.
+        return {"requests": requests_sent, "connections": connections, "reuse_rate": reuse_rate}
+
+    def close(self) -> None:
+        """
+        Closes all pooled connections
+        """
+        if self.session is not None:
+            self.session.close()
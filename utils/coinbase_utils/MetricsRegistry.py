@@ -0,0 +1,228 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import contextlib
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    This class records observations (e.g. durations in seconds) of a single metric. The total count and sum are kept
+    for all observations, the quantiles are computed over a window of the most recent ones.
+    """
+
+    def __init__(self, window: int = 2048):
+        """
+        :param window: Number of recent observations the quantiles are computed over
+        """
+        self.count = 0
+        self.sum = 0.
+        self.__values = np.zeros(window)
+
+    def observe(self, value: float) -> None:
+        """
+        Records an observation, must be called with the lock of the registry held
+        """
+        self.__values[self.count % len(self.__values)] = value
+        self.count += 1
+        self.sum += value
+
+    def get_quantiles(self, quantiles: tuple = QUANTILES) -> [float]:
+        """
+        :param quantiles: The quantiles (0.5 for the median, etc.)
+        :return: The quantiles of the recent observations, NaN if there are none
+        """
+        values = self.__values[:min(self.count, len(self.__values))]
+        if len(values) == 0:
+            return [float("nan")] * len(quantiles)
+        return np.quantile(values, quantiles).tolist()
+
+
+class MetricsRegistry:
+    """
+    This class is intended to collect the metrics of the bot in-process: counters (API errors, etc.), histograms of
+    durations (coinbase requests, graph rendering phases, command handlers) and values read from other objects when
+    the metrics are exported (cache hit counts, scheduler statistics, etc.).
+
+    Metrics are exported in the Prometheus text format, either through a small HTTP endpoint (serve) or by dumping them
+    periodically (render).
+
+    Use this class through the module level registry (metrics), all methods are thread-safe.
+    """
+
+    def __init__(self, window: int = 2048):
+        """
+        :param window: Number of recent observations the quantiles of every histogram are computed over
+        """
+        self.window = window
+
+        self.__counters = {}  # (name, labels) -> value
+        self.__histograms = {}  # (name, labels) -> Histogram
+        self.__collectors = {}  # key -> callable returning a dictionary of metric name, value pairs
+        self.__lock = threading.Lock()
+        self.__server = None
+
+    @staticmethod
+    def __key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increments a counter
+
+        :param name: Name of the counter (coinbase_errors_total, etc.)
+        :param value: Amount the counter is incremented by
+        :param labels: Labels of the counter (method, status, etc.)
+        """
+        key = self.__key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Records an observation of a histogram
+
+        :param name: Name of the histogram (coinbase_request_seconds, etc.)
+        :param value: The observation
+        :param labels: Labels of the histogram (method, phase, etc.)
+        """
+        key = self.__key(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram(self.window)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Context manager which records the time (in seconds) spent within the context in a histogram
+
+        :param name: Name of the histogram (graph_render_seconds, etc.)
+        :param labels: Labels of the histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_collector(self, key: str, collector) -> None:
+        """
+        Registers a callable which is read whenever the metrics are exported, replacing the collector registered
+        under the same key
+
+        :param key: Identifies the collector
+        :param collector: Callable without arguments returning a dictionary of metric name, value pairs
+        """
+        with self.__lock:
+            self.__collectors[key] = collector
+
+    def get_counter(self, name: str, **labels) -> float:
+        """
+        :return: The value of a counter, 0 if it was never incremented
+        """
+        with self.__lock:
+            return self.__counters.get(self.__key(name, labels), 0)
+
+    def get_summary(self, name: str, **labels) -> dict:
+        """
+        :return: Dictionary with the count, sum and quantiles (p50, p95, p99) of a histogram, None if it is empty
+        """
+        with self.__lock:
+            histogram = self.__histograms.get(self.__key(name, labels))
+            if histogram is None:
+                return None
+            quantiles = histogram.get_quantiles()
+            return {"count": histogram.count, "sum": histogram.sum,
+                    **{"p" + str(int(quantile * 100)): value for quantile, value in zip(QUANTILES, quantiles)}}
+
+    @staticmethod
+    def __format(name: str, labels: tuple, value: float) -> str:
+        if labels:
+            name += "{" + ",".join('{}="{}"'.format(label, label_value) for label, label_value in labels) + "}"
+        return "{} {}".format(name, repr(float(value)))
+
+    def render(self) -> str:
+        """
+        :return: All metrics in the Prometheus text exposition format
+        """
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            histograms = sorted((key, histogram.count, histogram.sum, histogram.get_quantiles())
+                                for key, histogram in self.__histograms.items())
+            collectors = list(self.__collectors.values())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE {} counter".format(name))
+            lines.append(self.__format(name, labels, value))
+
+        for (name, labels), count, total, quantiles in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE {} summary".format(name))
+            for quantile, value in zip(QUANTILES, quantiles):
+                lines.append(self.__format(name, (("quantile", str(quantile)),) + labels, value))
+            lines.append(self.__format(name + "_sum", labels, total))
+            lines.append(self.__format(name + "_count", labels, count))
+
+        for collector in collectors:
+            try:
+                values = collector()
+            except Exception as exception:
+                logger.warning("Metrics collector failed: %s", exception)
+                continue
+            for name, value in sorted(values.items()):
+                lines.append("# TYPE {} untyped".format(name))
+                lines.append(self.__format(name, (), value))
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> None:
+        """
+        Serves the metrics in the Prometheus text format at http://host:port/metrics from a background thread
+
+        :param port: The port to listen on
+        :param host: The interface to listen on, only local connections are accepted by default
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes would flood the log
+
+        self.__server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.__server.serve_forever, daemon=True, name="metrics").start()
+
+    def shutdown(self) -> None:
+        """
+        Stops the HTTP endpoint
+        """
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server = None
+
+
+# Registry shared by the whole process
+metrics = MetricsRegistry()
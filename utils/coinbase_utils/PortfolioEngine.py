@@ -0,0 +1,161 @@
+import utils.coinbase_utils.GlobalStatics as statics
+import numpy as np
+
+
+class Position:
+    """
+    This class holds the position in a coin over a period, every array is aligned with the price series of the coin
+    (one entry per timestamp). Amounts of money are expressed in the quote currency.
+    """
+
+    def __init__(self, coin: str, times: np.ndarray, prices: np.ndarray, holdings: np.ndarray,
+                 cost_basis: np.ndarray, realized: np.ndarray):
+        """
+        :param coin: The coin (BTC, XLM, etc.)
+        :param times: datetime64 times of the price series
+        :param prices: Price of the coin at every time
+        :param holdings: Amount of the coin held at every time
+        :param cost_basis: Amount paid for the coins held at every time (average cost)
+        :param realized: Profits/losses realized by selling up to every time
+        """
+        self.coin = coin
+        self.times = times
+        self.prices = prices
+        self.holdings = holdings
+        self.cost_basis = cost_basis
+        self.realized = realized
+
+        self.values = holdings*prices  # value of the position
+        self.unrealized = self.values - cost_basis  # profits/losses if the position were sold
+
+    @property
+    def profits(self) -> np.ndarray:
+        """
+        :return: Realized and unrealized profits/losses at every time
+        """
+        return self.realized + self.unrealized
+
+
+class PortfolioEngine:
+    """
+    This class is intended to compute the value and the profits/losses of the coins held by the user over time from
+    the transaction ledgers and historic prices. Holdings, cost basis and realized profits are computed once per
+    transaction and then aligned with the price series with a binary search, only the cost basis recurrence loops over
+    the transactions in Python.
+
+    The cost basis uses the average cost method: buying adds the amount paid, selling removes the average cost of the
+    coins sold. Amounts paid and received are the native amounts of the coinbase transactions.
+
+    Use this class to get the position of a single coin (CoinbaseAPI.get_ledger) or the value of the whole portfolio.
+    """
+
+    def __init__(self, coinbase_api):
+        """
+        :param coinbase_api: CoinbaseAPI object used to access the transactions and prices
+        """
+        self.coinbase_api = coinbase_api
+
+    @staticmethod
+    def compute_cost_basis(amounts: np.ndarray, native_amounts: np.ndarray, holdings: np.ndarray)\
+            -> (np.ndarray, np.ndarray):
+        """
+        Computes the average cost basis and the cumulative realized profits after every transaction.
+
+        Selling keeps the average cost of the coins held, i.e. multiplies the cost basis by the fraction of the coins
+        which are still held. The cost basis therefore follows c[i] = r[i]*c[i-1] + b[i]. The recurrence is run as a
+        plain loop over the transactions: its closed form (cumulative products of the kept fractions) over- and
+        underflows once enough partial sells pile up, and ledgers are small enough for the loop to be cheap.
+
+        :param amounts: Amount of the coin traded by every transaction, positive when received
+        :param native_amounts: Amount paid (positive) or received (negative) in the native currency by every transaction
+        :param holdings: Amount held after every transaction, the cumulative sum of amounts
+        :return: Cost basis and cumulative realized profits after every transaction respectively
+        """
+        if len(amounts) == 0:
+            return np.empty(0), np.empty(0)
+
+        previously_held = np.concatenate([[0.], holdings[:-1]])
+        bought = amounts > 0
+
+        # Fraction of the coins held which are kept by every transaction, 0 if everything is sold
+        with np.errstate(divide="ignore", invalid="ignore"):
+            kept = np.where(bought, 1., np.clip(holdings/previously_held, 0., 1.))
+        kept[~bought & (previously_held <= 0)] = 0.
+
+        paid = np.where(bought, native_amounts, 0.)
+
+        # Selling everything (kept is 0) restarts the cost basis
+        cost_basis = np.empty(len(amounts))
+        cost = 0.
+        for index, (fraction, paid_amount) in enumerate(zip(kept.tolist(), paid.tolist())):
+            cost = cost*fraction + paid_amount
+            cost_basis[index] = cost
+
+        # Selling realizes the difference between the amount received and the cost of the coins sold
+        previous_cost_basis = np.concatenate([[0.], cost_basis[:-1]])
+        realized = np.where(bought, 0., -native_amounts - (previous_cost_basis - cost_basis))
+
+        return cost_basis, np.cumsum(realized)
+
+    @staticmethod
+    def align(transaction_times: np.ndarray, values: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """
+        Looks up the value after the most recent transaction at every time, 0 before the first transaction
+
+        :param transaction_times: datetime64 times of the transactions, ordered from oldest to newest
+        :param values: Value after every transaction (holdings, cost basis, etc.)
+        :param times: datetime64 times at which the values are looked up
+        :return: Array of the values at times
+        """
+        indices = np.searchsorted(transaction_times, times, side="right") - 1
+        if len(values) == 0:
+            return np.zeros(len(times))
+        return np.where(indices >= 0, values[np.maximum(indices, 0)], 0.)
+
+    def get_position(self, coin: str, period: str = "month", quote_currency: str = statics.QUOTE_CURRENCY,
+                     price_series: (np.ndarray, np.ndarray) = None) -> Position:
+        """
+        Computes the position in a coin over a period
+
+        NOTE: The quote currency must be the native currency of the coinbase account, in which the amounts paid are
+        recorded
+
+        :param coin: The coin (BTC, XLM, etc.)
+        :param period: The period ("day", "week", "month", etc.)
+        :param quote_currency: Currency in which the values are expressed
+        :param price_series: (times, prices) as returned by CoinbaseAPI.get_historical_array, fetched if None
+        :return: The position at every time of the price series
+        """
+        coin = coin.upper()
+        if price_series is None:
+            price_series = self.coinbase_api.get_historical_array(coin, period, quote_currency)
+        times, prices = price_series
+
+        transaction_times, amounts, native_amounts, holdings = self.coinbase_api.get_ledger(coin).snapshot()
+        cost_basis, realized = self.compute_cost_basis(amounts, native_amounts, holdings)
+
+        return Position(coin, times, prices, self.align(transaction_times, holdings, times),
+                        self.align(transaction_times, cost_basis, times),
+                        self.align(transaction_times, realized, times))
+
+    def get_portfolio_value(self, coins: list = statics.CURRENCIES, period: str = "month",
+                            quote_currency: str = statics.QUOTE_CURRENCY) -> (np.ndarray, list, np.ndarray):
+        """
+        Computes the value of the coins held over a period. Coins which aren't held (without a coinbase account or with
+        a zero balance) are left out, such that their ledgers aren't synced.
+
+        :param coins: Coins which are taken into account (BTC, XLM, etc.)
+        :param period: The period ("day", "week", "month", etc.)
+        :param quote_currency: Currency in which the values are expressed
+        :return: datetime64 time axis, the coins and a (coins x timestamps) matrix of the value held respectively
+        """
+        balances = self.coinbase_api.get_all_account_balances()
+        coins = [coin.upper() for coin in coins if balances.get(coin.upper(), 0.) != 0]
+
+        times, prices = self.coinbase_api.get_price_matrix(coins, period, quote_currency)
+        values = np.empty(prices.shape)
+        for row, coin in enumerate(coins):
+            transaction_times, amounts, native_amounts, holdings = self.coinbase_api.get_ledger(coin).snapshot()
+            values[row] = self.align(transaction_times, holdings, times)*prices[row]
+
+        return times, coins, values
@@ -0,0 +1,158 @@
+import utils.coinbase_utils.GlobalStatics as statics
+import numpy as np
+import threading
+
+
+def get_alert_mask(changes: np.ndarray, notified: np.ndarray, threshold, notification_threshold,
+                   ignore_previous: bool = False) -> np.ndarray:
+    """
+    Determines which percentage changes are worth an alert: those which crossed the threshold of their period and
+    (unless ignore_previous is set) moved by more than the notification threshold since they were last notified. The
+    arguments are broadcast against each other (e.g. one row per chat), NaN changes never alert.
+
+    :param changes: Percentage changes over a period
+    :param notified: Percentage changes which were last notified
+    :param threshold: Minimum (%) change over the period
+    :param notification_threshold: Amount in (%) needed for another notification
+    :param ignore_previous: Flag that denotes that previous notifications are ignored
+    :return: Boolean mask of the changes which are alerted
+    """
+    change_since_notified = changes - notified
+
+    with np.errstate(invalid="ignore"):
+        increased = (changes > threshold) & (ignore_previous | (change_since_notified > notification_threshold))
+        decreased = (changes < -threshold) & (ignore_previous | (change_since_notified < -notification_threshold))
+    return increased | decreased
+
+
+class PriceChangeTracker:
+    """
+    This class is intended to compute the percentage change of many coins over trailing periods incrementally. For every
+    coin and period it keeps the historic series which was fetched last along with the index of the window's anchor
+    (the price at the start of the window), which only ever moves forward. The latest price of every coin is shared
+    between all periods and is updated by ticks or polled prices.
+
+    Use this class to compute percentage changes in O(1) per coin, the series of a period only has to be fetched again
+    once the start of the window has moved past its last price (see get_stale_coins).
+    """
+
+    def __init__(self, coins: list, periods: list = ("day", "week")):
+        """
+        :param coins: Coins whose percentage changes are tracked
+        :param periods: Periods over which the percentage changes are computed ("day", "week", etc.)
+        """
+        self.coins = list(coins)
+        self.periods = list(periods)
+
+        self.__indices = {coin: index for index, coin in enumerate(self.coins)}
+        self.__latest_times = np.zeros(len(self.coins), dtype=np.int64)
+        self.__latest_prices = np.full(len(self.coins), np.nan)
+
+        # period -> list of (times, prices) array tuples (None until the series is set) and array of anchor indices
+        self.__series = {period: [None] * len(self.coins) for period in self.periods}
+        self.__anchors = {period: np.zeros(len(self.coins), dtype=np.int64) for period in self.periods}
+        self.__lock = threading.Lock()
+
+    def set_series(self, coin: str, period: str, times: np.ndarray, prices: np.ndarray) -> None:
+        """
+        Replaces the historic series of a coin over a period, the anchor is moved back to the start of the series
+
+        :param coin: The coin the series belongs to
+        :param period: The period of the series
+        :param times: datetime64 (or epoch second) times, ordered from oldest to newest
+        :param prices: The prices
+        """
+        index = self.__indices.get(coin)
+        if index is None or period not in self.__series:
+            return
+
+        # Series are read-only snapshots (cached or copied out of the price stream), they are kept without copying
+        times = np.asarray(times).astype("datetime64[s]", copy=False).view(np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+
+        with self.__lock:
+            self.__series[period][index] = (times, prices)
+            self.__anchors[period][index] = 0
+
+        if len(times):
+            self.update(coin, int(times[-1]), float(prices[-1]))
+
+    def update(self, coin: str, timestamp: int, price: float) -> None:
+        """
+        Updates the latest price of a coin, prices older than the latest price are ignored
+
+        :param coin: The coin the price belongs to
+        :param timestamp: Time of the price in seconds since epoch
+        :param price: The price
+        """
+        index = self.__indices.get(coin)
+        if index is None:
+            return
+
+        with self.__lock:
+            if timestamp >= self.__latest_times[index]:
+                self.__latest_times[index] = timestamp
+                self.__latest_prices[index] = price
+
+    def update_many(self, prices: dict, timestamp: int) -> None:
+        """
+        Updates the latest prices of several coins at once, e.g. after polling the spot prices
+
+        :param prices: Dictionary of coin, price pairs
+        :param timestamp: Time of the prices in seconds since epoch
+        """
+        for coin, price in prices.items():
+            self.update(coin, timestamp, price)
+
+    def get_stale_coins(self, period: str) -> list:
+        """
+        Gets the coins whose series of a period has to be fetched (again), because it was never set or the start of the
+        window has moved past its last price
+
+        :param period: The period ("day", "week", etc.)
+        :return: List of coins
+        """
+        seconds = statics.PERIOD_SECONDS[period]
+
+        with self.__lock:
+            stale = []
+            for index, coin in enumerate(self.coins):
+                series = self.__series[period][index]
+                if series is None or len(series[0]) == 0 or series[0][-1] < self.__latest_times[index] - seconds:
+                    stale.append(coin)
+            return stale
+
+    def get_changes(self, period: str) -> (list, np.ndarray):
+        """
+        Computes the percentage change of every coin between the anchor of the period and its latest price. Anchors are
+        moved forward to the last price at or before the start of the window, which is measured back from the time of
+        the latest price.
+
+        :param period: The period ("day", "week", etc.)
+        :return: The coins which have a series and a latest price, and an array of their percentage changes
+        """
+        seconds = statics.PERIOD_SECONDS[period]
+
+        with self.__lock:
+            coins, indices, anchor_prices = [], [], []
+            anchors = self.__anchors[period]
+
+            for index, coin in enumerate(self.coins):
+                series = self.__series[period][index]
+                if series is None or len(series[0]) == 0 or np.isnan(self.__latest_prices[index]):
+                    continue
+
+                times, prices = series
+                window_start = self.__latest_times[index] - seconds
+                anchor = anchors[index]
+                while anchor + 1 < len(times) and times[anchor + 1] <= window_start:
+                    anchor += 1
+                anchors[index] = anchor
+
+                coins.append(coin)
+                indices.append(index)
+                anchor_prices.append(prices[anchor])
+
+            latest_prices = self.__latest_prices[indices]
+
+        return coins, 100 * (latest_prices / np.array(anchor_prices, dtype=np.float64) - 1)
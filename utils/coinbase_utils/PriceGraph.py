@@ -1,17 +1,26 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib; matplotlib.use('agg')
+from matplotlib.figure import Figure
 from utils.coinbase_utils import CoinbaseAPI as cbapi
 from utils.coinbase_utils import GlobalStatics as gs
+from utils.coinbase_utils import GraphRenderer as renderer
+from utils.coinbase_utils.GraphCache import GraphCache, RenderedGraph
+from utils.coinbase_utils.TransactionLedger import TransactionLedger
+from utils.coinbase_utils.PortfolioEngine import PortfolioEngine
+from utils.coinbase_utils.MetricsRegistry import metrics
+from utils.coinbase_utils.Watchlist import generate_color
 from PIL import Image
 import warnings
+import logging
 import os
 import json
-import datetime
 
 warnings.filterwarnings("ignore", module="matplotlib\..*")
 warnings.filterwarnings("ignore", category=UserWarning, module="matplotlib\..*")
 
+logger = logging.getLogger(__name__)
+
 
 class PriceGraph:
     """
@@ -24,195 +33,293 @@ class PriceGraph:
     def __init__(self, coinbase_api: cbapi.CoinbaseAPI, currencies: list = gs.CURRENCIES,
                  colors: dict = gs.COLORS, graph_directory_name: str = "graphs",
                  screen_size: (float, float) = (6, 10), color_style: str = "dark_background",
-                 base_path=os.path.abspath(os.path.dirname(__file__))):
+                 base_path=os.path.abspath(os.path.dirname(__file__)), render_pool_size: int = 0):
         """
         Constructor which initializes a Graphs object
 
         :param coinbase_api: CoinbaseAPI object used to access data for graphs
         :param currencies: Currencies which will be displayed
-        :param colors: Colors corresponding to currencies array
+        :param colors: Colors corresponding to currencies array, generated from the coin code for missing currencies
         :param graph_directory_name: Name of directory where graphs are saved
         :param screen_size: Size of screen for which graphs are exported and shown
         :param color_style: Style of graph background
         :param base_path: The path from where the this class is being run from
+        :param render_pool_size: Number of processes rendering cached graphs, 0 renders in-process
         """
         self.coinbase_api = coinbase_api
         self.currencies = currencies
         self.colors = colors
         self.current_path = base_path
         self.graph_directory_name = "/" + graph_directory_name + "/"
-        self.figure = plt.figure(figsize=screen_size, facecolor="black")
+        self.screen_size = screen_size
 
-        plt.style.use(color_style)  # set style for all graphs
+        # set style for all graphs, figures pick up the style when they are created in new_figure
+        plt.style.use(color_style)
 
         if not self.currencies:
             self.currencies = gs.CURRENCIES
 
-    def save_figure(self, file_name: str, figure: plt.Figure) -> None:
+        self.graph_cache = GraphCache()  # rendered graphs, reused as long as the underlying data doesn't change
+        self.portfolio_engine = PortfolioEngine(coinbase_api)
+
+        metrics.register_collector("graph_cache", lambda: {"graph_cache_hits": self.graph_cache.hits,
+                                                           "graph_cache_misses": self.graph_cache.misses})
+        self.render_backend = renderer.RenderBackend(pool_size=render_pool_size, color_style=color_style)
+
+    def get_color(self, coin: str) -> str:
+        """
+        :return: The color of a coin, generated from its code if it has none in colors
+        """
+        return self.colors.get(coin) or generate_color(coin)
+
+    def save_figure(self, file_name: str, figure: Figure) -> None:
         """
         Saves a plt figure into the directory specified in the constructor
 
         :param file_name: Name of the file (including type, .png, .jpg, etc)
         :param figure: plt Figure object
         """
-
-        if not os.path.exists(self.current_path + self.graph_directory_name):
-            os.mkdir(self.current_path + self.graph_directory_name)
-
+        os.makedirs(self.current_path + self.graph_directory_name, exist_ok=True)
         figure.savefig(self.current_path + self.graph_directory_name + file_name)
 
     @staticmethod
-    def convert_figure_to_pil_image(figure: plt.Figure) -> Image:
+    def convert_figure_to_pil_image(figure: Figure) -> Image:
         """
-        Saves a plt.Figure object into bytes so it doesn't have to be saved to disk
+        Saves a Figure object into bytes so it doesn't have to be saved to disk
+
+        NOTE: Use GraphRenderer.encode_figure if the image is only going to be encoded
+
         :param figure: Pyplot figure which will be converted to bytes
         :return: A PIL Image which can be used later on
         """
+        figure.canvas.draw()
 
         # Convert figure to PIL Image
-        pil_image = Image.frombytes('RGB', figure.canvas.get_width_height(), figure.canvas.tostring_rgb())
+        rgba_buffer = figure.canvas.buffer_rgba()
+        pil_image = Image.frombuffer('RGBA', figure.canvas.get_width_height(), rgba_buffer).convert("RGB")
 
         return pil_image
 
+    def new_figure(self) -> Figure:
+        """
+        Creates a new figure which isn't managed by pyplot, such that several figures can be rendered at the same time
+        (e.g. from different Telegram handler threads) without sharing any global plotting state.
+
+        NOTE: Call close_figure once the figure is no longer needed
+
+        :return: A Figure object attached to an Agg canvas
+        """
+        return renderer.new_figure(self.screen_size)
+
+    @staticmethod
+    def close_figure(figure: Figure) -> None:
+        """
+        Releases the artists held by a figure created with new_figure
+
+        :param figure: The figure which is no longer needed
+        """
+        figure.clear()
+
     def save_individual_graphs(self) -> None:
         """
         saves graphs of prices for each coin in currencies list with respect to CHF.
         """
 
         for coin in self.currencies:
-            times, prices = self.coinbase_api.get_historical(coin)
+            times, prices = self.coinbase_api.get_historical_array(coin)
 
-            plt.plot(np.array(range(len(prices))) - len(prices), prices)
-            plt.xlabel("Time (min)")
-            plt.ylabel(coin + " price (CHF)")
+            figure = self.new_figure()
+            try:
+                axes = figure.add_subplot(1, 1, 1)
+                axes.plot(np.arange(len(prices)) - len(prices), prices)
+                axes.set_xlabel("Time (min)")
+                axes.set_ylabel(coin + " price (CHF)")
 
-            plot = plt.get_current_fig_manager()
-            self.save_figure("hourprices_" + coin + ".png", plot)
+                self.save_figure("hourprices_" + coin + ".png", figure)
+            finally:
+                self.close_figure(figure)
 
-            plt.close()
+    def get_price_matrix(self, period: str = "day") -> (list, np.ndarray, np.ndarray):
+        """
+        Fetches the prices of the currencies aligned on a single time axis, see CoinbaseAPI.get_price_matrix. Coins
+        whose prices fail to load (e.g. coins without prices in the quote currency) are logged and left out, such that
+        the graph shows the other coins.
 
-    def __plot_percentage_change(self, prices_dict: dict, coin: str, percentage_changes: dict,
-                                 is_interactive: bool, sign: str) -> None:
+        :param period: The time period to be graphed.
+        :return: The coins whose prices were loaded, datetime64 time axis and (coins x timestamps) price matrix
         """
-        Plots percentage change graphs and annotates graph with percentage changes for a specified currency
+        coins, series = [], []
+        for coin in self.currencies:
+            try:
+                series.append(self.coinbase_api.get_historical_array(coin, period))
+            except Exception as exception:
+                logger.warning("Failed to load the %s prices of %s, it is left out of the graph: %s", period, coin,
+                               exception)
+                continue
+            coins.append(coin)
+
+        times, prices = cbapi.CoinbaseAPI.build_price_matrix(series)
+        return coins, times, prices
 
-        :param prices_dict: Dictionary which contains the arrays of prices (for each currency) over 24 hours
-        :param coin: Coin which will be graphed
-        :param percentage_changes: Dictionary of percentage changes for each currency
-        :param is_interactive: Flag which activates pause statements to update graphs properly in interactive mode
-        :param sign: Sign corresponding to the percentage change (increase or decrease)
+    def normalised_graph_spec(self, price_matrix: (np.ndarray, np.ndarray), image_format: str = "JPEG",
+                              coins: list = None) -> dict:
         """
-        period = -7  # -24 for days and -7 for week
-        percentage_change_graph = 100 * (np.array(prices_dict[coin]) / prices_dict[coin][0] - 1)
-        plt.plot(np.linspace(period, 0, len(prices_dict[coin])), percentage_change_graph, label=coin,
-                 color=self.colors[coin])
+        Builds the plot spec of the normalised price graph, which can be drawn by GraphRenderer.draw_normalised_graph
 
-        # add coin labels to plot
-        plt.text(0.5, percentage_change_graph[-1], sign + "%.0f%%" % (np.abs(percentage_changes[coin] * 100)) + " "
-                 + coin, color=self.colors[coin], fontsize=10)
-        if is_interactive:
-            plt.pause(0.001)  # the pause statements are required such that an interactive graph updates properly.
+        :param price_matrix: (times, prices) as returned by CoinbaseAPI.get_price_matrix for the coins
+        :param image_format: Format in which the graph is encoded (JPEG, PNG, etc.)
+        :param coins: Coins of the rows of the price matrix, the currencies if None
+        :return: The plot spec
+        """
+        times, prices = price_matrix
+        coins = list(self.currencies if coins is None else coins)
+        percentage_change_graphs = 100 * (prices / prices[:, :1] - 1)
 
-    def normalised_price_graph(self, period: str = "day", filename: str = "trend_graph.png",
-                               is_interactive: bool = True, get_pil_image: bool = False) -> Image:
+        return {"coins": coins, "colors": [self.get_color(coin) for coin in coins],
+                "percentage_change_graphs": percentage_change_graphs,
+                "percentage_changes": percentage_change_graphs[:, -1] / 100,
+                "screen_size": self.screen_size, "image_format": image_format}
+
+    def normalised_price_graph(self, period: str = "day", filename: str = None,
+                               get_pil_image: bool = False, price_matrix: (np.ndarray, np.ndarray) = None) -> Image:
         """
-        Saves a plot of the most significant changing currencies on a normalized graph. If interactive mode is active,
-        then the plot is also shown
+        Plots the most significant changing currencies on a normalized graph. The graph is only saved to disk if a
+        filename is given.
 
         :param period: The time period to be graphed.
-        :param filename: The filename of the output image.
-        :param is_interactive: Specifies whether the plot is in interactive mode. (default = True)
+        :param filename: The filename of the output image, e.g. trend_graph.png. (default = None, not saved)
         :param get_pil_image: Flag which will return None if False or PIL.Image if True
+        :param price_matrix: (times, prices) as returned by CoinbaseAPI.get_price_matrix, fetched if None
         """
         ret = None
-        always_show_threshold = 20 / 100  # Min threshold for currency to be plotted independent of already plotted currencies
-        self.figure.clf()
-
-        prices_dict = {}
-        times_dict = {}
-        percentage_change_dict = {}
 
-        # Create dict of prices for each currency
-        for coin in self.currencies:
-            times, prices = self.coinbase_api.get_historical(coin, period)
-            prices_dict.update({coin: prices})
-            times_dict.update({coin: times})
-            percentage_change_dict.update({coin: (prices[-1] - prices[0]) / prices[0]})
+        # Aligned (coins x timestamps) price matrix for all currencies
+        coins = None
+        if price_matrix is None:
+            coins, times, prices = self.get_price_matrix(period)
+            price_matrix = (times, prices)
 
-        # sorted in order of decreasing percentage change
-        sorted_currencies = (sorted(percentage_change_dict.keys(), key=lambda x: percentage_change_dict[x], reverse=True))
+        figure = self.new_figure()
+        try:
+            renderer.draw_normalised_graph(figure, self.normalised_graph_spec(price_matrix, coins=coins))
 
-        # Plots all currencies which have a percentage change above the always_show_threshold
-        for coin in sorted_currencies[3:-3]:
-            if percentage_change_dict[coin] >= always_show_threshold:
-                plt.subplot(2, 1, 1)  # Change to increasing plot because currency is decreasing (prevents incorrect graphing)
-                self.__plot_percentage_change(prices_dict, coin, percentage_change_dict, is_interactive, "+")
-            if percentage_change_dict[coin] <= -always_show_threshold:
-                plt.subplot(2, 1, 2)  # Change to decreasing plot because currency is decreasing (prevents incorrect graphing)
-                self.__plot_percentage_change(prices_dict, coin, percentage_change_dict, is_interactive, "-")
+            if filename is not None:
+                self.save_figure(filename, figure)
 
-        self.figure.add_subplot(2, 1, 1)
+            if get_pil_image:
+                ret = self.convert_figure_to_pil_image(figure)
+        finally:
+            self.close_figure(figure)
 
-        period_spacing = -8
-        plt.plot([period_spacing, 1], [0, 0], linestyle="--", color="black", linewidth=1.5)
+        return ret
 
-        plt.title("Increasing Currencies")
+    def get_normalised_graph(self, period: str = "week", image_format: str = "JPEG") -> RenderedGraph:
+        """
+        Gets the normalised price graph as an encoded image, rendered in memory without touching the disk. The graph is
+        only rendered (by the render backend) if it hasn't been rendered before from the same price data, otherwise it
+        is served from the graph cache.
 
-        # include first 3 most increasing coins.
-        for coin in sorted_currencies[:3]:
-            if percentage_change_dict[coin] < 0:
-                continue
-            self.__plot_percentage_change(prices_dict, coin, percentage_change_dict, is_interactive, "+")
+        :param period: The time period to be graphed.
+        :param image_format: Format of the encoded image (JPEG, PNG or WebP)
+        :return: The rendered graph (encoded image bytes and Telegram file_id if it was already uploaded)
+        """
+        with metrics.timer("graph_render_seconds", graph="normalised", phase="fetch"):
+            coins, times, prices = self.get_price_matrix(period)
+        key = ("normalised", period, tuple(coins), image_format.upper())
+        fingerprint = GraphCache.fingerprint(times, prices)
 
-        # plot labels etc.
-        plt.xlim(period_spacing, 1)
-        plt.grid()
+        rendered = self.graph_cache.get(key, fingerprint)
+        if rendered is None:
+            spec = self.normalised_graph_spec((times, prices), image_format, coins)
+            image_bytes = self.render_backend.render(renderer.draw_normalised_graph, spec)
+            rendered = self.graph_cache.put(key, fingerprint, image_bytes, image_format.upper())
 
-        # Check if there are increasing currencies, if not then put some text onto the graph
-        if percentage_change_dict[sorted_currencies[0]] < 0.:
-            plt.text(-12, 0, "It's a bad day for crypto.", ha="center", va="center", fontsize=25, color="darkred")
-        else:
-            plt.legend()  # Prevents legend error which is spawned from having an empty plot
+        return rendered
 
-        plt.xlabel("Time")
-        plt.ylabel("Price Change (%)")
+    def portfolio_graph_spec(self, ledger: TransactionLedger, price_series: (np.ndarray, np.ndarray),
+                             image_format: str = "JPEG") -> dict:
+        """
+        Builds the plot spec of the portfolio graph, which can be drawn by GraphRenderer.draw_portfolio_graph
 
-        # Create second graph for decreasing currencies
-        self.figure.add_subplot(2, 1, 2)
-        plt.plot([period_spacing, 1], [0, 0], linestyle="--", color="black", linewidth=1.5)
+        :param ledger: Transaction ledger of the coin as returned by CoinbaseAPI.get_ledger
+        :param price_series: (times, prices) as returned by CoinbaseAPI.get_historical_array
+        :param image_format: Format in which the graph is encoded (JPEG, PNG, etc.)
+        :return: The plot spec
+        """
+        # Amount held before and after every trade, built from the cumulative holdings of the ledger
+        held_times, held_amounts = ledger.get_holdings_series()
 
-        plt.title("Decreasing Currencies")
+        # Value and profits of the position, aligned with the prices
+        position = self.portfolio_engine.get_position(ledger.account_id, price_series=price_series)
 
-        # include first 3 most increasing coins.
-        for coin in sorted_currencies[-3:]:
-            if percentage_change_dict[coin] > 0:
-                continue
-            self.__plot_percentage_change(prices_dict, coin, percentage_change_dict, is_interactive, "-")
+        return {"times": price_series[0], "prices": price_series[1], "held_times": held_times,
+                "held_amounts": held_amounts, "values": position.values, "profits": position.profits,
+                "screen_size": self.screen_size, "image_format": image_format}
 
-        # plot labels etc.
-        plt.xlim(period_spacing, 1)
-        plt.grid()
+    def portfolio_value_graph_spec(self, portfolio_value: (np.ndarray, list, np.ndarray),
+                                   quote_currency: str = gs.QUOTE_CURRENCY, image_format: str = "JPEG") -> dict:
+        """
+        Builds the plot spec of the portfolio value graph, drawn by GraphRenderer.draw_portfolio_value_graph
 
-        if percentage_change_dict[sorted_currencies[-1]] > 0.:
-            plt.text(-12, 0, "It's a good day for crypto!", ha="center", va="center", fontsize=25, color="green")
-        else:
-            plt.legend()
+        :param portfolio_value: (times, coins, values) as returned by PortfolioEngine.get_portfolio_value
+        :param quote_currency: Currency in which the values are expressed
+        :param image_format: Format in which the graph is encoded (JPEG, PNG, etc.)
+        :return: The plot spec
+        """
+        times, coins, values = portfolio_value
 
-        plt.xlabel("Time")
-        plt.ylabel("Price Change (%)")
+        return {"times": times, "coins": coins, "colors": [self.get_color(coin) for coin in coins],
+                "values": values, "quote_currency": quote_currency, "screen_size": self.screen_size,
+                "image_format": image_format}
 
-        # if is_interactive:
-        #     plt.pause(0.1)  # the pause statements are required such that an interactive graph updates properly.
+    def get_portfolio_graph(self, coin: str, period: str = "month", image_format: str = "JPEG") -> RenderedGraph:
+        """
+        Gets the portfolio graph of a coin as an encoded image, rendered in memory without touching the disk. The graph
+        is only rendered (by the render backend) if it hasn't been rendered before from the same prices and
+        transactions, otherwise it is served from the graph cache.
 
-        self.save_figure(filename, self.figure)
+        :param coin: The coin whose portfolio is graphed
+        :param period: The time period to be graphed.
+        :param image_format: Format of the encoded image (JPEG, PNG or WebP)
+        :return: The rendered graph (encoded image bytes and Telegram file_id if it was already uploaded)
+        """
+        coin = coin.upper()
+        with metrics.timer("graph_render_seconds", graph="portfolio", phase="fetch"):
+            ledger = self.coinbase_api.get_ledger(coin)
+            times, prices = self.coinbase_api.get_historical_array(coin, period)
+        transaction_times, amounts, native_amounts, holdings = ledger.snapshot()
+        key = ("portfolio", coin, period, image_format.upper())
+        fingerprint = GraphCache.fingerprint(times, prices, transaction_times, holdings)
+
+        rendered = self.graph_cache.get(key, fingerprint)
+        if rendered is None:
+            spec = self.portfolio_graph_spec(ledger, (times, prices), image_format)
+            image_bytes = self.render_backend.render(renderer.draw_portfolio_graph, spec)
+            rendered = self.graph_cache.put(key, fingerprint, image_bytes, image_format.upper())
+
+        return rendered
+
+    def get_portfolio_value_graph(self, period: str = "month", image_format: str = "JPEG") -> RenderedGraph:
+        """
+        Gets the graph of the value of all coins held (among the currencies) as an encoded image. The graph is only
+        rendered if it hasn't been rendered before from the same values, otherwise it is served from the graph cache.
 
-        if get_pil_image:
-            ret = self.convert_figure_to_pil_image(self.figure)
+        :param period: The time period to be graphed.
+        :param image_format: Format of the encoded image (JPEG, PNG or WebP)
+        :return: The rendered graph (encoded image bytes and Telegram file_id if it was already uploaded)
+        """
+        with metrics.timer("graph_render_seconds", graph="portfolio_value", phase="fetch"):
+            times, coins, values = self.portfolio_engine.get_portfolio_value(self.currencies, period)
+        key = ("portfolio_value", period, tuple(self.currencies), image_format.upper())
+        fingerprint = GraphCache.fingerprint(times, np.array(coins, dtype=str), values)
 
-        if is_interactive:
-            plt.clf()
+        rendered = self.graph_cache.get(key, fingerprint)
+        if rendered is None:
+            spec = self.portfolio_value_graph_spec((times, coins, values), image_format=image_format)
+            image_bytes = self.render_backend.render(renderer.draw_portfolio_value_graph, spec)
+            rendered = self.graph_cache.put(key, fingerprint, image_bytes, image_format.upper())
 
-        return ret
+        return rendered
 
     def display_live_plot(self, period: str = "day", filename: str = "trend_graph.png", delay: int = 5 * 60)\
             -> None:
@@ -226,68 +333,39 @@ class PriceGraph:
         """
         plt.ion()   # enable interactive mode (allows for live updating of the plot)
 
+        # The graph is rendered off-screen and then shown in a pyplot window
+        live_figure = plt.figure(figsize=self.screen_size, facecolor="black")
+        live_axes = live_figure.add_axes((0, 0, 1, 1))
+        live_axes.axis("off")
+
         while True:
-            self.normalised_price_graph(period, filename, is_interactive=False)
+            live_axes.clear()
+            live_axes.axis("off")
+            live_axes.imshow(self.normalised_price_graph(period, filename, get_pil_image=True))
             plt.pause(delay)
 
-    def portfolio_price_graph(self, coin: str, period: str = "month") -> Image:
-        transactions = self.coinbase_api.get_transaction_history(coin)
-        coins_traded, dates = [], []
-        prices, times = [], []
-        coins_held = []
-
-        currency_pair = coin+"-CHF"
-        historic = self.coinbase_api.client.get_historic_prices(currency_pair=currency_pair, period=period)
-
-        self.figure.clf()
-        self.figure = plt.figure()
-
-        # Create prices and times arrays
-        for price_dict in historic["prices"]:
-            times.append(datetime.datetime.strptime(price_dict["time"], "%Y-%m-%dT%H:%M:%SZ"))
-            prices.append(float(price_dict["price"]))
-
-        # Reverse arrays such time increases higher indices
-        prices.reverse()
-        times.reverse()
-
-        # Converts datetime strings to datetime.datetime format
-        transactions = [(transaction[0], datetime.datetime.strptime(transaction[1], "%Y-%m-%dT%H:%M:%SZ")) for transaction in transactions]
-
-        # Sort transactions in order of time created
-        transactions.sort(key=lambda transaction: transaction[1])
-
-        # Populate coins_traded and corresponding dates array
-        for transaction in transactions:
-            coins_traded.append(transaction[0])
-            dates.append(transaction[1])
-
-        # Produce amount_held array
-        current_amount = 0
-        for i in range(len(transactions)):
-            date, coin_traded = transactions[i][1], transactions[i][0]
-
-            coins_held.append((date, current_amount))  # plot the point before the trade
-            current_amount += coin_traded
-            coins_held.append((date, current_amount))  # plot the point after the trade
-        coins_held.append((datetime.datetime.now(), current_amount))
-
-        # plot historical prices
-        self.figure.add_subplot(2, 1, 1)
-        plt.plot(times, prices)
-        plt.xlim([min(times), max(times)])
-        plt.grid()
-
-        self.figure.add_subplot(2, 1, 2)
-        coins_held = np.array(coins_held).swapaxes(0,1)
-        coins_held_date = coins_held[0]
-        coins_held_amount = coins_held[1]
-        plt.plot(coins_held_date, coins_held_amount)
-        plt.xlim([min(times), max(times)])
-        plt.grid()
-
-        self.figure.canvas.draw()  # Needs to be added to prevent renderer exception from being raised
-        return self.convert_figure_to_pil_image(figure=self.figure)
+    def portfolio_price_graph(self, coin: str, period: str = "month", ledger: TransactionLedger = None,
+                              price_series: (np.ndarray, np.ndarray) = None) -> Image:
+        """
+        Plots the price of a coin along with the amount of the coin held over the given period
+
+        :param coin: The coin whose portfolio is graphed
+        :param period: The time period to be graphed.
+        :param ledger: Transaction ledger of the coin as returned by CoinbaseAPI.get_ledger, fetched if None
+        :param price_series: (times, prices) as returned by CoinbaseAPI.get_historical_array, fetched if None
+        :return: PIL.Image of the graph
+        """
+        if ledger is None:
+            ledger = self.coinbase_api.get_ledger(coin)
+        if price_series is None:
+            price_series = self.coinbase_api.get_historical_array(coin, period)
+
+        figure = self.new_figure()
+        try:
+            renderer.draw_portfolio_graph(figure, self.portfolio_graph_spec(ledger, price_series))
+            return self.convert_figure_to_pil_image(figure=figure)
+        finally:
+            self.close_figure(figure)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+import numpy as np
+import threading
+import os
+
+
+class PriceHistoryStore:
+    """
+    This class persists historic prices on disk, such that long periods don't have to be downloaded again after a
+    restart and history older than what the coinbase historic prices endpoint returns is kept.
+
+    Every coin/quote currency pair is stored as two append-only columns, <pair>.times (int64 epoch seconds) and
+    <pair>.prices (float64), which are read through numpy.memmap.
+    """
+
+    def __init__(self, directory: str, persisted_periods: tuple = ("month", "year", "all")):
+        """
+        :param directory: Directory in which the price files are stored, created if it doesn't exist
+        :param persisted_periods: Periods which CoinbaseAPI serves from the store. Short periods are better served by
+                                  the cache, since the store mixes the resolutions of the periods it was filled from.
+        """
+        self.directory = directory
+        self.persisted_periods = persisted_periods
+
+        self.__columns = {}  # pair -> (times memmap, prices memmap), dropped whenever the pair is appended to
+        self.__lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __paths(self, pair: str) -> (str, str):
+        return os.path.join(self.directory, pair + ".times"), os.path.join(self.directory, pair + ".prices")
+
+    @staticmethod
+    def __map(path: str, dtype, count: int) -> np.ndarray:
+        if count == 0:
+            empty = np.empty(0, dtype=dtype)
+            empty.flags.writeable = False
+            return empty
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def read(self, coin: str, quote_currency: str) -> (np.ndarray, np.ndarray):
+        """
+        Reads the stored prices of a pair
+
+        :param coin: The coin whose prices are read
+        :param quote_currency: Currency in which the prices are expressed
+        :return: read-only int64 epoch second times and float64 prices respectively, ordered from oldest to newest
+        """
+        pair = coin.upper() + "-" + quote_currency.upper()
+
+        with self.__lock:
+            columns = self.__columns.get(pair)
+            if columns is None:
+                times_path, prices_path = self.__paths(pair)
+                times_size = os.path.getsize(times_path) if os.path.exists(times_path) else 0
+                prices_size = os.path.getsize(prices_path) if os.path.exists(prices_path) else 0
+
+                # An interrupted append can leave one column longer than the other, only complete rows are read
+                count = min(times_size // 8, prices_size // 8)
+                columns = (self.__map(times_path, np.int64, count), self.__map(prices_path, np.float64, count))
+                self.__columns[pair] = columns
+
+        return columns
+
+    def append(self, coin: str, quote_currency: str, times: np.ndarray, prices: np.ndarray) -> int:
+        """
+        Appends the prices which are newer than the newest stored price of a pair
+
+        :param coin: The coin whose prices are stored
+        :param quote_currency: Currency in which the prices are expressed
+        :param times: Times of the prices in seconds since epoch, ordered from oldest to newest
+        :param prices: The prices
+        :return: The number of appended prices
+        """
+        pair = coin.upper() + "-" + quote_currency.upper()
+        times = np.asarray(times, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+
+        # The whole append happens under the lock, such that concurrent appends to the same pair can't both filter
+        # against the same newest price and write (or truncate away) each other's rows
+        with self.__lock:
+            times_path, prices_path = self.__paths(pair)
+            sizes = [os.path.getsize(path) if os.path.exists(path) else 0 for path in (times_path, prices_path)]
+            count = min(size // 8 for size in sizes)  # complete rows, taken from the files rather than a prior read
+
+            if count:
+                with open(times_path, "rb") as file:
+                    file.seek((count - 1) * 8)
+                    newer = times > np.frombuffer(file.read(8), dtype=np.int64)[0]
+                times, prices = times[newer], prices[newer]
+
+            if len(times) == 0:
+                return 0
+
+            for path, size, values in ((prices_path, sizes[1], prices), (times_path, sizes[0], times)):
+                with open(path, "ab") as file:
+                    # Only drop what lies beyond the complete rows (left behind by an interrupted append), such that
+                    # memmaps of the complete rows held by readers are never shrunk
+                    if size > count * 8:
+                        file.truncate(count * 8)
+                    file.write(values.tobytes())
+
+            self.__columns.pop(pair, None)
+
+        return len(times)
@@ -0,0 +1,318 @@
+from utils.coinbase_utils.RingBuffer import PriceRingBuffer
+import utils.coinbase_utils.GlobalStatics as statics
+from abc import ABC, abstractmethod
+import numpy as np
+import threading
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """
+    Converts an ISO timestamp as sent by coinbase (2021-03-21T10:00:00.123456Z) into epoch seconds
+
+    :param timestamp: The ISO timestamp
+    :return: Seconds since epoch
+    """
+    return int(np.datetime64(timestamp.rstrip("Z"), "s").astype(np.int64))
+
+
+class PriceFeed(ABC):
+    """
+    Base class of price tick sources. A feed calls the tick callback with (coin, epoch seconds, price) for every tick
+    it receives until it is stopped.
+    """
+
+    @abstractmethod
+    def start(self, coins: list, quote_currency: str, on_tick) -> None:
+        """
+        Starts delivering ticks in the background
+
+        :param coins: Coins for which ticks are delivered
+        :param quote_currency: Currency in which the prices are expressed
+        :param on_tick: Callable taking (coin, timestamp, price)
+        """
+
+    @abstractmethod
+    def stop(self) -> None:
+        """
+        Stops delivering ticks
+        """
+
+
+class CoinbaseTickerFeed(PriceFeed):
+    """
+    This class subscribes to the ticker channel of the coinbase exchange websocket feed using cbpro. The products
+    acknowledged by the feed are checked against the subscribed ones, products which don't exist are logged.
+
+    NOTE: The coinbase exchange only lists a few quote currencies (USD, EUR, GBP, etc.), the quote currency of the
+    stream has to be one of them (see GlobalStatics.STREAM_QUOTE_CURRENCY)
+    """
+
+    def __init__(self, url: str = "wss://ws-feed.exchange.coinbase.com"):
+        """
+        :param url: URL of the websocket feed
+        """
+        self.url = url
+        self.__client = None
+
+    def start(self, coins: list, quote_currency: str, on_tick) -> None:
+        import cbpro  # only needed when prices are streamed
+
+        products = [coin + "-" + quote_currency for coin in coins]
+
+        class TickerClient(cbpro.WebsocketClient):
+            def on_message(self, message):
+                if message.get("type") == "subscriptions":
+                    CoinbaseTickerFeed.check_subscriptions(products, message)
+                    return
+                if message.get("type") == "error":
+                    logger.warning("Ticker feed rejected the subscription: %s %s", message.get("message"),
+                                   message.get("reason", ""))
+                    return
+                if message.get("type") != "ticker" or "time" not in message:
+                    return
+                coin = message["product_id"].split("-")[0]
+                on_tick(coin, parse_timestamp(message["time"]), float(message["price"]))
+
+            def on_error(self, exception, data=None):
+                logger.warning("Ticker feed error: %s", exception)
+
+        self.__client = TickerClient(url=self.url, products=products, channels=["ticker"], should_print=False)
+        self.__client.start()
+
+    @staticmethod
+    def check_subscriptions(products: list, message: dict) -> list:
+        """
+        Logs the subscribed products which the feed didn't acknowledge, i.e. which never tick
+
+        :param products: The subscribed product ids (BTC-USD, etc.)
+        :param message: The subscriptions message sent by the feed
+        :return: The acknowledged product ids
+        """
+        acknowledged = [product for channel in message.get("channels", []) if channel.get("name") == "ticker"
+                        for product in channel.get("product_ids", [])]
+        missing = sorted(set(products) - set(acknowledged))
+
+        if not acknowledged:
+            logger.warning("Ticker feed acknowledged none of the %d subscribed products, is the quote currency listed "
+                           "on the coinbase exchange?", len(products))
+        elif missing:
+            logger.warning("Ticker feed doesn't list %d of the subscribed products: %s", len(missing),
+                           ", ".join(missing))
+        return acknowledged
+
+    def stop(self) -> None:
+        if self.__client is not None:
+            self.__client.close()
+            self.__client = None
+
+
+class ReplayFeed(PriceFeed):
+    """
+    This class replays recorded ticks, e.g. for testing the alerting and graphing code without a network connection.
+    Ticks are either given as (coin, epoch seconds, price) tuples or as a file containing one ticker message (as sent
+    by the coinbase pro websocket feed) per line.
+    """
+
+    def __init__(self, ticks=None, file_name: str = None, speed: float = 0.):
+        """
+        :param ticks: Iterable of (coin, epoch seconds, price) tuples ordered by time
+        :param file_name: Path to a JSON lines file of ticker messages, used if ticks is None
+        :param speed: Replay speed relative to the recorded time, 0 replays as fast as possible
+        """
+        self.ticks = ticks
+        self.file_name = file_name
+        self.speed = speed
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def __read_ticks(self):
+        """
+        Reads the ticks which are replayed
+
+        :return: Generator of (coin, epoch seconds, price) tuples
+        """
+        if self.ticks is not None:
+            yield from self.ticks
+            return
+
+        with open(self.file_name) as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                yield message["product_id"].split("-")[0], parse_timestamp(message["time"]), float(message["price"])
+
+    def start(self, coins: list, quote_currency: str, on_tick) -> None:
+        coins = set(coins)
+
+        def replay():
+            previous_timestamp = None
+            for coin, timestamp, price in self.__read_ticks():
+                if self.__stopped.is_set():
+                    return
+                if self.speed > 0 and previous_timestamp is not None:
+                    self.__stopped.wait(max(timestamp - previous_timestamp, 0) / self.speed)
+                previous_timestamp = timestamp
+                if coin in coins:
+                    on_tick(coin, timestamp, price)
+
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=replay, daemon=True, name="replay-feed")
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+    def join(self, timeout: float = None) -> None:
+        """
+        Waits until all ticks have been replayed
+
+        :param timeout: Maximum time (in seconds) to wait
+        """
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+
+class PriceStream:
+    """
+    This class ingests price ticks from a feed and keeps a rolling window of prices per coin in memory, each held in a
+    fixed-capacity PriceRingBuffer. The windows are seeded from the coinbase REST API once, after which they are kept up
+    to date by the feed alone.
+
+    Use this class (through CoinbaseAPI.attach_price_stream) to serve historic prices of recent periods without polling
+    coinbase.
+    """
+
+    def __init__(self, coins: list, feed: PriceFeed, quote_currency: str = statics.QUOTE_CURRENCY,
+                 window_period: str = "week", resolution: int = 60, max_staleness: int = 5*60):
+        """
+        :param coins: Coins whose prices are streamed
+        :param feed: Source of price ticks (CoinbaseTickerFeed, ReplayFeed, etc.)
+        :param quote_currency: Currency in which prices are expressed
+        :param window_period: Longest period which is served from the stream ("hour", "day", "week", etc.)
+        :param resolution: Minimum time (in seconds) between two prices held in a window
+        :param max_staleness: Time (in seconds) without ticks after which a coin is no longer served from the stream
+        """
+        self.coins = list(coins)
+        self.feed = feed
+        self.quote_currency = quote_currency.upper()
+        self.window_period = window_period
+        self.resolution = resolution
+        self.max_staleness = max_staleness
+
+        capacity = statics.PERIOD_SECONDS[window_period] // resolution + 1
+        self.__windows = {coin: PriceRingBuffer(capacity, resolution) for coin in self.coins}
+        self.__last_tick = {}  # coin -> local time of the last tick
+        self.__listeners = []
+        self.__lock = threading.Lock()
+
+    def seed(self, coinbase_api) -> None:
+        """
+        Fills the windows with historic prices from the coinbase REST API. Shorter periods have a higher resolution, so
+        they replace the end of the longer ones.
+
+        :param coinbase_api: CoinbaseAPI object used to fetch the historic prices
+        """
+        periods = [period for period in ["week", "day", "hour"]
+                   if statics.PERIOD_SECONDS[period] <= statics.PERIOD_SECONDS[self.window_period]]
+
+        for coin in self.coins:
+            times, prices = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+            try:
+                for period in periods:
+                    period_times, period_prices = coinbase_api.get_historical_array(coin, period, self.quote_currency)
+                    period_times = period_times.astype(np.int64)
+                    if len(period_times) == 0:
+                        continue
+                    keep = times < period_times[0]
+                    times = np.concatenate([times[keep], period_times])
+                    prices = np.concatenate([prices[keep], period_prices])
+            except Exception as exception:
+                logger.warning("Failed to seed price stream for %s: %s", coin, exception)
+                continue
+
+            with self.__lock:
+                self.__windows[coin].extend(times, prices)
+
+    def start(self) -> None:
+        """
+        Starts ingesting ticks from the feed
+        """
+        self.feed.start(self.coins, self.quote_currency, self.on_tick)
+
+    def stop(self) -> None:
+        """
+        Stops ingesting ticks from the feed
+        """
+        self.feed.stop()
+
+    def add_listener(self, listener) -> None:
+        """
+        Registers a callable which is called with (coin, timestamp, price) after every tick has been ingested
+
+        :param listener: The callable
+        """
+        with self.__lock:
+            self.__listeners.append(listener)
+
+    def on_tick(self, coin: str, timestamp: int, price: float) -> None:
+        """
+        Ingests a single price tick
+
+        :param coin: The coin the price belongs to
+        :param timestamp: Time of the price in seconds since epoch
+        :param price: The price
+        """
+        with self.__lock:
+            window = self.__windows.get(coin)
+            if window is None:
+                return
+            window.append(timestamp, price)
+            self.__last_tick[coin] = time.monotonic()
+            listeners = list(self.__listeners)
+
+        for listener in listeners:
+            listener(coin, timestamp, price)
+
+    def get_window(self, coin: str, period: str) -> (np.ndarray, np.ndarray):
+        """
+        Gets the streamed prices of a coin over a trailing period without copying them. The arrays are read-only views
+        into the ring buffer of the coin, which later ticks write to (see PriceRingBuffer). Copy them and compare the
+        generation of the coin (see get_generation) before and after copying to keep a consistent snapshot.
+
+        :param coin: The coin whose prices are returned
+        :param period: The period ("hour", "day", "week", etc.)
+        :return: datetime64 times and float64 prices respectively, or None if the stream doesn't cover the period or
+                 hasn't received a tick for max_staleness seconds
+        """
+        seconds = statics.PERIOD_SECONDS.get(period)
+
+        with self.__lock:
+            window = self.__windows.get(coin.upper())
+            last_tick = self.__last_tick.get(coin.upper())
+
+            if seconds is None or window is None or last_tick is None or len(window) == 0:
+                return None
+            if time.monotonic() - last_tick > self.max_staleness:
+                return None
+            # Coinbase's own series don't span their period exactly, so allow the window to fall slightly short
+            if window.first_timestamp > window.last_timestamp - seconds + max(self.resolution, seconds // 24):
+                return None
+
+            times, prices = window.window(seconds)
+
+        return times.view("datetime64[s]"), prices
+
+    def get_generation(self, coin: str) -> int:
+        """
+        :param coin: The coin
+        :return: Number of prices written to the ring buffer of the coin, changes whenever its windows change
+        """
+        with self.__lock:
+            window = self.__windows.get(coin.upper())
+            return window.generation if window is not None else 0
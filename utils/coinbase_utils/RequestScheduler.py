@@ -0,0 +1,208 @@
+from concurrent.futures import Future
+from coinbase.wallet.error import APIError
+import requests
+import contextlib
+import threading
+import logging
+import random
+import queue
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priorities of requests, lower values are sent first
+PRIORITY_INTERACTIVE = 0  # Telegram commands, a user is waiting for the answer
+PRIORITY_ALERTS = 1  # spike alerts
+PRIORITY_BACKGROUND = 2  # pre-rendering graphs, seeding streams, etc.
+
+
+class TokenBucket:
+    """
+    This class limits the rate at which requests are made. The bucket holds up to capacity tokens and is refilled at a
+    constant rate, every request takes one token and waits until one is available.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: Number of tokens added per second
+        :param capacity: Maximum number of tokens, i.e. the size of the largest burst of requests
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = capacity
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Takes a token from the bucket, blocks until one is available
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated) * self.rate)
+                self.__updated = now
+
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait_time = (1 - self.__tokens) / self.rate
+
+            time.sleep(wait_time)
+
+
+class RequestScheduler:
+    """
+    This class is intended to be the single path through which requests reach coinbase. Requests are queued by priority
+    and sent by a fixed number of worker threads at a rate limited by a token bucket. Requests which fail because of
+    rate limiting (429) or server errors (5xx) are retried with exponential backoff and jitter, and identical requests
+    which are already queued or in flight are coalesced into a single upstream call.
+
+    Use this class (through CoinbaseAPI) to call coinbase from any thread, the priority of the calls made by a thread is
+    set with the priority context manager.
+    """
+
+    def __init__(self, rate: float = 8., burst: int = 10, workers: int = 4, max_retries: int = 4,
+                 backoff: float = 0.5, max_backoff: float = 30.):
+        """
+        :param rate: Maximum sustained number of requests per second (coinbase allows 10 per second per API key)
+        :param burst: Maximum number of requests sent at once after being idle
+        :param workers: Number of worker threads, i.e. the maximum number of requests in flight
+        :param max_retries: Number of times a request is retried before its error is raised
+        :param backoff: Base delay (in seconds) of the exponential backoff
+        :param max_backoff: Maximum delay (in seconds) between two attempts
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.__queue = queue.PriorityQueue()
+        self.__in_flight = {}  # request key -> Future of the queued or running request
+        self.__sequence = 0  # keeps requests of equal priority in FIFO order
+        self.__context = threading.local()
+        self.__lock = threading.Lock()
+
+        self.stats = {"requests": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+        for index in range(workers):
+            threading.Thread(target=self.__work, daemon=True, name="coinbase-request-" + str(index)).start()
+
+    @contextlib.contextmanager
+    def priority(self, priority: int):
+        """
+        Context manager which sets the priority of all requests made by the current thread within the context
+
+        :param priority: PRIORITY_INTERACTIVE, PRIORITY_ALERTS or PRIORITY_BACKGROUND
+        """
+        previous = self.get_priority()
+        self.__context.priority = priority
+        try:
+            yield
+        finally:
+            self.__context.priority = previous
+
+    def get_priority(self) -> int:
+        """
+        :return: The priority of requests made by the current thread, PRIORITY_INTERACTIVE unless set otherwise
+        """
+        return getattr(self.__context, "priority", PRIORITY_INTERACTIVE)
+
+    def submit(self, key: tuple, function, priority: int = None) -> Future:
+        """
+        Queues a request, or joins an identical request which is already queued or in flight
+
+        :param key: Identifies the request, requests with equal keys are coalesced
+        :param function: Callable without arguments which makes the request
+        :param priority: Priority of the request, the priority of the current thread if None
+        :return: Future of the result of the request
+        """
+        priority = self.get_priority() if priority is None else priority
+
+        with self.__lock:
+            future = self.__in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+
+            future = Future()
+            self.__in_flight[key] = future
+            self.__sequence += 1
+            self.__queue.put((priority, self.__sequence, key, function, future))
+
+        return future
+
+    def call(self, key: tuple, function, priority: int = None):
+        """
+        Same as submit, but waits for the result of the request
+
+        :return: The result of the request, raises the error of the last attempt if the request failed
+        """
+        return self.submit(key, function, priority).result()
+
+    def __retry_delay(self, exception: Exception, attempt: int) -> float:
+        """
+        Decides whether a failed request is retried
+
+        :param exception: The error of the failed attempt
+        :param attempt: Number of the failed attempt, starting at 0
+        :return: Delay (in seconds) before the next attempt, or None if the error is raised
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        if isinstance(exception, APIError):
+            if exception.status_code != 429 and exception.status_code < 500:
+                return None
+            retry_after = exception.response.headers.get("Retry-After") if exception.response is not None else None
+            if retry_after is not None and retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        elif not isinstance(exception, (requests.ConnectionError, requests.Timeout)):
+            return None
+
+        # Full jitter, such that requests which failed together don't retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def __work(self) -> None:
+        """
+        Worker loop, sends queued requests in order of priority
+        """
+        while True:
+            priority, sequence, key, function, future = self.__queue.get()
+
+            attempt = 0
+            while True:
+                self.bucket.acquire()
+                self.__count("requests")
+                try:
+                    result = function()
+                except Exception as exception:
+                    delay = self.__retry_delay(exception, attempt)
+                    if delay is None:
+                        self.__count("failures")
+                        self.__finish(key, future, exception=exception)
+                        break
+                    logger.warning("Request %s failed (%s), retrying in %.1fs", key[0], exception, delay)
+                    self.__count("retries")
+                    attempt += 1
+                    time.sleep(delay)
+                else:
+                    self.__finish(key, future, result=result)
+                    break
+
+    def __count(self, stat: str) -> None:
+        with self.__lock:
+            self.stats[stat] += 1
+
+    def __finish(self, key: tuple, future: Future, result=None, exception: Exception = None) -> None:
+        """
+        Completes a request, later requests with the same key are sent again
+        """
+        with self.__lock:
+            self.__in_flight.pop(key, None)
+
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class PriceRingBuffer:
+    """
+    This class is a fixed-capacity time series of prices backed by NumPy arrays (int64 epoch seconds and float64
+    prices). Appending is O(1) and never allocates, once the buffer is full the oldest price is overwritten.
+
+    Every value is written twice (at index i and i + capacity), such that any trailing window is a contiguous slice of
+    the arrays and can be returned as a view without copying.
+
+    NOTE: Views reflect later writes, the newest price of a view changes when it is replaced by a tick within the same
+    resolution bucket and the oldest prices of a full-capacity view are overwritten by the next appends. Every write
+    increments generation, a view which was copied while the generation didn't change is a consistent snapshot.
+    """
+
+    def __init__(self, capacity: int, resolution: int = 1):
+        """
+        :param capacity: Maximum number of prices held by the buffer
+        :param resolution: Minimum time (in seconds) between two prices, prices within the same bucket replace each
+                           other
+        """
+        self.capacity = capacity
+        self.resolution = resolution
+
+        self.__times = np.zeros(2 * capacity, dtype=np.int64)
+        self.__prices = np.zeros(2 * capacity, dtype=np.float64)
+        self.__next = 0  # index (< capacity) at which the next price is written
+        self.__size = 0
+        self.generation = 0  # number of writes, see the note on views
+
+    def __write(self, index: int, timestamp: int, price: float) -> None:
+        self.generation += 1
+        self.__times[index] = self.__times[index + self.capacity] = timestamp
+        self.__prices[index] = self.__prices[index + self.capacity] = price
+
+    def append(self, timestamp: int, price: float) -> None:
+        """
+        Adds a price to the buffer. Prices older than the newest price in the buffer are ignored.
+
+        :param timestamp: Time of the price in seconds since epoch
+        :param price: The price
+        """
+        if self.__size:
+            last = (self.__next - 1) % self.capacity
+            last_timestamp = self.__times[last]
+            if timestamp < last_timestamp:
+                return
+            if timestamp // self.resolution == last_timestamp // self.resolution:
+                self.__write(last, timestamp, price)
+                return
+
+        self.__write(self.__next, timestamp, price)
+        self.__next = (self.__next + 1) % self.capacity
+        self.__size = min(self.__size + 1, self.capacity)
+
+    def extend(self, times: np.ndarray, prices: np.ndarray) -> None:
+        """
+        Adds several prices to the buffer
+
+        :param times: Times of the prices in seconds since epoch, ordered from oldest to newest
+        :param prices: The prices
+        """
+        for timestamp, price in zip(times.tolist(), prices.tolist()):
+            self.append(timestamp, price)
+
+    def view(self, count: int = None) -> (np.ndarray, np.ndarray):
+        """
+        Gets the newest prices in the buffer without copying them
+
+        :param count: Number of prices, all prices if None
+        :return: read-only views of the epoch second times and prices respectively, ordered from oldest to newest
+        """
+        count = self.__size if count is None else min(count, self.__size)
+        end = self.__next + self.capacity
+        times, prices = self.__times[end - count:end], self.__prices[end - count:end]
+
+        times.flags.writeable = False
+        prices.flags.writeable = False
+        return times, prices
+
+    def window(self, seconds: int) -> (np.ndarray, np.ndarray):
+        """
+        Gets the prices within the trailing time window without copying them
+
+        :param seconds: Length of the window in seconds, measured back from the newest price
+        :return: read-only views of the epoch second times and prices respectively, ordered from oldest to newest
+        """
+        times, prices = self.view()
+        if len(times) == 0:
+            return times, prices
+
+        start = np.searchsorted(times, times[-1] - seconds, side="left")
+        return times[start:], prices[start:]
+
+    @property
+    def first_timestamp(self) -> int:
+        return int(self.view()[0][0]) if self.__size else None
+
+    @property
+    def last_timestamp(self) -> int:
+        return int(self.__times[(self.__next - 1) % self.capacity]) if self.__size else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.__times.nbytes + self.__prices.nbytes
+
+    def __len__(self) -> int:
+        return self.__size
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    This class is intended to store the results of expensive calls (such as requests to the coinbase API) for a limited
+    amount of time. Entries expire after their time to live has passed, and the least recently used entries are evicted
+    once the cache has reached its maximum size.
+
+    Use this class to share fetched data between threads (scheduler and Telegram dispatcher), all methods are
+    thread-safe.
+    """
+
+    def __init__(self, max_size: int = 256, default_ttl: float = 60., clock=time.monotonic):
+        """
+        :param max_size: Maximum number of entries held by the cache before the least recently used one is evicted
+        :param default_ttl: Time to live (in seconds) used when no ttl is given for an entry
+        :param clock: Callable without arguments returning the current time in seconds, monotonic time by default
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()  # key -> (expiry time, value), ordered from least to most recently used
+        self.__lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """
+        Retrieves a value from the cache if it exists and has not yet expired
+
+        :param key: The key under which the value was stored
+        :param default: Value returned if the key is missing or expired
+        :return: The cached value or default
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self.__entries[key]
+                self.misses += 1
+                return default
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl: float = None) -> None:
+        """
+        Stores a value in the cache, evicting the least recently used entries if the cache is full
+
+        :param key: The key under which the value is stored
+        :param value: The value which should be cached
+        :param ttl: Time to live (in seconds) of the entry, default_ttl is used if None
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+
+        with self.__lock:
+            self.__entries[key] = (self.clock() + ttl, value)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def get_or_load(self, key, loader, ttl: float = None):
+        """
+        Retrieves a value from the cache, calling loader to produce (and store) the value if it is missing or expired.
+
+        NOTE: The loader is called without holding the lock, concurrent misses on the same key may both call loader
+
+        :param key: The key under which the value is stored
+        :param loader: Callable without arguments which produces the value
+        :param ttl: Time to live (in seconds) of the entry, default_ttl is used if None
+        :return: The cached or freshly loaded value
+        """
+        missing = object()
+        value = self.get(key, missing)
+
+        if value is missing:
+            value = loader()
+            self.put(key, value, ttl)
+
+        return value
+
+    def invalidate(self, key=None) -> None:
+        """
+        Removes an entry from the cache, or all entries if no key is given
+
+        :param key: The key which should be removed
+        """
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(key, None)
+
+    def get_stats(self) -> dict:
+        """
+        Reports how effective the cache has been
+
+        :return: Dictionary containing the hits, misses, hit rate and current number of entries
+        """
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.__entries),
+                    "hit_rate": self.hits / lookups if lookups else 0.}
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__entries)
@@ -0,0 +1,131 @@
+import numpy as np
+import threading
+import time
+
+
+class TransactionLedger:
+    """
+    This class is intended to keep a local copy of the transactions of a coinbase account, such that the portfolio and
+    profit computations don't have to download and parse the transaction history on every request.
+
+    Transactions are held in arrays ordered from oldest to newest (times, amounts of the coin and amounts in the native
+    currency of the user) along with the cumulative amount held after every transaction. The ledger is synced
+    incrementally, only transactions newer than the last synced one are fetched.
+
+    Use this class through CoinbaseAPI.get_ledger, which syncs the ledger of an account when it is out of date.
+    """
+
+    def __init__(self, account_id: str):
+        """
+        :param account_id: The coinbase account, coinbase accepts the currency code (BTC, XLM, etc.) for the primary one
+        """
+        self.account_id = account_id
+
+        self.times = np.empty(0, dtype="datetime64[s]")
+        self.amounts = np.empty(0, dtype=np.float64)
+        self.native_amounts = np.empty(0, dtype=np.float64)
+        self.holdings = np.empty(0, dtype=np.float64)  # amount held after every transaction
+        self.native_currency = None  # currency of the native amounts, known once a transaction is synced
+
+        self.last_id = None  # pagination cursor, id of the newest synced transaction
+        self.synced_at = None  # local (monotonic) time of the last sync
+        self.__lock = threading.Lock()  # held while syncing
+        self.__state_lock = threading.Lock()  # held while the arrays are replaced or read together
+
+    def sync(self, fetch_page, page_size: int = 100) -> int:
+        """
+        Fetches the transactions which are newer than the newest synced transaction, following the pagination until
+        all of them are retrieved
+
+        :param fetch_page: Callable taking the keyword arguments of Client.get_transactions (limit, order,
+                           starting_after) which returns a page of transactions
+        :param page_size: Number of transactions fetched per page
+        :return: The number of new transactions
+        """
+        with self.__lock:
+            params = {"limit": page_size, "order": "asc"}
+            new_transactions = 0
+
+            while True:
+                if self.last_id is not None:
+                    params["starting_after"] = self.last_id
+
+                page = fetch_page(**params)
+                transactions = page.get("data", [])
+                if transactions:
+                    self.__append(transactions)
+                    self.last_id = transactions[-1]["id"]
+                    new_transactions += len(transactions)
+
+                pagination = page.pagination
+                if not transactions or not pagination or not pagination.get("next_starting_after"):
+                    break
+
+            self.synced_at = time.monotonic()
+            return new_transactions
+
+    def __append(self, transactions: list) -> None:
+        """
+        Adds a page of transactions to the arrays and extends the cumulative holdings
+
+        :param transactions: Transactions as returned by Client.get_transactions, ordered from oldest to newest
+        """
+        times = np.array([transaction["created_at"].rstrip("Z") for transaction in transactions], dtype="datetime64[s]")
+        amounts = np.array([transaction["amount"]["amount"] for transaction in transactions], dtype=np.float64)
+        native_amounts = np.array([transaction["native_amount"]["amount"] for transaction in transactions],
+                                  dtype=np.float64)
+
+        previously_held = self.holdings[-1] if len(self.holdings) else 0.
+        all_times = np.concatenate([self.times, times])
+        all_amounts = np.concatenate([self.amounts, amounts])
+        all_native_amounts = np.concatenate([self.native_amounts, native_amounts])
+
+        if len(self.times) and times.min() < self.times[-1]:
+            # Transactions older than the synced ones, sort everything and recompute the holdings
+            order = np.argsort(all_times, kind="stable")
+            all_times, all_amounts, all_native_amounts = all_times[order], all_amounts[order], all_native_amounts[order]
+            holdings = np.cumsum(all_amounts)
+        else:
+            holdings = np.concatenate([self.holdings, previously_held + np.cumsum(amounts)])
+
+        with self.__state_lock:
+            self.times, self.amounts, self.native_amounts, self.holdings = \
+                all_times, all_amounts, all_native_amounts, holdings
+            self.native_currency = transactions[-1]["native_amount"]["currency"].upper()
+
+    def snapshot(self) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+        """
+        :return: Consistent datetime64 times, amounts, native amounts and holdings arrays, ordered from oldest to newest
+        """
+        with self.__state_lock:
+            return self.times, self.amounts, self.native_amounts, self.holdings
+
+    def get_holdings_series(self, until: np.datetime64 = None) -> (np.ndarray, np.ndarray):
+        """
+        Gets the amount held over time as a step series, with a point before and after every transaction
+
+        :param until: Time of the last point of the series, now if None
+        :return: datetime64 times and float64 amounts held respectively
+        """
+        until = np.datetime64("now", "s") if until is None else until
+        times, amounts, native_amounts, holdings = self.snapshot()
+
+        held_times = np.append(np.repeat(times, 2), until)
+        held_amounts = np.empty(len(held_times))
+        held_amounts[1:-1:2] = holdings
+        held_amounts[2:-1:2] = holdings[:-1]
+        held_amounts[0] = 0.
+        held_amounts[-1] = holdings[-1] if len(holdings) else 0.
+
+        return held_times, held_amounts
+
+    def get_transactions(self) -> [(float, str)]:
+        """
+        :return: A list of coin_amount, timestamp tuples, the most recent transaction first
+        """
+        times, amounts, native_amounts, holdings = self.snapshot()
+        timestamps = np.datetime_as_string(times[::-1], unit="s", timezone="UTC").tolist()
+        return list(zip(amounts[::-1].tolist(), timestamps))
+
+    def __len__(self) -> int:
+        return len(self.times)
@@ -0,0 +1,87 @@
+import utils.coinbase_utils.GlobalStatics as statics
+import colorsys
+import logging
+import json
+import zlib
+
+logger = logging.getLogger(__name__)
+
+GOLDEN_RATIO = (5 ** 0.5 - 1) / 2
+
+
+def generate_color(coin: str) -> str:
+    """
+    Generates the color of a coin from its code, such that a coin keeps its color when the watchlist changes. Hues are
+    spread with the golden ratio, which keeps the colors of coins apart even for hundreds of coins.
+
+    :param coin: The coin (BTC, XLM, etc.)
+    :return: Hex color string (#rrggbb), bright enough for the dark background of the graphs
+    """
+    code = zlib.crc32(coin.upper().encode())
+    hue = (code * GOLDEN_RATIO) % 1
+    saturation = 0.55 + 0.35 * ((code >> 8) % 5) / 4
+    red, green, blue = colorsys.hsv_to_rgb(hue, saturation, 0.95)
+    return "#{:02x}{:02x}{:02x}".format(int(red * 255), int(green * 255), int(blue * 255))
+
+
+class Watchlist:
+    """
+    This class is intended to hold the coins which are tracked by the bot (alerts, subscriptions, graphs and price
+    streams) along with their colors. Coins are either listed in a JSON config file or loaded from the coins listed on
+    coinbase, colors are taken from the config, from GlobalStatics.COLORS or generated from the coin code.
+
+    Use this class to track any number of coins, the graphs only show the first graph_size coins (or those listed under
+    "graph_coins" in the config) such that they stay readable and quick to render.
+    """
+
+    def __init__(self, coins: list = statics.CURRENCIES, colors: dict = None, graph_coins: list = None,
+                 graph_size: int = statics.GRAPH_SIZE):
+        """
+        :param coins: Coins which are tracked (BTC, XLM, etc.), duplicates are dropped
+        :param colors: Dictionary of coin, color pairs overriding the default colors
+        :param graph_coins: Coins shown on the graphs, the first graph_size coins if None
+        :param graph_size: Number of coins shown on the graphs if graph_coins isn't given
+        """
+        self.coins = list(dict.fromkeys(coin.upper() for coin in coins))
+        self.__coin_set = set(self.coins)
+
+        self.colors = {coin: statics.COLORS.get(coin) or generate_color(coin) for coin in self.coins}
+        self.colors.update({coin.upper(): color for coin, color in (colors or {}).items()})
+
+        if graph_coins is None:
+            graph_coins = self.coins[:graph_size]
+        self.graph_coins = [coin.upper() for coin in graph_coins if coin.upper() in self.__coin_set]
+
+    @classmethod
+    def load(cls, file_name: str, coinbase_api=None, quote_currency: str = statics.QUOTE_CURRENCY) -> "Watchlist":
+        """
+        Loads a watchlist from a JSON config file of the form
+
+            {"coins": ["BTC", "ETH", ...], "colors": {"BTC": "orange", ...}, "graph_coins": ["BTC", ...],
+             "max_coins": 500}
+
+        where all keys are optional. Without "coins", all coins listed on coinbase are tracked (up to "max_coins").
+
+        :param file_name: The JSON config file
+        :param coinbase_api: CoinbaseAPI object used to list the coins on coinbase, only needed without "coins"
+        :param quote_currency: Currency which the listed coins have to be quoted in
+        :return: The watchlist
+        """
+        with open(file_name) as file:
+            config = json.load(file)
+
+        coins = config.get("coins")
+        if coins is None:
+            if coinbase_api is None:
+                raise ValueError("Watchlist config {} lists no coins and no CoinbaseAPI was given".format(file_name))
+            coins = coinbase_api.get_listed_coins(quote_currency)
+        coins = coins[:config.get("max_coins", len(coins))]
+
+        logger.info("Watching %d coins", len(coins))
+        return cls(coins, colors=config.get("colors"), graph_coins=config.get("graph_coins"))
+
+    def __len__(self) -> int:
+        return len(self.coins)
+
+    def __contains__(self, coin: str) -> bool:
+        return coin.upper() in self.__coin_set
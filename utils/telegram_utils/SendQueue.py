@@ -0,0 +1,123 @@
+from utils.coinbase_utils.RequestScheduler import TokenBucket
+from telegram.error import RetryAfter, Unauthorized, TelegramError
+from collections import deque
+import threading
+import logging
+import heapq
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueue:
+    """
+    This class is intended to send messages to many chats without exceeding Telegram's limits (about one message per
+    second per chat and 30 messages per second overall). Messages are queued per chat and sent by a single background
+    thread, chats take turns such that a long backlog for one chat doesn't delay the others.
+
+    Use this class to fan out messages (e.g. spike alerts) to subscribers, put never blocks the caller.
+    """
+
+    def __init__(self, bot, max_size: int = 1000, global_rate: float = 25., chat_interval: float = 1.):
+        """
+        :param bot: The telegram.Bot used to send the messages
+        :param max_size: Maximum number of queued messages, further messages are dropped
+        :param global_rate: Maximum number of messages sent per second over all chats
+        :param chat_interval: Minimum time (in seconds) between two messages to the same chat
+        """
+        self.bot = bot
+        self.max_size = max_size
+        self.chat_interval = chat_interval
+        self.bucket = TokenBucket(global_rate, global_rate)
+
+        self.__messages = {}  # chat id -> deque of (text, send_message keyword arguments)
+        self.__ready = []  # heap of (time at which the chat may be sent to, sequence, chat id)
+        self.__next_send = {}  # chat id -> time at which the chat may be sent to next
+        self.__size = 0
+        self.__sequence = 0
+        self.__condition = threading.Condition()
+
+        self.stats = {"sent": 0, "dropped": 0, "failed": 0}
+
+        threading.Thread(target=self.__work, daemon=True, name="send-queue").start()
+
+    def put(self, chat_id: int, text: str, **kwargs) -> bool:
+        """
+        Queues a message
+
+        :param chat_id: The chat the message is sent to
+        :param text: The message
+        :param kwargs: Further arguments of telegram.Bot.send_message (parse_mode, etc.)
+        :return: False if the queue is full and the message was dropped
+        """
+        with self.__condition:
+            if self.__size >= self.max_size:
+                self.stats["dropped"] += 1
+                logger.warning("Send queue is full, dropping message to %s", chat_id)
+                return False
+
+            messages = self.__messages.get(chat_id)
+            if messages is None:
+                messages = self.__messages[chat_id] = deque()
+                self.__schedule(chat_id)
+            messages.append((text, kwargs))
+            self.__size += 1
+
+            self.__condition.notify()
+            return True
+
+    def __schedule(self, chat_id: int) -> None:
+        """
+        Adds a chat with queued messages to the ready heap, must be called with the condition held
+        """
+        self.__sequence += 1
+        ready_time = max(time.monotonic(), self.__next_send.get(chat_id, 0.))
+        heapq.heappush(self.__ready, (ready_time, self.__sequence, chat_id))
+
+    def __work(self) -> None:
+        """
+        Worker loop, sends the next message of the chat which has been ready the longest
+        """
+        while True:
+            with self.__condition:
+                while not self.__ready or self.__ready[0][0] > time.monotonic():
+                    self.__condition.wait(self.__ready[0][0] - time.monotonic() if self.__ready else None)
+
+                ready_time, sequence, chat_id = heapq.heappop(self.__ready)
+                messages = self.__messages[chat_id]
+                text, kwargs = messages.popleft()
+                self.__size -= 1
+
+            self.bucket.acquire()
+            retry_after = self.__send(chat_id, text, kwargs)
+
+            with self.__condition:
+                self.__next_send[chat_id] = time.monotonic() + max(self.chat_interval, retry_after or 0.)
+                if retry_after is not None:
+                    messages.appendleft((text, kwargs))
+                    self.__size += 1
+
+                if messages:
+                    self.__schedule(chat_id)
+                else:
+                    del self.__messages[chat_id]
+
+    def __send(self, chat_id: int, text: str, kwargs: dict) -> float:
+        """
+        Sends a single message
+
+        :return: Time (in seconds) to wait before the message is sent again if Telegram asked to slow down, else None
+        """
+        try:
+            self.bot.send_message(chat_id, text, **kwargs)
+            self.stats["sent"] += 1
+        except RetryAfter as exception:
+            logger.warning("Telegram asked to retry sending to %s after %ss", chat_id, exception.retry_after)
+            return float(exception.retry_after)
+        except Unauthorized:
+            logger.warning("Chat %s blocked the bot, dropping message", chat_id)
+            self.stats["failed"] += 1
+        except TelegramError as exception:
+            logger.warning("Failed to send message to %s: %s", chat_id, exception)
+            self.stats["failed"] += 1
+        return None
@@ -0,0 +1,230 @@
+from utils.coinbase_utils.PriceChangeTracker import get_alert_mask
+import numpy as np
+import threading
+import os
+
+PERIODS = ["day", "week"]
+
+
+class Subscription:
+    """
+    This class holds what a chat subscribed to: the coins it wants alerts for (or all coins, including those tracked
+    later on) and the minimum changes (in %) which are worth an alert.
+    """
+
+    def __init__(self, chat_id: int, coins: list, notification_threshold: float, day_threshold: float,
+                 week_threshold: float):
+        """
+        :param chat_id: The Telegram chat the alerts are sent to
+        :param coins: Coins for which alerts are sent (BTC, XLM, etc.), all coins which are tracked if None
+        :param notification_threshold: Amount in (%) needed for another notification to be sent for a coin
+        :param day_threshold: Minimum (%) change over an entire day needed to trigger a notification
+        :param week_threshold: Minimum (%) change over a week needed to trigger a notification
+        """
+        self.chat_id = chat_id
+        self.coins = None if coins is None else [coin.upper() for coin in coins]
+        self.notification_threshold = notification_threshold
+        self.day_threshold = day_threshold
+        self.week_threshold = week_threshold
+
+    def get_threshold(self, period: str) -> float:
+        """
+        :param period: The period ("day" or "week")
+        :return: The minimum (%) change over the period needed to trigger a notification
+        """
+        return self.week_threshold if period == "week" else self.day_threshold
+
+
+class SubscriptionRegistry:
+    """
+    This class is intended to keep track of the chats which receive spike alerts along with the alert state of every
+    chat, such that alerts are computed once per cycle and every subscriber is notified according to its own
+    thresholds and previous notifications.
+
+    The state is held in NumPy arrays with one row per chat and one column per coin (thresholds, subscribed coins and
+    the last notified change of every period), so that the thresholds of all chats are evaluated in a single vectorized
+    pass. The state can be saved to disk, such that alerts aren't sent again after a restart.
+
+    Use this class to (un)subscribe chats and to evaluate percentage changes, all methods are thread-safe.
+    """
+
+    def __init__(self, coins: list, file_name: str = None):
+        """
+        :param coins: Coins which can be subscribed to (BTC, XLM, etc.)
+        :param file_name: Path of the .npz file the state is saved to, loaded if it exists
+        """
+        self.coins = [coin.upper() for coin in coins]
+        self.file_name = file_name
+
+        self.__coin_indices = {coin: index for index, coin in enumerate(self.coins)}
+        self.__chat_ids = np.empty(0, dtype=np.int64)
+        self.__thresholds = np.empty((0, 3))  # notification, day and week threshold of every chat
+        self.__coin_masks = np.empty((0, len(self.coins)), dtype=bool)  # coins every chat subscribed to
+        self.__all_coins = np.empty(0, dtype=bool)  # chats subscribed to all coins, whatever coins are tracked
+        self.__notified = {period: np.empty((0, len(self.coins))) for period in PERIODS}  # last notified changes
+        self.__lock = threading.RLock()
+
+        if self.file_name is not None and os.path.exists(self.file_name):
+            self.load()
+
+    def __find(self, chat_id: int) -> int:
+        """
+        :return: The row of a chat, None if it isn't subscribed
+        """
+        rows = np.flatnonzero(self.__chat_ids == chat_id)
+        return int(rows[0]) if len(rows) else None
+
+    def __coin_mask(self, coins: list) -> np.ndarray:
+        mask = np.zeros(len(self.coins), dtype=bool)
+        mask[[self.__coin_indices[coin.upper()] for coin in coins if coin.upper() in self.__coin_indices]] = True
+        return mask
+
+    def subscribe(self, subscription: Subscription) -> bool:
+        """
+        Adds a subscription, replacing the coins and thresholds of the chat if it is already subscribed. The previous
+        notifications of an existing subscription are kept.
+
+        :param subscription: The subscription
+        :return: True if the chat wasn't subscribed before
+        """
+        thresholds = [subscription.notification_threshold, subscription.day_threshold, subscription.week_threshold]
+        all_coins = subscription.coins is None
+        coin_mask = np.ones(len(self.coins), dtype=bool) if all_coins else self.__coin_mask(subscription.coins)
+
+        with self.__lock:
+            row = self.__find(subscription.chat_id)
+            if row is not None:
+                self.__thresholds[row] = thresholds
+                self.__coin_masks[row] = coin_mask
+                self.__all_coins[row] = all_coins
+                return False
+
+            self.__chat_ids = np.append(self.__chat_ids, subscription.chat_id)
+            self.__thresholds = np.vstack([self.__thresholds, thresholds])
+            self.__coin_masks = np.vstack([self.__coin_masks, coin_mask])
+            self.__all_coins = np.append(self.__all_coins, all_coins)
+            for period in PERIODS:
+                self.__notified[period] = np.vstack([self.__notified[period], np.zeros(len(self.coins))])
+            return True
+
+    def unsubscribe(self, chat_id: int) -> bool:
+        """
+        Removes the subscription and alert state of a chat
+
+        :param chat_id: The chat
+        :return: True if the chat was subscribed
+        """
+        with self.__lock:
+            row = self.__find(chat_id)
+            if row is None:
+                return False
+
+            self.__chat_ids = np.delete(self.__chat_ids, row)
+            self.__thresholds = np.delete(self.__thresholds, row, axis=0)
+            self.__coin_masks = np.delete(self.__coin_masks, row, axis=0)
+            self.__all_coins = np.delete(self.__all_coins, row)
+            for period in PERIODS:
+                self.__notified[period] = np.delete(self.__notified[period], row, axis=0)
+            return True
+
+    def get(self, chat_id: int) -> Subscription:
+        """
+        :param chat_id: The chat
+        :return: The subscription of the chat, None if it isn't subscribed
+        """
+        with self.__lock:
+            row = self.__find(chat_id)
+            if row is None:
+                return None
+
+            coins = None if self.__all_coins[row] else [self.coins[index]
+                                                        for index in np.flatnonzero(self.__coin_masks[row])]
+            return Subscription(chat_id, coins, *self.__thresholds[row].tolist())
+
+    def get_subscriptions(self) -> [Subscription]:
+        """
+        :return: A snapshot of all subscriptions
+        """
+        with self.__lock:
+            return [self.get(chat_id) for chat_id in self.__chat_ids.tolist()]
+
+    def evaluate(self, period: str, coins: list, percentage_changes: np.ndarray, ignore_previous: bool = False) -> dict:
+        """
+        Determines which coins every chat is notified about and records the notified changes. A coin is notified when
+        its change crosses the period threshold of the chat and (unless ignore_previous is set) has moved by more than
+        the notification threshold of the chat since it was last notified.
+
+        :param period: The period of the percentage changes ("day" or "week")
+        :param coins: The coins whose percentage changes are given
+        :param percentage_changes: Array containing the percentage change of each coin over the period
+        :param ignore_previous: Flag that denotes that alerts should be sent regardless of previous notifications
+        :return: Dictionary mapping chat ids to lists of (coin, percentage change) tuples sorted by decreasing change
+        """
+        changes = np.full(len(self.coins), np.nan)
+        known = [index for index, coin in enumerate(coins) if coin in self.__coin_indices]
+        changes[[self.__coin_indices[coins[index]] for index in known]] = np.asarray(percentage_changes)[known]
+
+        with self.__lock:
+            notified = self.__notified[period]
+            threshold = self.__thresholds[:, PERIODS.index(period) + 1, np.newaxis]
+            notification_threshold = self.__thresholds[:, 0, np.newaxis]
+
+            # (chats x coins) mask, coins without a change (NaN) are never alerted
+            alerts = get_alert_mask(changes, notified, threshold, notification_threshold, ignore_previous)
+            alerts &= self.__coin_masks | self.__all_coins[:, np.newaxis]
+
+            rows, columns = np.nonzero(alerts)
+            notified[rows, columns] = changes[columns]
+
+            # Sort by chat, then by decreasing change
+            order = np.lexsort((-changes[columns], rows))
+            result = {}
+            for row, column in zip(rows[order].tolist(), columns[order].tolist()):
+                result.setdefault(int(self.__chat_ids[row]), []).append((self.coins[column], float(changes[column])))
+            return result
+
+    def save(self) -> None:
+        """
+        Saves the subscriptions and alert state to file_name, the file is replaced atomically
+        """
+        if self.file_name is None:
+            return
+
+        directory = os.path.dirname(self.file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self.__lock:
+            temporary_file_name = self.file_name + ".tmp"
+            with open(temporary_file_name, "wb") as file:
+                np.savez(file, coins=np.array(self.coins), chat_ids=self.__chat_ids, thresholds=self.__thresholds,
+                         coin_masks=self.__coin_masks, all_coins=self.__all_coins,
+                         **{"notified_" + period: self.__notified[period] for period in PERIODS})
+            os.replace(temporary_file_name, self.file_name)
+
+    def load(self) -> None:
+        """
+        Loads the subscriptions and alert state from file_name. Coins which were saved but are no longer known are
+        dropped. New coins start out without previous notifications, they are only subscribed to by the chats which
+        subscribed to all coins.
+        """
+        with np.load(self.file_name) as state:
+            saved_columns = [index for index, coin in enumerate(state["coins"].tolist()) if coin in self.__coin_indices]
+            columns = [self.__coin_indices[state["coins"][index]] for index in saved_columns]
+
+            with self.__lock:
+                self.__chat_ids = state["chat_ids"]
+                self.__thresholds = state["thresholds"]
+
+                self.__coin_masks = np.zeros((len(self.__chat_ids), len(self.coins)), dtype=bool)
+                self.__coin_masks[:, columns] = state["coin_masks"][:, saved_columns]
+
+                self.__all_coins = state["all_coins"]
+                self.__coin_masks[self.__all_coins] = True
+                for period in PERIODS:
+                    self.__notified[period] = np.zeros((len(self.__chat_ids), len(self.coins)))
+                    self.__notified[period][:, columns] = state["notified_" + period][:, saved_columns]
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__chat_ids)